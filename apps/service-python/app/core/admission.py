@@ -0,0 +1,159 @@
+"""Admission control for upstream chat generations
+
+Every chat that needs a fresh generation holds one of CHAT_MAX_CONCURRENT
+slots while it streams. When all slots are busy, requests wait in a queue
+that is fair between clients: waiters are grouped per IP, and each freed
+slot goes to the next IP in round-robin order, so one client sending a
+burst cannot starve everyone else. A request that cannot get a slot
+within CHAT_QUEUE_TIMEOUT seconds, or finds CHAT_MAX_QUEUE requests
+already waiting, is rejected at once (the route answers 503) instead of
+piling onto an overloaded upstream.
+"""
+
+import asyncio
+import os
+import time
+from collections import OrderedDict, deque
+from typing import Any, Deque, Dict, Optional
+
+CHAT_MAX_CONCURRENT = int(os.getenv("CHAT_MAX_CONCURRENT", "32"))  # 0 disables admission control
+CHAT_QUEUE_TIMEOUT = float(os.getenv("CHAT_QUEUE_TIMEOUT", "5"))
+CHAT_MAX_QUEUE = int(os.getenv("CHAT_MAX_QUEUE", "256"))
+
+# Recent queue waits kept for the percentiles in status()
+WAIT_SAMPLES = 1000
+
+
+class AdmissionRejected(Exception):
+    """No slot within the queue limits; `retry_after` is a hint in seconds"""
+
+    def __init__(self, reason: str, retry_after: int = 1):
+        super().__init__(reason)
+        self.retry_after = retry_after
+
+
+class Ticket:
+    """A granted slot; the holder must release it (further releases do nothing)"""
+
+    def __init__(self, controller: Optional["AdmissionController"], wait: float = 0.0):
+        self._controller = controller
+        self.wait = wait
+
+    def release(self):
+        if self._controller is not None:
+            controller, self._controller = self._controller, None
+            controller._release()
+
+    def __del__(self):
+        # Not released here: freeing slots at collection time would hide the leak
+        if self._controller is not None:
+            print("Warning: admission ticket collected without being released; its slot is lost")
+
+
+class AdmissionController:
+    """Global concurrency cap with per-IP round-robin queuing"""
+
+    def __init__(self, max_concurrent: int = CHAT_MAX_CONCURRENT,
+                 queue_timeout: float = CHAT_QUEUE_TIMEOUT, max_queue: int = CHAT_MAX_QUEUE):
+        self.max_concurrent = max_concurrent
+        self.queue_timeout = queue_timeout
+        self.max_queue = max_queue
+        self.active = 0
+        self.queued = 0
+        self._queues: "OrderedDict[str, Deque[asyncio.Future]]" = OrderedDict()
+        self._waits: Deque[float] = deque(maxlen=WAIT_SAMPLES)
+        self.admitted = 0
+        self.rejected = 0
+        self.peak_queued = 0
+
+    async def acquire(self, client: str) -> Ticket:
+        """Wait for a slot for `client`
+
+        Raises:
+            AdmissionRejected: The queue is full or the wait exceeded queue_timeout
+        """
+        if self.max_concurrent <= 0:
+            return Ticket(None)
+
+        if self.active < self.max_concurrent and not self.queued:
+            self.active += 1
+            self.admitted += 1
+            self._waits.append(0.0)
+            return Ticket(self)
+
+        if self.queued >= self.max_queue:
+            self.rejected += 1
+            raise AdmissionRejected("Chat queue is full", retry_after=max(1, round(self.queue_timeout)))
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._queues.setdefault(client, deque()).append(waiter)
+        self.queued += 1
+        self.peak_queued = max(self.peak_queued, self.queued)
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), self.queue_timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if waiter.done() and not waiter.cancelled():
+                # Granted just as the wait ended: hand the slot on
+                self._release()
+            else:
+                waiter.cancel()
+                self._forget(client, waiter)
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            self.rejected += 1
+            raise AdmissionRejected("Timed out waiting for a chat slot",
+                                    retry_after=max(1, round(self.queue_timeout)))
+
+        wait = time.perf_counter() - started
+        self._waits.append(wait)
+        self.admitted += 1
+        return Ticket(self, wait)
+
+    def _forget(self, client: str, waiter: asyncio.Future):
+        queue = self._queues.get(client)
+        if queue is not None and waiter in queue:
+            queue.remove(waiter)
+            self.queued -= 1
+            if not queue:
+                del self._queues[client]
+
+    def _release(self):
+        """Free a slot, handing it to the next client in round-robin order"""
+        while self._queues:
+            client, queue = next(iter(self._queues.items()))
+            waiter = queue.popleft()
+            self.queued -= 1
+            if queue:
+                self._queues.move_to_end(client)  # This client's next waiter goes to the back
+            else:
+                del self._queues[client]
+            if not waiter.done():
+                waiter.set_result(None)  # The slot passes on; `active` is unchanged
+                return
+        self.active -= 1
+
+    def status(self) -> Dict[str, Any]:
+        """Slots, queue depth and wait percentiles for /health"""
+        waits = sorted(self._waits)
+
+        def percentile(p: float) -> float:
+            if not waits:
+                return 0.0
+            return round(waits[min(len(waits) - 1, int(p * len(waits)))] * 1000, 1)
+
+        return {
+            'max_concurrent': self.max_concurrent,
+            'active': self.active,
+            'queued': self.queued,
+            'queued_clients': len(self._queues),
+            'peak_queued': self.peak_queued,
+            'admitted': self.admitted,
+            'rejected': self.rejected,
+            'wait_p50_ms': percentile(0.5),
+            'wait_p95_ms': percentile(0.95),
+        }
+
+
+# Global admission controller for /ai/chat
+admission = AdmissionController()
@@ -1,8 +1,78 @@
+import asyncio
+import os
+from collections import defaultdict
 from datetime import datetime
-from typing import Tuple
+from typing import Any, Dict, Optional, Tuple
 
 from .kv import kv
 
+ANALYTICS_FLUSH_INTERVAL = float(os.getenv("ANALYTICS_FLUSH_INTERVAL", "2"))
+
+
+class CounterPipeline:
+    """KV counters written in the background instead of on the request path
+
+    `add` only bumps an in-memory total. A background task started on
+    demand writes the totals every `interval` seconds, one INCRBY per key
+    however many requests contributed, and exits once nothing is pending.
+    `close` writes whatever is left at shutdown.
+    """
+
+    def __init__(self, interval: float = ANALYTICS_FLUSH_INTERVAL):
+        self.interval = interval
+        self._pending: Dict[str, int] = defaultdict(int)
+        self._task: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self.recorded = 0
+        self.writes = 0
+
+    def add(self, key: str, amount: int = 1):
+        self._pending[key] += amount
+        self.recorded += 1
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return  # No loop (sync caller): written by the next flush
+        if self._task is None or self._task.done() or self._loop is not loop:
+            self._loop = loop
+            self._task = loop.create_task(self._run())
+
+    async def _run(self):
+        while self._pending:
+            await asyncio.sleep(self.interval)
+            await self.flush()
+
+    async def flush(self):
+        """Write pending totals now"""
+        pending, self._pending = self._pending, defaultdict(int)
+        if not pending:
+            return
+        try:
+            await asyncio.gather(*(kv.incr(key, amount) for key, amount in pending.items()))
+        except asyncio.CancelledError:
+            # Interrupted (shutdown): keep the totals for the final flush
+            for key, amount in pending.items():
+                self._pending[key] += amount
+            raise
+        self.writes += len(pending)
+        print(f"Analytics: wrote {len(pending)} counter(s): "
+              + ", ".join(f"{key} +{amount}" for key, amount in pending.items()))
+
+    async def close(self):
+        """Stop the writer and flush what is pending"""
+        task, self._task = self._task, None
+        if task is not None and not task.done() and self._loop is asyncio.get_running_loop():
+            task.cancel()
+            await asyncio.wait((task,))
+        await self.flush()
+
+    def status(self) -> Dict[str, Any]:
+        return {'pending_keys': len(self._pending), 'recorded': self.recorded, 'writes': self.writes}
+
+
+# Global background writer for chat counters
+counters = CounterPipeline()
+
 
 async def log_page_view(slug: str) -> None:
     """Log a page view for a specific slug"""
@@ -80,6 +150,15 @@ async def log_chat_tokens(token_count: int) -> None:
     await kv.incr(key, token_count)
     print(f"Analytics: {token_count} tokens logged for {today}")
 
+def record_chat_session() -> None:
+    """Count a chat session for today without waiting on KV"""
+    counters.add(f"analytics:chat:sessions:{datetime.now().strftime('%Y-%m-%d')}")
+
+def record_chat_tokens(token_count: int) -> None:
+    """Count chat tokens for today without waiting on KV"""
+    if token_count > 0:
+        counters.add(f"analytics:chat:tokens:{datetime.now().strftime('%Y-%m-%d')}", token_count)
+
 async def get_chat_stats(days: int = 7) -> dict:
     """Get chat statistics for the last N days"""
     stats = {
@@ -0,0 +1,188 @@
+"""Pure-numpy IVF approximate nearest-neighbour index over dense embeddings"""
+
+import math
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+DEFAULT_NPROBE = 8
+
+
+def quantize_int8(vectors: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Symmetric per-row int8 quantization
+
+    Returns:
+        Tuple of (int8 codes, float32 per-row scales)
+    """
+    scales = np.abs(vectors).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    codes = np.round(vectors / scales[:, None]).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+
+def kmeans(vectors: np.ndarray, nlist: int, iterations: int = 20, seed: int = 0) -> np.ndarray:
+    """Spherical k-means (cosine) returning unit-length centroids"""
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), size=nlist, replace=False)].astype(np.float32)
+
+    for _ in range(iterations):
+        assignments = np.argmax(vectors @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, vectors)
+
+        # Re-seed empty clusters from random vectors
+        empty = np.bincount(assignments, minlength=nlist) == 0
+        sums[empty] = vectors[rng.integers(len(vectors), size=int(empty.sum()))]
+
+        centroids = sums
+        norms = np.linalg.norm(centroids, axis=1, keepdims=True)
+        centroids /= np.where(norms == 0, 1.0, norms)
+
+    return centroids
+
+
+class IVFIndex:
+    """Inverted-file index: vectors bucketed by nearest centroid
+
+    A query scores the centroids, then only the vectors in the `nprobe`
+    closest buckets. nprobe trades recall for latency; nprobe == nlist is
+    exact search. Vectors may be float32 or int8 codes with per-row scales.
+
+    A filtered query (`candidates`) that matches no more vectors than
+    nprobe buckets hold on average scores the matches exactly; otherwise
+    it probes further buckets until k matches are found.
+    """
+
+    def __init__(self, vectors: np.ndarray, centroids: np.ndarray, list_offsets: np.ndarray,
+                 list_ids: np.ndarray, scales: Optional[np.ndarray] = None,
+                 nprobe: int = DEFAULT_NPROBE):
+        self.vectors = vectors
+        self.scales = scales
+        self.centroids = centroids.astype(np.float32)
+        self.list_offsets = list_offsets
+        self.list_ids = list_ids
+        self.nprobe = nprobe
+
+    @property
+    def nlist(self) -> int:
+        return len(self.centroids)
+
+    @classmethod
+    def build(cls, embeddings: np.ndarray, nlist: Optional[int] = None, quantize: bool = False,
+              seed: int = 0) -> "IVFIndex":
+        """Cluster unit-length float embeddings into an IVF index"""
+        embeddings = embeddings.astype(np.float32)
+        if nlist is None:
+            nlist = max(1, int(math.sqrt(len(embeddings))))
+        nlist = min(nlist, len(embeddings))
+
+        centroids = kmeans(embeddings, nlist, seed=seed)
+        assignments = np.argmax(embeddings @ centroids.T, axis=1)
+        list_ids = np.argsort(assignments, kind='stable').astype(np.int32)
+        list_offsets = np.searchsorted(assignments[list_ids], np.arange(nlist + 1)).astype(np.int64)
+
+        if quantize:
+            codes, scales = quantize_int8(embeddings)
+            return cls(codes, centroids, list_offsets, list_ids, scales=scales)
+        return cls(embeddings, centroids, list_offsets, list_ids)
+
+    def to_arrays(self) -> Dict[str, np.ndarray]:
+        """Arrays needed to reconstruct the index"""
+        arrays = {
+            'embeddings': self.vectors,
+            'centroids': self.centroids,
+            'list_offsets': self.list_offsets,
+            'list_ids': self.list_ids,
+        }
+        if self.scales is not None:
+            arrays['scales'] = self.scales
+        return arrays
+
+    @classmethod
+    def from_arrays(cls, arrays, nprobe: int = DEFAULT_NPROBE) -> "IVFIndex":
+        return cls(arrays['embeddings'], arrays['centroids'], arrays['list_offsets'],
+                   arrays['list_ids'], scales=arrays.get('scales'), nprobe=nprobe)
+
+    def _score(self, ids: np.ndarray, query: np.ndarray) -> np.ndarray:
+        scores = self.vectors[ids].astype(np.float32) @ query
+        if self.scales is not None:
+            scores *= self.scales[ids]
+        return scores
+
+    def search(self, query: np.ndarray, k: int, nprobe: Optional[int] = None,
+               candidates: Optional[np.ndarray] = None) -> List[Tuple[int, float]]:
+        """Approximate top-k by inner product (cosine for unit vectors)
+
+        Args:
+            query: Unit-length query embedding
+            k: Number of results to return
+            nprobe: Buckets to scan (defaults to the index setting)
+            candidates: Optional boolean mask applied before scoring
+
+        Returns:
+            List of (vector_id, score) sorted by descending score
+        """
+        nprobe = min(nprobe or self.nprobe, self.nlist)
+        query = query.astype(np.float32)
+
+        if candidates is not None:
+            matches = np.flatnonzero(candidates)
+            if len(matches) <= nprobe * len(self.list_ids) / self.nlist:
+                # Scoring every match costs no more than probing, and misses none
+                return self._top(matches, query, k)
+
+        centroid_scores = self.centroids @ query
+        if candidates is not None:
+            ids = self._probe_filtered(centroid_scores, candidates, k, nprobe)
+        else:
+            if nprobe < self.nlist:
+                probe = np.argpartition(-centroid_scores, nprobe - 1)[:nprobe]
+            else:
+                probe = np.arange(self.nlist)
+            ids = np.concatenate([self._list(c) for c in probe])
+        return self._top(ids, query, k)
+
+    def _list(self, centroid: int) -> np.ndarray:
+        return self.list_ids[self.list_offsets[centroid]:self.list_offsets[centroid + 1]]
+
+    def _probe_filtered(self, centroid_scores: np.ndarray, candidates: np.ndarray,
+                        k: int, nprobe: int) -> np.ndarray:
+        """Matching ids from the closest buckets: at least `nprobe` of them, more until k match"""
+        parts = []
+        found = 0
+        for rank, centroid in enumerate(np.argsort(-centroid_scores, kind='stable')):
+            ids = self._list(centroid)
+            ids = ids[candidates[ids]]
+            parts.append(ids)
+            found += len(ids)
+            if rank + 1 >= nprobe and found >= k:
+                break
+        return np.concatenate(parts)
+
+    def _top(self, ids: np.ndarray, query: np.ndarray, k: int) -> List[Tuple[int, float]]:
+        if len(ids) == 0:
+            return []
+
+        scores = self._score(ids, query)
+        if k < len(ids):
+            top = np.argpartition(-scores, k - 1)[:k]
+        else:
+            top = np.arange(len(ids))
+        top = top[np.argsort(-scores[top], kind='stable')]
+        return [(int(ids[i]), float(scores[i])) for i in top]
+
+    def search_exact(self, query: np.ndarray, k: int) -> List[Tuple[int, float]]:
+        """Brute-force top-k over every vector (ground truth for recall)"""
+        return self.search(query, k, nprobe=self.nlist)
+
+
+def recall_at_k(index: IVFIndex, queries: np.ndarray, k: int, nprobe: Optional[int] = None) -> float:
+    """Mean fraction of the exact top-k found by the approximate search"""
+    if len(queries) == 0:
+        return 1.0
+    total = 0.0
+    for query in queries:
+        exact = {i for i, _ in index.search_exact(query, k)}
+        approx = {i for i, _ in index.search(query, k, nprobe=nprobe)}
+        total += len(exact & approx) / max(len(exact), 1)
+    return total / len(queries)
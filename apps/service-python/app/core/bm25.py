@@ -0,0 +1,284 @@
+"""BM25 inverted index with compressed postings and WAND top-k retrieval"""
+
+import base64
+import heapq
+import math
+import re
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from sklearn.feature_extraction.text import ENGLISH_STOP_WORDS
+
+TOKEN_PATTERN = re.compile(r"(?u)\b\w\w+\b")
+
+DEFAULT_K1 = 1.2
+DEFAULT_B = 0.75
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word tokens with English stop words removed
+
+    Mirrors the TF-IDF vectorizer's token pattern so both engines see the
+    same vocabulary.
+    """
+    return [tok for tok in TOKEN_PATTERN.findall(text.lower()) if tok not in ENGLISH_STOP_WORDS]
+
+
+def encode_postings(doc_ids: Iterable[int], tfs: Iterable[int]) -> str:
+    """Encode a postings list as base64 varints of (doc id gap, term frequency)"""
+    out = bytearray()
+    previous = 0
+    for doc_id, tf in zip(doc_ids, tfs):
+        for value in (doc_id - previous, tf):
+            while value >= 0x80:
+                out.append((value & 0x7F) | 0x80)
+                value >>= 7
+            out.append(value)
+        previous = doc_id
+    return base64.b64encode(bytes(out)).decode('ascii')
+
+
+def decode_postings(encoded: str) -> Tuple[np.ndarray, np.ndarray]:
+    """Decode a postings list produced by `encode_postings`
+
+    Returns:
+        Tuple of (doc_ids, term_frequencies) arrays
+    """
+    raw = base64.b64decode(encoded)
+    values = []
+    value = 0
+    shift = 0
+    for byte in raw:
+        value |= (byte & 0x7F) << shift
+        if byte & 0x80:
+            shift += 7
+        else:
+            values.append(value)
+            value = 0
+            shift = 0
+
+    pairs = np.array(values, dtype=np.int64).reshape(-1, 2)
+    return np.cumsum(pairs[:, 0]).astype(np.int32), pairs[:, 1].astype(np.int32)
+
+
+def build_bm25_index(texts: List[str], k1: float = DEFAULT_K1, b: float = DEFAULT_B) -> Dict[str, Any]:
+    """Build a serializable BM25 index from document texts
+
+    Each term stores its document frequency, the upper bound of its score
+    contribution (used by WAND) and its compressed postings list.
+    """
+    doc_lengths = []
+    postings: Dict[str, List[Tuple[int, int]]] = {}
+
+    for doc_id, text in enumerate(texts):
+        tokens = tokenize(text)
+        doc_lengths.append(len(tokens))
+
+        counts: Dict[str, int] = {}
+        for tok in tokens:
+            counts[tok] = counts.get(tok, 0) + 1
+        for term, tf in counts.items():
+            postings.setdefault(term, []).append((doc_id, tf))
+
+    num_docs = len(texts)
+    avgdl = (sum(doc_lengths) / num_docs) if num_docs else 0.0
+    lengths = np.array(doc_lengths, dtype=np.float64)
+
+    terms = {}
+    for term in sorted(postings):
+        entries = postings[term]
+        doc_ids = [doc_id for doc_id, _ in entries]
+        tfs = [tf for _, tf in entries]
+        impacts = _impacts(np.array(tfs, dtype=np.float64), lengths[doc_ids], len(entries), num_docs, avgdl, k1, b)
+        terms[term] = {
+            'df': len(entries),
+            'max_score': float(impacts.max()),
+            'postings': encode_postings(doc_ids, tfs),
+        }
+
+    return {
+        'k1': k1,
+        'b': b,
+        'num_docs': num_docs,
+        'avgdl': avgdl,
+        'doc_lengths': doc_lengths,
+        'terms': terms,
+    }
+
+
+def _idf(df: int, num_docs: int) -> float:
+    """BM25 idf with the +1 smoothing that keeps scores non-negative"""
+    return math.log(1.0 + (num_docs - df + 0.5) / (df + 0.5))
+
+
+def _impacts(tfs: np.ndarray, dls: np.ndarray, df: int, num_docs: int,
+             avgdl: float, k1: float, b: float) -> np.ndarray:
+    """Per-posting BM25 score contributions for one term"""
+    norm = k1 * (1.0 - b + b * dls / avgdl) if avgdl else k1
+    return _idf(df, num_docs) * tfs * (k1 + 1.0) / (tfs + norm)
+
+
+class BM25Index:
+    """In-memory BM25 index with precomputed per-posting impacts
+
+    Postings are decoded once at load time into flat arrays of sorted doc
+    ids and their score contributions, sliced per term by `offsets`, so a
+    query only touches the postings of its own terms. The flat arrays can
+    be exported with `to_arrays` and mapped from shared memory.
+    """
+
+    def __init__(self, data: Dict[str, Any]):
+        k1 = float(data.get('k1', DEFAULT_K1))
+        b = float(data.get('b', DEFAULT_B))
+        num_docs = int(data.get('num_docs', 0))
+        avgdl = float(data.get('avgdl', 0.0))
+        doc_lengths = np.array(data.get('doc_lengths', []), dtype=np.float64)
+
+        terms = list(data.get('terms', {}).keys())
+        doc_id_chunks, impact_chunks, upper_bounds = [], [], []
+        for term in terms:
+            entry = data['terms'][term]
+            doc_ids, tfs = decode_postings(entry['postings'])
+            impacts = _impacts(tfs.astype(np.float64), doc_lengths[doc_ids], int(entry['df']),
+                               num_docs, avgdl, k1, b)
+            doc_id_chunks.append(doc_ids)
+            impact_chunks.append(impacts)
+            upper_bounds.append(float(entry.get('max_score', impacts.max())))
+
+        offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(chunk) for chunk in doc_id_chunks])
+        self._set_arrays(
+            terms,
+            offsets,
+            np.concatenate(doc_id_chunks) if terms else np.zeros(0, dtype=np.int32),
+            np.concatenate(impact_chunks) if terms else np.zeros(0, dtype=np.float64),
+            np.array(upper_bounds, dtype=np.float64),
+            {'k1': k1, 'b': b, 'num_docs': num_docs, 'avgdl': avgdl},
+        )
+
+    def _set_arrays(self, terms: List[str], offsets: np.ndarray, doc_ids: np.ndarray,
+                    impacts: np.ndarray, upper_bounds: np.ndarray, params: Dict[str, Any]):
+        self.k1 = params['k1']
+        self.b = params['b']
+        self.num_docs = params['num_docs']
+        self.avgdl = params['avgdl']
+        self.term_ids = {term: i for i, term in enumerate(terms)}
+        self.offsets = offsets
+        self.doc_ids = doc_ids
+        self.impacts = impacts
+        self.upper_bounds = upper_bounds
+
+    @classmethod
+    def from_texts(cls, texts: List[str], k1: float = DEFAULT_K1, b: float = DEFAULT_B) -> "BM25Index":
+        """Build an index directly from texts (used when the saved index has no BM25 section)"""
+        return cls(build_bm25_index(texts, k1=k1, b=b))
+
+    def to_arrays(self) -> Tuple[Dict[str, np.ndarray], Dict[str, Any]]:
+        """Flat arrays plus the small metadata needed by `from_arrays`"""
+        arrays = {
+            'offsets': self.offsets,
+            'doc_ids': self.doc_ids,
+            'impacts': self.impacts,
+            'upper_bounds': self.upper_bounds,
+        }
+        terms = sorted(self.term_ids, key=self.term_ids.get)
+        meta = {'terms': terms, 'k1': self.k1, 'b': self.b, 'num_docs': self.num_docs, 'avgdl': self.avgdl}
+        return arrays, meta
+
+    @classmethod
+    def from_arrays(cls, arrays: Dict[str, np.ndarray], meta: Dict[str, Any]) -> "BM25Index":
+        """Wrap existing (possibly shared, read-only) arrays without copying"""
+        index = cls.__new__(cls)
+        index._set_arrays(meta['terms'], arrays['offsets'], arrays['doc_ids'], arrays['impacts'],
+                          arrays['upper_bounds'], meta)
+        return index
+
+    def _query_terms(self, query: str) -> List[Tuple[np.ndarray, np.ndarray, float]]:
+        seen = set()
+        result = []
+        for tok in tokenize(query):
+            term_id = self.term_ids.get(tok)
+            if term_id is not None and tok not in seen:
+                seen.add(tok)
+                start, end = self.offsets[term_id], self.offsets[term_id + 1]
+                result.append((self.doc_ids[start:end], self.impacts[start:end],
+                               float(self.upper_bounds[term_id])))
+        return result
+
+    def score_all(self, query: str) -> np.ndarray:
+        """Exhaustive BM25 scores for every document (reference implementation)"""
+        scores = np.zeros(self.num_docs, dtype=np.float64)
+        for doc_ids, impacts, _ in self._query_terms(query):
+            scores[doc_ids] += impacts
+        return scores
+
+    def search(self, query: str, k: int = 4, candidates: Optional[np.ndarray] = None) -> List[Tuple[int, float]]:
+        """Top-k documents by BM25 score using WAND early termination
+
+        Args:
+            query: Search query string
+            k: Number of results to return
+            candidates: Optional boolean mask; documents outside it are skipped
+                without being scored
+
+        Returns:
+            List of (doc_id, score) sorted by descending score
+        """
+        terms = self._query_terms(query)
+        if not terms or k <= 0:
+            return []
+
+        # Cursor: [doc_ids, impacts, position, upper_bound]
+        cursors = [[doc_ids, impacts, 0, ub] for doc_ids, impacts, ub in terms]
+        heap: List[Tuple[float, int]] = []
+        threshold = 0.0
+        candidate_ids = np.flatnonzero(candidates) if candidates is not None else None
+
+        while cursors:
+            cursors.sort(key=lambda c: c[0][c[2]])
+
+            # Find the pivot: first cursor where accumulated upper bounds beat the threshold
+            accumulated = 0.0
+            pivot = -1
+            for i, cursor in enumerate(cursors):
+                accumulated += cursor[3]
+                if accumulated > threshold:
+                    pivot = i
+                    break
+            if pivot < 0:
+                break
+
+            pivot_doc = int(cursors[pivot][0][cursors[pivot][2]])
+
+            if candidates is not None and not candidates[pivot_doc]:
+                # Filtered out: jump every cursor to the next candidate without scoring
+                pos = int(np.searchsorted(candidate_ids, pivot_doc))
+                if pos == len(candidate_ids):
+                    break
+                next_doc = int(candidate_ids[pos])
+                for cursor in cursors:
+                    if cursor[0][cursor[2]] < next_doc:
+                        cursor[2] += int(np.searchsorted(cursor[0][cursor[2]:], next_doc))
+            elif int(cursors[0][0][cursors[0][2]]) == pivot_doc:
+                # All cursors up to the pivot sit on pivot_doc: fully score it
+                score = 0.0
+                for cursor in cursors:
+                    if int(cursor[0][cursor[2]]) != pivot_doc:
+                        break
+                    score += float(cursor[1][cursor[2]])
+                    cursor[2] += 1
+
+                if len(heap) < k:
+                    heapq.heappush(heap, (score, -pivot_doc))
+                elif score > heap[0][0]:
+                    heapq.heapreplace(heap, (score, -pivot_doc))
+                if len(heap) == k:
+                    threshold = heap[0][0]
+            else:
+                # Skip the leading cursors forward to the pivot document
+                for cursor in cursors[:pivot]:
+                    cursor[2] += int(np.searchsorted(cursor[0][cursor[2]:], pivot_doc))
+
+            cursors = [c for c in cursors if c[2] < len(c[0])]
+
+        return [(-neg_id, score) for score, neg_id in sorted(heap, key=lambda e: (-e[0], -e[1]))]
@@ -0,0 +1,168 @@
+"""Server-side chat history keyed by conversation ID
+
+Without it the client resends the whole `messages` list every turn, so
+each request uploads, validates and re-serializes an ever-growing
+history. A client that asks for a new conversation gets an ID minted by
+the server (`secrets.token_urlsafe`, 128 bits) and from then on sends
+only the new messages with it: the stored history is prepended
+server-side, and the turn (new messages plus the answer) is stored once
+the answer completes. IDs the server never issued, or whose
+conversation expired, are unknown and get no history.
+
+Histories are kept compact, as (role code, content) pairs capped at
+CHAT_CONVERSATION_MESSAGES, in an LRU of CHAT_CONVERSATION_SIZE entries
+that expire after CHAT_CONVERSATION_TTL idle seconds. With Vercel KV
+configured each save is also written to KV in the background, so other
+workers and restarts see it. A worker uses its own copy for
+CHAT_CONVERSATION_LOCAL_TTL seconds after saving it and only then, or on
+a miss, reads KV, keeping whichever copy is newer.
+"""
+
+import asyncio
+import json
+import os
+import secrets
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from .kv import kv
+
+CHAT_CONVERSATION_SIZE = int(os.getenv("CHAT_CONVERSATION_SIZE", "1000"))  # 0 disables the store
+CHAT_CONVERSATION_TTL = int(os.getenv("CHAT_CONVERSATION_TTL", "3600"))
+CHAT_CONVERSATION_MESSAGES = int(os.getenv("CHAT_CONVERSATION_MESSAGES", "40"))
+# Seconds a worker trusts its own copy without checking KV (0 always checks, for
+# workers that do not see every turn of a conversation)
+CHAT_CONVERSATION_LOCAL_TTL = float(os.getenv("CHAT_CONVERSATION_LOCAL_TTL", str(CHAT_CONVERSATION_TTL)))
+
+# Issued IDs are secrets.token_urlsafe(16): 22 URL-safe characters
+CONVERSATION_ID_PATTERN = r"^[A-Za-z0-9_-]{22}$"
+
+KEY_PREFIX = "chat:conversation:"
+ROLE_CODES = {"system": "s", "user": "u", "assistant": "a"}
+CODE_ROLES = {code: role for role, code in ROLE_CODES.items()}
+
+# (saved at, ((role code, content), ...))
+Entry = Tuple[float, Tuple[Tuple[str, str], ...]]
+
+
+def pack(entry: Entry) -> str:
+    """Compact JSON for KV: {"t": saved at, "m": [[role code, content], ...]}"""
+    saved, messages = entry
+    return json.dumps({"t": saved, "m": messages}, separators=(",", ":"), ensure_ascii=False)
+
+
+def unpack(data: str) -> Optional[Entry]:
+    try:
+        parsed = json.loads(data)
+        return float(parsed["t"]), tuple((code, content) for code, content in parsed["m"] if code in CODE_ROLES)
+    except (ValueError, TypeError, KeyError):
+        return None
+
+
+class ConversationStore:
+    """LRU of compact chat histories with idle expiry, mirrored to KV when configured"""
+
+    def __init__(self, max_conversations: int = CHAT_CONVERSATION_SIZE, ttl: float = CHAT_CONVERSATION_TTL,
+                 max_messages: int = CHAT_CONVERSATION_MESSAGES, local_ttl: float = CHAT_CONVERSATION_LOCAL_TTL):
+        self.max_conversations = max_conversations
+        self.ttl = ttl
+        self.max_messages = max_messages
+        self.local_ttl = local_ttl
+        self._entries: "OrderedDict[str, Entry]" = OrderedDict()
+        self._writes: Set[asyncio.Task] = set()
+        self.hits = 0
+        self.misses = 0
+        self.saves = 0
+        self.created = 0
+        self.kv_reads = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_conversations > 0
+
+    def _get_local(self, conversation_id: str) -> Optional[Entry]:
+        entry = self._entries.get(conversation_id)
+        if entry is None:
+            return None
+        if time.time() - entry[0] > self.ttl:
+            del self._entries[conversation_id]
+            return None
+        self._entries.move_to_end(conversation_id)
+        return entry
+
+    def _put_local(self, conversation_id: str, entry: Entry):
+        self._entries[conversation_id] = entry
+        self._entries.move_to_end(conversation_id)
+        while len(self._entries) > self.max_conversations:
+            self._entries.popitem(last=False)
+
+    def create(self) -> str:
+        """Issue a new conversation ID, stored with an empty history"""
+        conversation_id = secrets.token_urlsafe(16)
+        self._store(conversation_id, (time.time(), ()))
+        self.created += 1
+        return conversation_id
+
+    async def load(self, conversation_id: str) -> Optional[List[Dict[str, str]]]:
+        """Stored messages of a conversation, oldest first
+
+        Returns:
+            The messages, or None when the ID is unknown (never issued) or expired
+        """
+        entry = self._get_local(conversation_id)
+        if kv.enabled and (entry is None or time.time() - entry[0] > self.local_ttl):
+            self.kv_reads += 1
+            data = await kv.get(KEY_PREFIX + conversation_id)
+            remote = unpack(data) if isinstance(data, str) else None
+            if remote is not None and (entry is None or remote[0] > entry[0]):
+                # Saved by another worker since this one last saw the conversation
+                entry = remote
+                self._put_local(conversation_id, entry)
+
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return [{"role": CODE_ROLES[code], "content": content} for code, content in entry[1]]
+
+    def save(self, conversation_id: str, messages: List[Dict[str, str]]):
+        """Replace a conversation's history; the KV copy is written in the background"""
+        kept = messages[-self.max_messages:] if self.max_messages > 0 else messages
+        self._store(conversation_id, (time.time(), tuple((ROLE_CODES[msg["role"]], msg["content"]) for msg in kept)))
+        self.saves += 1
+
+    def _store(self, conversation_id: str, entry: Entry):
+        self._put_local(conversation_id, entry)
+        if kv.enabled:
+            task = asyncio.get_running_loop().create_task(
+                kv.set(KEY_PREFIX + conversation_id, pack(entry), ex=int(self.ttl)))
+            self._writes.add(task)
+            task.add_done_callback(self._writes.discard)
+
+    async def close(self):
+        """Wait for KV writes still in flight"""
+        loop = asyncio.get_running_loop()
+        pending = [task for task in self._writes if task.get_loop() is loop]
+        if pending:
+            await asyncio.wait(pending)
+
+    def clear(self):
+        self._entries.clear()
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            'enabled': self.enabled,
+            'backend': 'kv' if kv.enabled else 'memory',
+            'conversations': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'saves': self.saves,
+            'created': self.created,
+            'kv_reads': self.kv_reads,
+            'pending_writes': len(self._writes),
+        }
+
+
+# Global conversation store for /ai/chat
+conversations = ConversationStore()
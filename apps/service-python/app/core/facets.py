@@ -0,0 +1,88 @@
+"""Facet bitsets over document frontmatter (tags, tech) for filtered retrieval"""
+
+import base64
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+FACET_FIELDS = ("tags", "tech")
+
+
+def facet_values(doc: Dict[str, Any], field: str) -> List[str]:
+    """Normalized (lowercased) string values of a facet field"""
+    values = doc.get(field) or []
+    if isinstance(values, str):
+        values = [values]
+    return [v.strip().lower() for v in values if isinstance(v, str) and v.strip()]
+
+
+def encode_bitset(mask: np.ndarray) -> str:
+    """Pack a boolean mask into base64 bits"""
+    return base64.b64encode(np.packbits(mask.astype(bool)).tobytes()).decode('ascii')
+
+
+def decode_bitset(encoded: str, size: int) -> np.ndarray:
+    """Unpack a base64 bitset into a boolean mask of `size` entries"""
+    packed = np.frombuffer(base64.b64decode(encoded), dtype=np.uint8)
+    return np.unpackbits(packed, count=size).astype(bool)
+
+
+def build_facet_masks(documents: List[Dict[str, Any]]) -> Dict[str, Dict[str, np.ndarray]]:
+    """Inverted facet index: field -> value -> boolean document mask"""
+    masks: Dict[str, Dict[str, np.ndarray]] = {field: {} for field in FACET_FIELDS}
+    for doc_idx, doc in enumerate(documents):
+        for field in FACET_FIELDS:
+            for value in facet_values(doc, field):
+                if value not in masks[field]:
+                    masks[field][value] = np.zeros(len(documents), dtype=bool)
+                masks[field][value][doc_idx] = True
+    return masks
+
+
+def build_facet_index(documents: List[Dict[str, Any]]) -> Dict[str, Dict[str, str]]:
+    """Serializable facet index with each value's documents stored as a bitset"""
+    return {
+        field: {value: encode_bitset(mask) for value, mask in sorted(values.items())}
+        for field, values in build_facet_masks(documents).items()
+    }
+
+
+def load_facet_masks(facets: Optional[Dict[str, Dict[str, str]]],
+                     documents: List[Dict[str, Any]]) -> Dict[str, Dict[str, np.ndarray]]:
+    """Decode a saved facet index, or build one for indexes that predate it"""
+    if not facets:
+        return build_facet_masks(documents)
+    return {
+        field: {value: decode_bitset(bits, len(documents)) for value, bits in facets.get(field, {}).items()}
+        for field in FACET_FIELDS
+    }
+
+
+def filter_mask(masks: Dict[str, Dict[str, np.ndarray]], filters: Dict[str, List[str]],
+                size: int) -> np.ndarray:
+    """Combine filters into one document mask
+
+    Values within a field are OR-ed, fields are AND-ed, and matching is
+    case-insensitive. Unknown values match nothing; a field with no values
+    (e.g. {"tags": []}) places no constraint.
+
+    Raises:
+        ValueError: If a filter names a field that is not a facet
+    """
+    mask = np.ones(size, dtype=bool)
+    for field, wanted in filters.items():
+        if field not in FACET_FIELDS:
+            raise ValueError(f"Unknown filter field '{field}', expected one of {FACET_FIELDS}")
+        if isinstance(wanted, str):
+            wanted = [wanted]
+        wanted = [value for value in wanted if value.strip()]
+        if not wanted:
+            continue
+
+        field_mask = np.zeros(size, dtype=bool)
+        for value in wanted:
+            bits = masks.get(field, {}).get(value.strip().lower())
+            if bits is not None:
+                field_mask |= bits
+        mask &= field_mask
+    return mask
@@ -0,0 +1,226 @@
+"""Streamed, compressed RAG index container
+
+The builder writes the index section by section instead of materializing
+one big JSON document, so peak memory is bounded by a single chunk.
+
+Layout:
+    MAGIC
+    sections: u16 name length | name | u8 kind | u64 payload length | zlib payload
+    footer:   FOOTER_MAGIC | u64 section count | sha256 of all preceding bytes
+
+Section names are dotted paths into the loaded dict ("vectors_csr.data").
+A name may repeat: JSON list chunks are extended, JSON dict chunks are
+merged and array chunks are concatenated. The file is written to a temp
+name and renamed into place after the footer, so readers only ever see a
+complete index; the footer digest catches truncation and corruption.
+"""
+
+import hashlib
+import json
+import os
+import struct
+import zlib
+from pathlib import Path
+from typing import Any, Collection, Dict, Iterable, Optional
+
+import numpy as np
+
+MAGIC = b"RAGIDX01"
+FOOTER_MAGIC = b"RAGEND01"
+FOOTER_SIZE = len(FOOTER_MAGIC) + 8 + 32
+
+JSON_VALUE, JSON_LIST, JSON_DICT, ARRAY = range(4)
+
+# Uncompressed bytes per array chunk
+ARRAY_CHUNK_BYTES = 4 * 1024 * 1024
+COMPRESS_LEVEL = 6
+
+
+def is_index_file(raw: bytes) -> bool:
+    return raw[:len(MAGIC)] == MAGIC
+
+
+class IndexWriter:
+    """Write index sections to a temp file and atomically publish it on close
+
+    Use as a context manager; if the block raises, the temp file is removed
+    and any existing index at `path` is left untouched.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.tmp_path = self.path.with_name(f"{self.path.name}.{os.getpid()}.tmp")
+        self.sections = 0
+        self._digest = hashlib.sha256()
+        self._file = open(self.tmp_path, 'wb')
+        self._write(MAGIC)
+
+    def _write(self, data: bytes):
+        self._digest.update(data)
+        self._file.write(data)
+
+    def _section(self, name: str, kind: int, payload: bytes):
+        encoded_name = name.encode('utf-8')
+        compressed = zlib.compress(payload, COMPRESS_LEVEL)
+        self._write(struct.pack('<H', len(encoded_name)) + encoded_name +
+                    struct.pack('<BQ', kind, len(compressed)))
+        self._write(compressed)
+        self.sections += 1
+
+    def write_value(self, name: str, value: Any):
+        """Write a JSON value (a later value with the same name replaces it)"""
+        self._section(name, JSON_VALUE, json.dumps(value, ensure_ascii=False).encode('utf-8'))
+
+    def write_list(self, name: str, items: Iterable[Any], chunk_size: int = 256):
+        """Stream a list in chunks of `chunk_size` items"""
+        chunk = []
+        wrote = False
+        for item in items:
+            chunk.append(item)
+            if len(chunk) >= chunk_size:
+                self._section(name, JSON_LIST, json.dumps(chunk, ensure_ascii=False).encode('utf-8'))
+                chunk = []
+                wrote = True
+        if chunk or not wrote:
+            self._section(name, JSON_LIST, json.dumps(chunk, ensure_ascii=False).encode('utf-8'))
+
+    def write_dict(self, name: str, items: Iterable, chunk_size: int = 2048):
+        """Stream (key, value) pairs as dict chunks"""
+        chunk = {}
+        wrote = False
+        for key, value in items:
+            chunk[key] = value
+            if len(chunk) >= chunk_size:
+                self._section(name, JSON_DICT, json.dumps(chunk, ensure_ascii=False).encode('utf-8'))
+                chunk = {}
+                wrote = True
+        if chunk or not wrote:
+            self._section(name, JSON_DICT, json.dumps(chunk, ensure_ascii=False).encode('utf-8'))
+
+    def write_array(self, name: str, array: np.ndarray):
+        """Write a numeric array in row chunks of about ARRAY_CHUNK_BYTES"""
+        array = np.asarray(array)
+        row_bytes = max(array.itemsize * int(np.prod(array.shape[1:], dtype=np.int64)), 1)
+        rows = max(ARRAY_CHUNK_BYTES // row_bytes, 1)
+        header = json.dumps({'dtype': array.dtype.str, 'shape': list(array.shape[1:])}).encode('utf-8')
+
+        for start in range(0, max(len(array), 1), rows):
+            block = np.ascontiguousarray(array[start:start + rows])
+            self._section(name, ARRAY, struct.pack('<I', len(header)) + header + block.tobytes())
+
+    def close(self):
+        """Write the footer, fsync and rename into place"""
+        footer_prefix = FOOTER_MAGIC + struct.pack('<Q', self.sections)
+        self._digest.update(footer_prefix)
+        self._file.write(footer_prefix + self._digest.digest())
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        os.replace(self.tmp_path, self.path)
+
+    def abort(self):
+        self._file.close()
+        self.tmp_path.unlink(missing_ok=True)
+
+    def __enter__(self) -> "IndexWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+def read_index(raw: bytes, sections: Optional[Collection[str]] = None) -> Dict[str, Any]:
+    """Verify the footer and decode sections into a nested dict
+
+    Args:
+        sections: Top-level names to decode ("documents" covers "documents.*");
+            the others are skipped without being decompressed. All by default.
+
+    Raises:
+        ValueError: If the file is not an index, is truncated or fails the integrity check
+    """
+    if not is_index_file(raw):
+        raise ValueError("Not a RAG index file")
+    if len(raw) < len(MAGIC) + FOOTER_SIZE or raw[-FOOTER_SIZE:-40] != FOOTER_MAGIC:
+        raise ValueError("RAG index file is truncated (missing footer)")
+
+    body_end = len(raw) - FOOTER_SIZE
+    (expected_sections,) = struct.unpack('<Q', raw[body_end + len(FOOTER_MAGIC):body_end + len(FOOTER_MAGIC) + 8])
+    digest = hashlib.sha256(memoryview(raw)[:len(raw) - 32]).digest()
+    if digest != raw[-32:]:
+        raise ValueError("RAG index file failed its integrity check")
+
+    data: Dict[str, Any] = {}
+    array_chunks: Dict[str, list] = {}
+    pos = len(MAGIC)
+    count = 0
+
+    while pos < body_end:
+        (name_len,) = struct.unpack_from('<H', raw, pos)
+        name = raw[pos + 2:pos + 2 + name_len].decode('utf-8')
+        pos += 2 + name_len
+        kind, length = struct.unpack_from('<BQ', raw, pos)
+        pos += 9
+        start = pos
+        pos += length
+        count += 1
+        if sections is not None and name.split('.', 1)[0] not in sections:
+            continue
+        payload = zlib.decompress(raw[start:pos])
+
+        if kind == ARRAY:
+            (header_len,) = struct.unpack_from('<I', payload, 0)
+            header = json.loads(payload[4:4 + header_len])
+            block = np.frombuffer(payload, dtype=np.dtype(header['dtype']), offset=4 + header_len)
+            array_chunks.setdefault(name, []).append(block.reshape([-1] + header['shape']))
+            continue
+
+        value = json.loads(payload)
+        parent, key = _parent(data, name)
+        if kind == JSON_LIST:
+            parent.setdefault(key, []).extend(value)
+        elif kind == JSON_DICT:
+            parent.setdefault(key, {}).update(value)
+        else:
+            parent[key] = value
+
+    if count != expected_sections:
+        raise ValueError(f"RAG index file has {count} sections, footer expects {expected_sections}")
+
+    for name, chunks in array_chunks.items():
+        parent, key = _parent(data, name)
+        parent[key] = chunks[0] if len(chunks) == 1 else np.concatenate(chunks)
+    return data
+
+
+def _parent(data: Dict[str, Any], name: str):
+    """Containing dict and final key of a dotted section name"""
+    *path, key = name.split('.')
+    for part in path:
+        data = data.setdefault(part, {})
+    return data, key
+
+
+def load_index_data(raw: bytes, sections: Optional[Collection[str]] = None) -> Dict[str, Any]:
+    """Decode either a streamed index file (only `sections` when given) or a legacy JSON index"""
+    if is_index_file(raw):
+        return read_index(raw, sections)
+    return json.loads(raw)
+
+
+def atomic_write(path: Path, write, mode: str = 'wb', encoding: Optional[str] = None):
+    """Call write(f) on a temp file next to `path`, then rename it into place"""
+    path = Path(path)
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    try:
+        with open(tmp_path, mode, encoding=encoding) as f:
+            write(f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
@@ -1,5 +1,5 @@
 import os
-from typing import Optional
+from typing import Any, List, Optional, Union
 
 import httpx
 
@@ -16,7 +16,8 @@ class KVClient:
         else:
             self.enabled = True
 
-    async def _make_request(self, method: str, endpoint: str, data: dict = None) -> Optional[dict]:
+    async def _make_request(self, method: str, endpoint: str,
+                            data: Union[dict, list] = None) -> Optional[Union[dict, List[Any]]]:
         """Make request to KV REST API"""
         if not self.enabled:
             return None
@@ -49,6 +50,28 @@ class KVClient:
         result = await self._make_request("POST", "incr", {"key": key, "increment": by})
         return result.get("result", 0) if result else by  # Fallback to increment value
 
+    async def incr_ex(self, key: str, by: int, ex: int) -> Optional[int]:
+        """Increment a key that expires `ex` seconds after it is created
+
+        INCRBY and EXPIRE ... NX run as one transaction (the REST API's
+        multi-exec), so the expiry is set exactly once, by whichever
+        increment creates the key, and later increments do not extend it.
+
+        Returns:
+            The new value, or None when KV is unavailable (unlike `incr`,
+            which falls back to the increment itself)
+        """
+        result = await self._make_request("POST", "multi-exec", [
+            ["INCRBY", key, str(by)],
+            ["EXPIRE", key, str(ex), "NX"],
+        ])
+        if not isinstance(result, list) or not result or not isinstance(result[0], dict):
+            return None
+        try:
+            return int(result[0]["result"])
+        except (KeyError, ValueError, TypeError):
+            return None
+
     async def get_int(self, key: str) -> int:
         """Get integer value for key"""
         result = await self._make_request("POST", "get", {"key": key})
@@ -59,6 +82,19 @@ class KVClient:
                 pass
         return 0
 
+    async def get(self, key: str) -> Optional[str]:
+        """Get string value for key (None when missing or KV is unavailable)"""
+        result = await self._make_request("POST", "get", {"key": key})
+        return result.get("result") if result else None
+
+    async def set(self, key: str, value: str, ex: Optional[int] = None) -> bool:
+        """Set string value for key, expiring after `ex` seconds when given"""
+        data = {"key": key, "value": value}
+        if ex:
+            data["ex"] = ex
+        result = await self._make_request("POST", "set", data)
+        return result is not None
+
     async def sadd(self, key: str, member: str) -> int:
         """Add member to set"""
         result = await self._make_request("POST", "sadd", {"key": key, "members": [member]})
@@ -0,0 +1,219 @@
+"""Token budget for the prompt sent upstream
+
+Clients send the whole conversation every turn, so without a limit the
+prompt (and its cost and latency) grows with every message. Before each
+upstream call the history is fitted to CHAT_PROMPT_TOKEN_BUDGET: the
+system prompt and the latest turns are kept, and older turns are folded
+into a short extractive summary or dropped.
+
+Token counts come from tiktoken's cl100k_base when it is installed (the
+encoding used by gpt-3.5-turbo). Otherwise a local estimator splits text
+the way that tokenizer pre-splits it (words with their leading space,
+digit groups of up to three, punctuation runs) and charges long words
+extra. It is meant to slightly overestimate, so a fitted prompt stays
+within budget.
+"""
+
+import math
+import os
+import re
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
+
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding("cl100k_base")
+except Exception:  # Not installed, or the encoding file cannot be fetched offline
+    _encoding = None
+
+# Total prompt tokens per upstream call (0 disables trimming)
+CHAT_PROMPT_TOKEN_BUDGET = int(os.getenv("CHAT_PROMPT_TOKEN_BUDGET", "3000"))
+# Room for the summary of dropped turns (0 drops them without a summary)
+CHAT_SUMMARY_TOKENS = int(os.getenv("CHAT_SUMMARY_TOKENS", "200"))
+# Cap on the RAG project context appended to the system prompt
+RAG_CONTEXT_TOKENS = int(os.getenv("RAG_CONTEXT_TOKENS", "1200"))
+
+# Chat format overhead: each message is wrapped in role/separator tokens,
+# and the reply is primed with a few more
+TOKENS_PER_MESSAGE = 4
+REPLY_PRIMING_TOKENS = 3
+
+SUMMARY_HEADER = "Summary of the earlier conversation (older turns were condensed):"
+SUMMARY_SNIPPET_WORDS = 24
+TRUNCATION_MARK = "…"
+
+PRETOKEN_PATTERN = re.compile(
+    r"'(?:s|t|re|ve|m|ll|d)|[^\S\n]?[^\W\d_]+|\d{1,3}|[^\S\n]?[^\s\w]+|\s*\n|\s+"
+)
+
+
+def count_tokens(text: str) -> int:
+    """Tokens in `text` (exact with tiktoken, estimated otherwise)"""
+    if not text:
+        return 0
+    if _encoding is not None:
+        return len(_encoding.encode(text, disallowed_special=()))
+
+    tokens = 0
+    for piece in PRETOKEN_PATTERN.findall(text):
+        if not piece.isascii():
+            # Accented text is mostly split per character; CJK and emoji often take two
+            tokens += sum(1 if ord(c) <= 0x7FF else 2 for c in piece)
+        elif len(piece) <= 7:
+            tokens += 1
+        elif piece.isspace():
+            tokens += math.ceil(len(piece) / 8)
+        elif piece.strip().isalpha():
+            tokens += math.ceil(len(piece) / 5)  # Long words split into sub-words
+        else:
+            tokens += math.ceil(len(piece) / 2)
+    return tokens
+
+
+# Message texts whose token counts are remembered: the history repeats every
+# turn, and so does the system prompt whenever the same documents come back
+MESSAGE_TOKEN_CACHE_SIZE = 2048
+
+
+@lru_cache(maxsize=MESSAGE_TOKEN_CACHE_SIZE)
+def _content_tokens(content: str) -> int:
+    return count_tokens(content)
+
+
+def message_tokens(message: Dict[str, str]) -> int:
+    return TOKENS_PER_MESSAGE + _content_tokens(message['content'])
+
+
+def prompt_tokens(messages: List[Dict[str, str]]) -> int:
+    """Tokens the upstream will count for this message list"""
+    return REPLY_PRIMING_TOKENS + sum(message_tokens(m) for m in messages)
+
+
+def truncate_to_tokens(text: str, max_tokens: int, keep_end: bool = False) -> str:
+    """Cut `text` at a word boundary so it fits in `max_tokens`
+
+    Args:
+        text: Text to shorten
+        max_tokens: Token limit, including the truncation mark
+        keep_end: Keep the end of the text instead of the start
+    """
+    if count_tokens(text) <= max_tokens:
+        return text
+    max_tokens -= count_tokens(TRUNCATION_MARK)
+    if max_tokens <= 0:
+        return ""
+
+    words = text.split(' ')
+    if keep_end:
+        words.reverse()
+
+    # Binary search the longest word prefix that fits
+    low, high = 0, len(words)
+    while low < high:
+        mid = (low + high + 1) // 2
+        candidate = words[:mid]
+        if keep_end:
+            candidate = candidate[::-1]
+        if count_tokens(' '.join(candidate)) <= max_tokens:
+            low = mid
+        else:
+            high = mid - 1
+
+    kept = words[:low]
+    if keep_end:
+        return TRUNCATION_MARK + ' '.join(kept[::-1])
+    return ' '.join(kept) + TRUNCATION_MARK
+
+
+def summarize_turns(turns: List[Dict[str, str]], max_tokens: int) -> Optional[str]:
+    """Extractive summary of dropped turns, newest first until `max_tokens`"""
+    header_tokens = count_tokens(SUMMARY_HEADER) + 1
+    if max_tokens <= header_tokens or not turns:
+        return None
+
+    lines: List[str] = []
+    used = header_tokens
+    for turn in reversed(turns):
+        words = turn['content'].split()
+        snippet = ' '.join(words[:SUMMARY_SNIPPET_WORDS])
+        if len(words) > SUMMARY_SNIPPET_WORDS:
+            snippet += TRUNCATION_MARK
+        speaker = "User" if turn['role'] == "user" else "Assistant"
+        line = f"- {speaker}: {snippet}"
+        cost = count_tokens(line) + 1
+        if used + cost > max_tokens:
+            break
+        lines.append(line)
+        used += cost
+
+    if not lines:
+        return None
+    return "\n".join([SUMMARY_HEADER] + lines[::-1])
+
+
+def fit_messages(system_prompt: str, history: List[Dict[str, str]],
+                 budget: Optional[int] = None,
+                 summary_tokens: Optional[int] = None) -> Tuple[List[Dict[str, str]], Dict[str, Any]]:
+    """Fit the system prompt plus conversation history into a token budget
+
+    The system prompt and the newest turns are always kept. Older turns
+    that do not fit are replaced by a summary message (when there is
+    room for one) or dropped. If the newest message alone is over
+    budget, its beginning is cut.
+
+    Args:
+        system_prompt: System prompt, already augmented with any RAG context
+        history: Client-supplied messages as {"role", "content"} dicts, oldest first
+        budget: Prompt token budget (defaults to CHAT_PROMPT_TOKEN_BUDGET, 0 disables)
+        summary_tokens: Room for the summary (defaults to CHAT_SUMMARY_TOKENS)
+
+    Returns:
+        Tuple of (messages to send, report) where the report has the
+        original and final prompt tokens, tokens saved and turns dropped
+    """
+    budget = CHAT_PROMPT_TOKEN_BUDGET if budget is None else budget
+    summary_tokens = CHAT_SUMMARY_TOKENS if summary_tokens is None else summary_tokens
+
+    system = {'role': 'system', 'content': system_prompt}
+    costs = [message_tokens(m) for m in history]
+    fixed = REPLY_PRIMING_TOKENS + message_tokens(system)
+    original = fixed + sum(costs)
+
+    report = {'budget': budget, 'original_tokens': original, 'final_tokens': original,
+              'saved_tokens': 0, 'dropped_messages': 0, 'summarized': False}
+    if budget <= 0 or original <= budget:
+        return [system] + list(history), report
+
+    # Newest turns first, leaving room for a summary of whatever is dropped
+    available = budget - fixed - summary_tokens
+    kept_from = len(history)
+    used = 0
+    while kept_from > 0 and used + costs[kept_from - 1] <= available:
+        kept_from -= 1
+        used += costs[kept_from]
+
+    kept = list(history[kept_from:])
+    if not kept and history:
+        # The latest message alone does not fit: keep its end, unless the
+        # system prompt leaves no room at all (better over budget than empty)
+        latest = history[-1]
+        room = budget - fixed - TOKENS_PER_MESSAGE
+        if room > 0:
+            latest = {'role': latest['role'], 'content': truncate_to_tokens(latest['content'], room, keep_end=True)}
+        kept = [latest]
+        kept_from = len(history) - 1
+
+    dropped = list(history[:kept_from])
+    messages = [system]
+    if dropped:
+        # Turns kept under the reserve may leave extra room for the summary
+        room = budget - fixed - sum(message_tokens(m) for m in kept) - TOKENS_PER_MESSAGE
+        summary = summarize_turns(dropped, min(room, summary_tokens)) if summary_tokens > 0 else None
+        if summary:
+            messages.append({'role': 'system', 'content': summary})
+            report['summarized'] = True
+    messages.extend(kept)
+
+    final = prompt_tokens(messages)
+    report.update(final_tokens=final, saved_tokens=original - final, dropped_messages=len(dropped))
+    return messages, report
@@ -1,89 +1,367 @@
-import json
+import asyncio
+import hashlib
+import io
+import os
 import pickle
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
 from pathlib import Path
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, Tuple
 
 import numpy as np
-from sklearn.metrics.pairwise import cosine_similarity
+from scipy import sparse
+from sklearn.preprocessing import normalize
+
+from . import prompt_budget
+from .ann import DEFAULT_NPROBE, IVFIndex
+from .bm25 import BM25Index
+from .facets import filter_mask, load_facet_masks
+from .index_file import load_index_data
+from .prompt_budget import count_tokens, truncate_to_tokens
+from .shared_index import attach_or_build, shared_dir, sharing_enabled
+
+SEARCH_MODES = ("tfidf", "bm25", "lsa")
+
+# Index sections every process keeps for itself; everything else becomes shared arrays
+PER_PROCESS_SECTIONS = ("metadata", "documents", "slug_index", "facets")
+
+# Bump when _build_arrays changes what goes into a shared bundle, so bundles
+# written by older code for the same index are not reused
+BUNDLE_FORMAT = 2
+
+# Passages fetched per requested document before widening the candidate window
+PASSAGE_FETCH_FACTOR = 4
+
+# A document whose snippet would be cut below this is left out of the context
+MIN_SNIPPET_TOKENS = 24
+
+DATA_DIR = Path(__file__).parent.parent.parent / "data"
+DEFAULT_INDEX_PATH = DATA_DIR / "rag.json"
+STREAMED_INDEX_PATH = DATA_DIR / "rag.idx"
+
+
+def default_index_path() -> Path:
+    """The builder's streamed index if present, else the legacy JSON index"""
+    return STREAMED_INDEX_PATH if STREAMED_INDEX_PATH.exists() else DEFAULT_INDEX_PATH
 
 
 class RAGSearcher:
-    def __init__(self, index_path: Optional[str] = None):
+    def __init__(self, index_path: Optional[str] = None, mode: Optional[str] = None):
         self.documents = []
         self.vectorizer = None
         self.doc_vectors = None
+        self.bm25 = None
+        self.lsa_components = None
+        self.ann = None
+        self.slug_to_id: Dict[str, int] = {}
+        self.facet_masks: Dict[str, Dict[str, np.ndarray]] = {}
+        self._load_passages(None)
+
+        # Load bookkeeping reported by /health
+        self.version = None
+        self.loaded_at = None
+        self.load_seconds = 0.0
+        self.load_error = None
+        self.shared_bundle = None
+
+        # Retrieval engine: dense TF-IDF cosine (default), BM25 over the inverted index,
+        # or LSA embeddings searched through the IVF ANN index
+        self.mode = (mode or os.getenv("RAG_SEARCH_MODE", "tfidf")).lower()
+        if self.mode not in SEARCH_MODES:
+            print(f"Warning: Unknown RAG_SEARCH_MODE '{self.mode}', falling back to tfidf")
+            self.mode = "tfidf"
 
         if index_path is None:
             # Default path relative to this file
-            index_path = Path(__file__).parent.parent.parent / "data" / "rag.json"
+            index_path = default_index_path()
 
         self.load_index(str(index_path))
 
     def load_index(self, index_path: str):
-        """Load RAG index from file"""
+        """Load RAG index from file
+
+        Documents and the vectorizer are loaded per process. Numeric arrays
+        (passage offsets, TF-IDF matrix, BM25 postings, LSA/IVF) are mapped
+        from a shared bundle when available, see `shared_index`; only the
+        process that builds the bundle decodes those sections.
+        """
+        started = time.perf_counter()
         try:
             index_file = Path(index_path)
-            vectorizer_file = index_file.with_name(index_file.stem + '_vectorizer.pkl')
+            vectorizer_file = vectorizer_path(index_file)
+            lsa_file = lsa_path(index_file)
 
-            # Load JSON data
-            if index_file.exists():
-                with open(index_file, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
+            files = [index_file, vectorizer_file] + ([lsa_file] if self.mode == "lsa" else [])
+            raw = {path: path.read_bytes() for path in files if path.exists()}
+            digest = hashlib.sha256()
+            for content in raw.values():
+                digest.update(content)
+
+            # Streamed index (integrity-checked) or legacy JSON
+            if index_file in raw:
+                data = load_index_data(raw[index_file], sections=PER_PROCESS_SECTIONS)
 
                 self.documents = data.get('documents', [])
-                vectors_array = data.get('vectors_array', [])
+                self.version = digest.hexdigest()[:12] if self.documents else None
+
+                # O(1) slug lookup and facet bitsets; older indexes get them derived here
+                self.slug_to_id = data.get('slug_index') or {
+                    doc.get('slug'): i for i, doc in enumerate(self.documents)
+                }
+                self.facet_masks = load_facet_masks(data.get('facets'), self.documents)
 
-                if vectors_array:
-                    self.doc_vectors = np.array(vectors_array)
+                arrays, meta = self._index_arrays(index_file, raw[index_file], raw.get(lsa_file))
+                self._attach_arrays(arrays, meta)
 
                 print(f"Loaded {len(self.documents)} documents from RAG index")
 
             # Load vectorizer
-            if vectorizer_file.exists():
-                with open(vectorizer_file, 'rb') as f:
-                    self.vectorizer = pickle.load(f)
+            if vectorizer_file in raw:
+                self.vectorizer = pickle.loads(raw[vectorizer_file])
                 print("Loaded TF-IDF vectorizer")
 
         except Exception as e:
+            self.load_error = str(e)
             print(f"Warning: Could not load RAG index from {index_path}: {e}")
             print("RAG search will not be available")
 
-    def search(self, query: str, k: int = 4) -> List[Dict[str, Any]]:
+        self.loaded_at = datetime.now(timezone.utc).isoformat()
+        self.load_seconds = time.perf_counter() - started
+
+    def _index_arrays(self, index_file: Path, index_raw: bytes,
+                      lsa_raw: Optional[bytes]) -> Tuple[Dict[str, np.ndarray], Dict[str, Any]]:
+        """Attach to this version's shared array bundle, building it if this process is first
+
+        The array sections are decoded only to build: a process that finds
+        the bundle never decompresses them.
+        """
+        def build():
+            return self._build_arrays(load_index_data(index_raw), lsa_raw)
+
+        if self.version and sharing_enabled():
+            # Key on the index location too, so indexes sharing a file name never prune each other
+            location = hashlib.sha256(str(index_file.resolve()).encode('utf-8')).hexdigest()[:8]
+            name = f"{index_file.stem}-{location}.{self.mode}.v{BUNDLE_FORMAT}-{self.version}.arrays"
+            bundle = shared_dir(index_file) / name
+            try:
+                arrays, meta, attached = attach_or_build(bundle, build)
+                self.shared_bundle = {'path': str(bundle), 'attached': attached}
+                print(f"{'Attached to' if attached else 'Published'} shared RAG arrays {bundle.name}")
+                return arrays, meta
+            except OSError as e:
+                print(f"Warning: Shared RAG arrays unavailable ({e}), loading in process")
+
+        return build()
+
+    def _build_arrays(self, data: Dict[str, Any],
+                      lsa_raw: Optional[bytes]) -> Tuple[Dict[str, np.ndarray], Dict[str, Any]]:
+        """Decode the index into flat numpy arrays plus small JSON metadata"""
+        self._load_passages(data.get('passages'))
+        arrays = {
+            'passage_doc': self.passage_doc,
+            'passage_start': self.passage_start,
+            'passage_end': self.passage_end,
+        }
+        meta: Dict[str, Any] = {'has_passages': self.has_passages}
+
+        # One row per passage; legacy indexes store a dense per-document array
+        vectors_csr = data.get('vectors_csr')
+        vectors_array = data.get('vectors_array', [])
+
+        if vectors_csr:
+            # Unit rows once at build, so cosine similarity is a single product per query
+            matrix = normalize(sparse.csr_matrix(
+                (vectors_csr['data'], vectors_csr['indices'], vectors_csr['indptr']),
+                shape=tuple(vectors_csr['shape'])
+            ))
+            arrays['tfidf_data'] = matrix.data.astype(np.float32)
+            arrays['tfidf_indices'] = matrix.indices.astype(np.int32)
+            arrays['tfidf_indptr'] = matrix.indptr.astype(np.int32)
+            meta['tfidf_shape'] = list(matrix.shape)
+        elif vectors_array:
+            arrays['tfidf_dense'] = normalize(np.array(vectors_array))
+
+        if self.mode == "bm25":
+            bm25 = self._load_bm25(data.get('bm25'))
+            if bm25 is not None:
+                bm25_arrays, meta['bm25'] = bm25.to_arrays()
+                arrays.update({f'bm25_{name}': array for name, array in bm25_arrays.items()})
+
+        if self.mode == "lsa" and lsa_raw:
+            with np.load(io.BytesIO(lsa_raw), allow_pickle=False) as npz:
+                lsa_arrays = {f'lsa_{name}': npz[name] for name in npz.files}
+            # A companion file left from another build would point at the wrong passages
+            rows = len(lsa_arrays.get('lsa_embeddings', ()))
+            if rows == len(self.passage_doc):
+                arrays.update(lsa_arrays)
+            else:
+                print(f"Warning: LSA index has {rows} rows for {len(self.passage_doc)} passages, ignoring it")
+
+        return arrays, meta
+
+    def _attach_arrays(self, arrays: Dict[str, np.ndarray], meta: Dict[str, Any]):
+        """Wrap bundle arrays in the search structures without copying them"""
+        self.passage_doc = arrays['passage_doc']
+        self.passage_start = arrays['passage_start']
+        self.passage_end = arrays['passage_end']
+        self.has_passages = meta['has_passages']
+
+        if 'tfidf_data' in arrays:
+            self.doc_vectors = sparse.csr_matrix(
+                (arrays['tfidf_data'], arrays['tfidf_indices'], arrays['tfidf_indptr']),
+                shape=tuple(meta['tfidf_shape']), copy=False
+            )
+        elif 'tfidf_dense' in arrays:
+            self.doc_vectors = arrays['tfidf_dense']
+
+        if 'bm25' in meta:
+            bm25_arrays = {name[5:]: array for name, array in arrays.items() if name.startswith('bm25_')}
+            self.bm25 = BM25Index.from_arrays(bm25_arrays, meta['bm25'])
+            print(f"Loaded BM25 inverted index ({len(self.bm25.term_ids)} terms)")
+
+        if 'lsa_components' in arrays:
+            lsa_arrays = {name[4:]: array for name, array in arrays.items() if name.startswith('lsa_')}
+            self.lsa_components = lsa_arrays.pop('components')
+            nprobe = int(os.getenv("RAG_ANN_NPROBE", str(DEFAULT_NPROBE)))
+            self.ann = IVFIndex.from_arrays(lsa_arrays, nprobe=nprobe)
+            print(f"Loaded LSA index ({self.lsa_components.shape[0]} dims, "
+                  f"{self.ann.nlist} lists, nprobe={self.ann.nprobe}, {self.ann.vectors.dtype})")
+
+    def validate(self) -> List[str]:
+        """Check that the loaded index is internally consistent
+
+        Returns:
+            List of problems; empty when the index is safe to serve
+        """
+        problems = []
+        if self.load_error:
+            problems.append(f"load failed: {self.load_error}")
+        if not self.documents:
+            problems.append("index has no documents")
+            return problems
+
+        num_passages = len(self.passage_doc)
+        if num_passages and (self.passage_doc.min() < 0 or self.passage_doc.max() >= len(self.documents)):
+            problems.append("passage offsets reference missing documents")
+
+        if self.mode == "bm25":
+            if self.bm25 is None:
+                problems.append("BM25 index missing")
+            elif self.bm25.num_docs != num_passages:
+                problems.append(f"BM25 covers {self.bm25.num_docs} passages, expected {num_passages}")
+        elif self.mode == "lsa":
+            if self.ann is None or self.vectorizer is None:
+                problems.append("LSA index or vectorizer missing")
+            elif len(self.ann.vectors) != num_passages:
+                problems.append(f"LSA embeddings {len(self.ann.vectors)} != passages {num_passages}")
+        else:
+            if self.doc_vectors is None or self.vectorizer is None:
+                problems.append("TF-IDF vectors or vectorizer missing")
+            else:
+                if self.doc_vectors.shape[0] != num_passages:
+                    problems.append(f"vector rows {self.doc_vectors.shape[0]} != passages {num_passages}")
+                vocabulary = getattr(self.vectorizer, 'vocabulary_', None)
+                if vocabulary is not None and len(vocabulary) != self.doc_vectors.shape[1]:
+                    problems.append("vectorizer vocabulary does not match vector width")
+
+        return problems
+
+    def status(self) -> Dict[str, Any]:
+        """Summary of the loaded index for health reporting"""
+        return {
+            'version': self.version,
+            'mode': self.mode,
+            'documents': len(self.documents),
+            'passages': len(self.passage_doc),
+            'loaded_at': self.loaded_at,
+            'load_ms': round(self.load_seconds * 1000, 1),
+            'shared_bundle': self.shared_bundle,
+        }
+
+    def _load_bm25(self, bm25_data: Optional[Dict[str, Any]]) -> Optional[BM25Index]:
+        """Load the BM25 section of the index, building it in memory for older indexes"""
+        if bm25_data:
+            return BM25Index(bm25_data)
+
+        if not self.documents:
+            return None
+
+        print("Index has no BM25 section, building inverted index in memory")
+        texts = []
+        for doc_idx, start, end in zip(self.passage_doc, self.passage_start, self.passage_end):
+            doc = self.documents[doc_idx]
+            if self.has_passages:
+                texts.append(f"{doc.get('title', '')}. {doc.get('text', '')[start:end]}")
+            else:
+                texts.append(_document_text(doc))
+        return BM25Index.from_texts(texts)
+
+    def _load_passages(self, passages: Optional[Dict[str, List[int]]]):
+        """Load passage offsets, treating each document as one passage for older indexes"""
+        if passages:
+            self.passage_doc = np.asarray(passages['doc'], dtype=np.int32)
+            self.passage_start = np.asarray(passages['start'], dtype=np.int32)
+            self.passage_end = np.asarray(passages['end'], dtype=np.int32)
+            self.has_passages = True
+        else:
+            self.passage_doc = np.arange(len(self.documents), dtype=np.int32)
+            self.passage_start = np.zeros(len(self.documents), dtype=np.int32)
+            self.passage_end = np.array([len(doc.get('text', '')) for doc in self.documents], dtype=np.int32)
+            self.has_passages = False
+
+    def search(self, query: str, k: int = 4,
+               filters: Optional[Dict[str, List[str]]] = None) -> List[Dict[str, Any]]:
         """Search for relevant documents
 
+        Passages are scored individually and aggregated back to documents by
+        their best passage, which is also used as the snippet.
+
         Args:
             query: Search query string
             k: Number of results to return
+            filters: Optional facet filters, e.g. {"tech": ["Stripe"]}; only
+                matching documents are scored
 
         Returns:
             List of relevant documents with scores
         """
-        if not self.documents or self.vectorizer is None or self.doc_vectors is None:
+        if self.mode == "bm25":
+            if self.bm25 is None:
+                print("RAG index not available, returning empty results")
+                return []
+        elif self.mode == "lsa":
+            if self.ann is None or self.vectorizer is None:
+                print("RAG index not available, returning empty results")
+                return []
+        elif not self.documents or self.vectorizer is None or self.doc_vectors is None:
             print("RAG index not available, returning empty results")
             return []
 
         try:
-            # Vectorize the query
-            query_vector = self.vectorizer.transform([query])
-
-            # Calculate cosine similarities
-            similarities = cosine_similarity(query_vector, self.doc_vectors)[0]
-
-            # Get top-k results
-            top_indices = np.argsort(similarities)[::-1][:k]
+            # Mask candidates before scoring
+            candidates = None
+            if filters:
+                doc_mask = filter_mask(self.facet_masks, filters, len(self.documents))
+                if not doc_mask.any():
+                    return []
+                candidates = doc_mask[self.passage_doc]
+
+            if self.mode == "bm25":
+                fetch = lambda m: self.bm25.search(query, m, candidates=candidates)  # noqa: E731
+            elif self.mode == "lsa":
+                fetch = self._lsa_fetcher(query, candidates)
+            else:
+                fetch = self._tfidf_fetcher(query, candidates)
 
             results = []
-            for idx in top_indices:
-                if similarities[idx] > 0:  # Only include results with positive similarity
-                    doc = self.documents[idx].copy()
-                    doc['similarity_score'] = float(similarities[idx])
-
-                    # Create snippet from text (first 200 chars)
-                    text = doc.get('text', '')
-                    snippet = text[:200] + '...' if len(text) > 200 else text
-                    doc['snippet'] = snippet
-
-                    results.append(doc)
+            for doc_idx, passage_idx, score in self._top_documents(fetch, k):
+                doc = self.documents[doc_idx].copy()
+                doc['similarity_score'] = float(score)
+                doc['snippet'] = self._snippet(doc_idx, passage_idx)
+                results.append(doc)
 
             return results
 
@@ -91,12 +369,93 @@ class RAGSearcher:
             print(f"Error during RAG search: {e}")
             return []
 
+    def _tfidf_fetcher(self, query: str, candidates: Optional[np.ndarray] = None):
+        """Score passages once and return a function yielding the top m
+
+        With a candidate mask only the matching rows are multiplied.
+        """
+        # Vectorize the query
+        query_vector = normalize(self.vectorizer.transform([query])).T
+
+        # Calculate cosine similarities (rows are unit length, one row per passage)
+        if candidates is None:
+            similarities = _dense_column(self.doc_vectors @ query_vector)
+            positive = np.flatnonzero(similarities > 0)
+        else:
+            rows = np.flatnonzero(candidates)
+            scores = _dense_column(self.doc_vectors[rows] @ query_vector)
+            similarities = np.zeros(len(candidates))
+            similarities[rows] = scores
+            positive = rows[scores > 0]
+
+        def fetch(m: int) -> List[Tuple[int, float]]:
+            if m < len(positive):
+                top = positive[np.argpartition(-similarities[positive], m - 1)[:m]]
+            else:
+                top = positive
+            top = top[np.argsort(-similarities[top], kind='stable')]
+            return [(int(idx), float(similarities[idx])) for idx in top]
+
+        return fetch
+
+    def _lsa_fetcher(self, query: str, candidates: Optional[np.ndarray] = None):
+        """Project the query into LSA space and search the ANN index"""
+        embedding = _dense_column(normalize(self.vectorizer.transform([query])) @ self.lsa_components.T)
+        norm = np.linalg.norm(embedding)
+        if norm == 0:
+            return lambda m: []
+        embedding = embedding / norm
+
+        return lambda m: self.ann.search(embedding, m, candidates=candidates)
+
+    def _top_documents(self, fetch, k: int) -> List[Tuple[int, int, float]]:
+        """Aggregate ranked passages into the top-k documents
+
+        Fetches a few passages per requested document and widens the window
+        only when many of the best passages belong to the same document.
+
+        Returns:
+            List of (doc_idx, best_passage_idx, score)
+        """
+        m = max(k * PASSAGE_FETCH_FACTOR, k)
+        while True:
+            ranked = fetch(m)
+            seen = set()
+            top = []
+            for passage_idx, score in ranked:
+                if score <= 0:  # Only include results with positive similarity
+                    break
+                doc_idx = int(self.passage_doc[passage_idx])
+                if doc_idx not in seen:
+                    seen.add(doc_idx)
+                    top.append((doc_idx, passage_idx, score))
+                    if len(top) == k:
+                        return top
+            if len(ranked) < m:
+                return top
+            m *= PASSAGE_FETCH_FACTOR
+
+    def _snippet(self, doc_idx: int, passage_idx: int) -> str:
+        """Snippet text for a document's best-matching passage"""
+        text = self.documents[doc_idx].get('text', '')
+
+        if not self.has_passages:
+            # Create snippet from text (first 200 chars)
+            return text[:200] + '...' if len(text) > 200 else text
+
+        start = int(self.passage_start[passage_idx])
+        end = int(self.passage_end[passage_idx])
+        snippet = text[start:end]
+        if start > 0:
+            snippet = '...' + snippet
+        if end < len(text):
+            snippet += '...'
+        return snippet
+
     def get_document_by_slug(self, slug: str) -> Optional[Dict[str, Any]]:
         """Get a specific document by slug"""
-        for doc in self.documents:
-            if doc.get('slug') == slug:
-                return doc
-        return None
+        doc_idx = self.slug_to_id.get(slug)
+        return self.documents[doc_idx] if doc_idx is not None else None
 
     def list_all_documents(self) -> List[Dict[str, Any]]:
         """Get all available documents"""
@@ -109,48 +468,308 @@ class RAGSearcher:
             'tech': doc.get('tech', [])
         } for doc in self.documents]
 
-# Global searcher instance
-rag_searcher = RAGSearcher()
+def _dense_column(product) -> np.ndarray:
+    """Flatten a (rows x 1) sparse or dense product into a 1-D array"""
+    return np.asarray(product.todense() if sparse.issparse(product) else product).ravel()
 
-def search(query: str, k: int = 4) -> List[Dict[str, Any]]:
-    """Convenience function for searching"""
-    return rag_searcher.search(query, k)
+def _document_text(doc: Dict[str, Any]) -> str:
+    """Text used for lexical indexing of a document"""
+    if doc.get('combined_text'):
+        return doc['combined_text']
+    return f"{doc.get('title', '')}. {doc.get('description', '')}. {doc.get('text', '')}"
+
+def vectorizer_path(index_file: Path) -> Path:
+    """Location of the pickled vectorizer that accompanies an index file"""
+    return index_file.with_name(index_file.stem + '_vectorizer.pkl')
+
+def lsa_path(index_file: Path) -> Path:
+    """Location of the LSA embeddings and IVF arrays that accompany an index file"""
+    return index_file.with_name(index_file.stem + '_lsa.npz')
+
+class RAGIndexManager:
+    """Owns the active RAGSearcher and swaps it atomically on reload
+
+    Reloads build a complete new searcher on a background thread and only
+    replace the reference once it validates. Callers grab the reference
+    once per search, so in-flight searches finish on the version they
+    started with and nothing waits on a reload.
+    """
+
+    def __init__(self, index_path: Optional[str] = None, mode: Optional[str] = None):
+        self._index_path = Path(index_path) if index_path else None
+        self.mode = mode
+        self.searcher = RAGSearcher(str(self.index_path), mode=mode)
+        self.last_error = None
+        self.reloads = 0
+
+        self._reload_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._watcher = None
+        self._fingerprint = self._file_fingerprint()
+        self._rejected_fingerprint = None  # Files of the last rejected build, not retried by the watcher
+
+    @property
+    def index_path(self) -> Path:
+        """Configured index, or the default one resolved per load so a first streamed build is picked up"""
+        return self._index_path or default_index_path()
+
+    def _file_fingerprint(self) -> Tuple:
+        """mtime/size of the index files, used to detect new builds"""
+        fingerprint = []
+        for path in (self.index_path, vectorizer_path(self.index_path), lsa_path(self.index_path)):
+            try:
+                stat = path.stat()
+                fingerprint.append((stat.st_mtime_ns, stat.st_size))
+            except OSError:
+                fingerprint.append(None)
+        return tuple(fingerprint)
+
+    def reload(self, wait: bool = False) -> bool:
+        """Load the index in the background and swap it in if valid
+
+        Args:
+            wait: Block until the reload finishes (used by tests and scripts)
+
+        Returns:
+            False if a reload was already running, True otherwise
+        """
+        if not self._reload_lock.acquire(blocking=False):
+            return False
 
-def augment_prompt_with_context(base_prompt: str, query: str, k: int = 4) -> str:
+        thread = threading.Thread(target=self._reload, name="rag-reload", daemon=True)
+        thread.start()
+        if wait:
+            thread.join()
+        return True
+
+    def _reload(self):
+        fingerprint = None
+        try:
+            fingerprint = self._file_fingerprint()
+            candidate = RAGSearcher(str(self.index_path), mode=self.mode)
+            problems = candidate.validate()
+
+            if problems:
+                self.last_error = "; ".join(problems)
+                self._rejected_fingerprint = fingerprint
+                print(f"RAG reload rejected, keeping version {self.searcher.version}: {self.last_error}")
+                return
+
+            previous = self.searcher.version
+            self.searcher = candidate  # Single reference assignment: atomic swap
+            self._fingerprint = fingerprint
+            self._rejected_fingerprint = None
+            self.last_error = None
+            self.reloads += 1
+            print(f"RAG index reloaded: {previous} -> {candidate.version}")
+        except Exception as e:
+            self.last_error = str(e)
+            self._rejected_fingerprint = fingerprint
+            print(f"RAG reload failed: {e}")
+        finally:
+            self._reload_lock.release()
+
+    def start_watching(self, interval: float):
+        """Poll the index files and reload when a new build lands
+
+        A build that was rejected is tried once; the watcher waits for the
+        files to change again rather than reloading it every interval.
+        """
+        if interval <= 0 or self._watcher is not None:
+            return
+
+        self._stop.clear()
+
+        def watch():
+            while not self._stop.wait(interval):
+                fingerprint = self._file_fingerprint()
+                if fingerprint != self._fingerprint and fingerprint != self._rejected_fingerprint:
+                    self.reload(wait=True)
+
+        self._watcher = threading.Thread(target=watch, name="rag-watcher", daemon=True)
+        self._watcher.start()
+        print(f"Watching RAG index {self.index_path} every {interval}s")
+
+    def stop_watching(self):
+        """Stop the file watcher thread"""
+        self._stop.set()
+        if self._watcher is not None:
+            self._watcher.join(timeout=5)
+            self._watcher = None
+
+    def status(self) -> Dict[str, Any]:
+        """Active index version and reload state for /health"""
+        return {
+            **self.searcher.status(),
+            'reloading': self._reload_lock.locked(),
+            'reloads': self.reloads,
+            'last_error': self.last_error,
+        }
+
+# Global index manager; always read `rag_index.searcher` at call time
+rag_index = RAGIndexManager()
+
+def get_searcher() -> RAGSearcher:
+    """Currently active searcher"""
+    return rag_index.searcher
+
+def search(query: str, k: int = 4, filters: Optional[Dict[str, List[str]]] = None) -> List[Dict[str, Any]]:
+    """Convenience function for searching"""
+    return rag_index.searcher.search(query, k, filters=filters)
+
+# Project context framing; its token cost is counted once
+CONTEXT_HEADER = ["\n### Project Context", "Here are relevant details from Surya's projects:", ""]
+CONTEXT_FOOTER = "Use this context to provide specific, accurate information about the projects. Always cite the project titles when referencing them."
+CONTEXT_FRAME_TOKENS = count_tokens("\n".join(CONTEXT_HEADER + [CONTEXT_FOOTER]))
+
+# Rendered context blocks per index version and document, so documents that
+# keep coming back are not re-formatted and re-counted on every request
+CONTEXT_BLOCK_CACHE_SIZE = 512
+_context_blocks: "OrderedDict[Tuple, Optional[Tuple[str, int]]]" = OrderedDict()
+_context_lock = threading.Lock()
+
+def _context_block(version: Optional[str], rank: int, doc: Dict[str, Any],
+                   remaining: Optional[int]) -> Optional[Tuple[str, int]]:
+    """One document's context block and its token cost, or None if it does not fit in `remaining`"""
+    tech = doc.get('tech', [])
+    key = (version, rank, doc['slug'], doc['title'], tuple(tech), doc['snippet'], remaining)
+    with _context_lock:
+        if key in _context_blocks:
+            _context_blocks.move_to_end(key)
+            return _context_blocks[key]
+
+    block = [f"{rank}. **{doc['title']}** ({doc['slug']})"]
+    if tech:
+        block.append(f"   Technologies: {', '.join(tech)}")
+
+    snippet = doc['snippet']
+    rendered = None
+    room = remaining - count_tokens("\n".join(block)) - 3 if remaining is not None else None
+    if room is None or room >= MIN_SNIPPET_TOKENS:
+        if room is not None:
+            snippet = truncate_to_tokens(snippet, room)
+        block.append(f"   {snippet}")
+        block.append("")
+        text = "\n".join(block)
+        rendered = (text, count_tokens(text) + 1)
+
+    with _context_lock:
+        _context_blocks[key] = rendered
+        while len(_context_blocks) > CONTEXT_BLOCK_CACHE_SIZE:
+            _context_blocks.popitem(last=False)
+    return rendered
+
+def augment_prompt_with_context(base_prompt: str, query: str, k: int = 4,
+                                filters: Optional[Dict[str, List[str]]] = None,
+                                max_tokens: Optional[int] = None) -> str:
     """Augment a prompt with RAG context
 
     Args:
         base_prompt: Base system prompt
         query: User query to search for
         k: Number of documents to include
+        filters: Optional facet filters restricting which documents are searched
+        max_tokens: Cap on the context block (defaults to RAG_CONTEXT_TOKENS, 0 = no cap);
+            lower-ranked documents are shortened or left out to fit
 
     Returns:
         Augmented prompt with project context
     """
-    results = search(query, k)
+    version = rag_index.searcher.version
+    results = search(query, k, filters=filters)
 
     if not results:
         return base_prompt
 
+    max_tokens = prompt_budget.RAG_CONTEXT_TOKENS if max_tokens is None else max_tokens
+
     # Build context section
-    context_lines = ["\n### Project Context"]
-    context_lines.append("Here are relevant details from Surya's projects:")
-    context_lines.append("")
+    remaining = max_tokens - CONTEXT_FRAME_TOKENS if max_tokens > 0 else None
 
+    context_lines = list(CONTEXT_HEADER)
     for i, doc in enumerate(results, 1):
-        title = doc['title']
-        snippet = doc['snippet']
-        slug = doc['slug']
-        tech = doc.get('tech', [])
-
-        context_lines.append(f"{i}. **{title}** ({slug})")
-        if tech:
-            context_lines.append(f"   Technologies: {', '.join(tech)}")
-        context_lines.append(f"   {snippet}")
-        context_lines.append("")
+        rendered = _context_block(version, i, doc, remaining)
+        if rendered is None:
+            break
+        text, tokens = rendered
+        context_lines.append(text)
+        if remaining is not None:
+            remaining -= tokens
+
+    if len(context_lines) == len(CONTEXT_HEADER):
+        return base_prompt
 
-    context_lines.append("Use this context to provide specific, accurate information about the projects. Always cite the project titles when referencing them.")
+    context_lines.append(CONTEXT_FOOTER)
 
     context = "\n".join(context_lines)
 
     return f"{base_prompt}\n\n{context}"
+
+# Dedicated pool for retrieval so scoring never runs on the event loop.
+# numpy/scipy release the GIL in their kernels, so a couple of threads is enough.
+RAG_MAX_WORKERS = int(os.getenv("RAG_MAX_WORKERS", "2"))
+RAG_MAX_PENDING = int(os.getenv("RAG_MAX_PENDING", "32"))
+RAG_TIMEOUT_SECONDS = float(os.getenv("RAG_TIMEOUT_MS", "300")) / 1000
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+_pending = 0
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=RAG_MAX_WORKERS, thread_name_prefix="rag")
+        return _executor
+
+def _reserve_slot() -> bool:
+    """Bound queued + running retrievals so a burst cannot build an unbounded backlog"""
+    global _pending
+    with _executor_lock:
+        if _pending >= RAG_MAX_PENDING:
+            return False
+        _pending += 1
+        return True
+
+def _release_slot(_future=None):
+    global _pending
+    with _executor_lock:
+        _pending -= 1
+
+async def _run_in_pool(func, *args, timeout: Optional[float]):
+    """Run a retrieval call on the RAG pool with a deadline
+
+    Raises:
+        asyncio.TimeoutError: If the deadline passes or the pool is saturated
+    """
+    if not _reserve_slot():
+        raise asyncio.TimeoutError("RAG pool saturated")
+
+    future = _get_executor().submit(func, *args)
+    future.add_done_callback(_release_slot)
+    return await asyncio.wait_for(asyncio.wrap_future(future), timeout)
+
+async def search_async(query: str, k: int = 4, filters: Optional[Dict[str, List[str]]] = None,
+                       timeout: Optional[float] = None) -> List[Dict[str, Any]]:
+    """Search on the RAG thread pool; returns no results if the deadline passes"""
+    try:
+        return await _run_in_pool(search, query, k, filters,
+                                  timeout=RAG_TIMEOUT_SECONDS if timeout is None else timeout)
+    except asyncio.TimeoutError:
+        print("RAG search exceeded deadline, returning no results")
+        return []
+
+async def augment_prompt_with_context_async(base_prompt: str, query: str, k: int = 4,
+                                            filters: Optional[Dict[str, List[str]]] = None,
+                                            timeout: Optional[float] = None) -> str:
+    """Async `augment_prompt_with_context` that keeps scoring off the event loop
+
+    Falls back to the base prompt if retrieval does not finish within the
+    per-call deadline (RAG_TIMEOUT_MS by default).
+    """
+    try:
+        return await _run_in_pool(augment_prompt_with_context, base_prompt, query, k, filters,
+                                  timeout=RAG_TIMEOUT_SECONDS if timeout is None else timeout)
+    except asyncio.TimeoutError:
+        print("RAG retrieval exceeded deadline, using base prompt")
+        return base_prompt
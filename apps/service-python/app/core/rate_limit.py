@@ -0,0 +1,491 @@
+"""Per-client rate limiting with O(1) checks and a bounded key table
+
+Two algorithms, both keeping a few numbers per key instead of one
+timestamp per request:
+
+    sliding_window  counts for the current and previous fixed window; the
+                    previous one is weighted by how much of it still falls
+                    inside the sliding window (a close, smooth estimate of
+                    a true sliding log that assumes the previous window's
+                    requests were spread evenly, so a burst can take up to
+                    two windows to clear)
+    token_bucket    `limit` tokens refilled evenly over `window` seconds;
+                    allows bursts up to `limit`, then a steady rate
+
+Keys live in an LRU table of at most RATE_LIMIT_MAX_KEYS entries. When a
+new key arrives, entries at the cold end that have gone idle (their state
+is equivalent to a fresh key's) are dropped, and if the table is still
+full the least recently seen key is evicted, so memory stays bounded
+however many distinct clients show up.
+
+`SharedRateLimiter` makes a limit hold across workers and replicas: each
+key's requests are added to per-window counters in KV (an expiring INCRBY
+per key and window) in periodic batches, and every decision is made
+locally from the totals the last sync returned, so no request waits on
+KV. When KV is not configured or stops answering, the local limiter
+alone decides.
+
+Every decision carries X-RateLimit-Limit/-Remaining/-Reset headers, plus
+Retry-After when the request is refused. `RateLimit` wraps a limiter for
+use in any route, as a FastAPI dependency or by calling `check`.
+"""
+
+import asyncio
+import heapq
+import math
+import os
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple, Union
+
+from fastapi import HTTPException, Request, Response
+
+from .kv import kv
+
+RATE_LIMIT_ALGORITHMS = ("sliding_window", "token_bucket")
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", "100000"))
+
+# /ai/chat: CHAT_RATE_LIMIT requests per CHAT_RATE_WINDOW seconds per client IP (0 disables)
+CHAT_RATE_LIMIT = int(os.getenv("CHAT_RATE_LIMIT", "20"))
+CHAT_RATE_WINDOW = float(os.getenv("CHAT_RATE_WINDOW", "600"))
+CHAT_RATE_ALGORITHM = os.getenv("CHAT_RATE_ALGORITHM", "sliding_window").lower()
+
+# Shared limits: seconds between KV syncs, most keys written per sync, and
+# seconds to decide locally after KV fails before trying it again
+RATE_LIMIT_SYNC_INTERVAL = float(os.getenv("RATE_LIMIT_SYNC_INTERVAL", "1"))
+RATE_LIMIT_SYNC_BATCH = int(os.getenv("RATE_LIMIT_SYNC_BATCH", "200"))
+RATE_LIMIT_KV_RETRY = float(os.getenv("RATE_LIMIT_KV_RETRY", "30"))
+
+# Idle entries dropped from the cold end of the table per new key
+EVICT_BATCH = 2
+
+
+class RateLimitDecision(NamedTuple):
+    allowed: bool
+    limit: int
+    remaining: int
+    reset_after: float  # Seconds until the window resets / the bucket is full again
+    retry_after: float  # Seconds until a refused request would be allowed (0 when allowed)
+
+    def headers(self) -> Dict[str, str]:
+        if not self.limit:
+            return {}  # Limit disabled
+        headers = {
+            "X-RateLimit-Limit": str(self.limit),
+            "X-RateLimit-Remaining": str(self.remaining),
+            "X-RateLimit-Reset": str(math.ceil(self.reset_after)),
+        }
+        if not self.allowed:
+            headers["Retry-After"] = str(max(1, math.ceil(self.retry_after)))
+        return headers
+
+
+# Decision for every request when the limit is 0 (disabled); sends no headers
+UNLIMITED = RateLimitDecision(True, 0, 0, 0.0, 0.0)
+
+
+class RateLimiter(ABC):
+    """`limit` requests per `window` seconds per key, over a bounded LRU table
+
+    Subclasses keep their per-key state in a small list and implement
+    `_new_state`, `_hit` and `_idle`. A limit of 0 disables the limiter:
+    every request is allowed and no keys are kept.
+    """
+
+    algorithm = ""
+
+    def __init__(self, limit: int, window: float, max_keys: int = RATE_LIMIT_MAX_KEYS):
+        if limit < 0 or window <= 0:
+            raise ValueError(f"Rate limit needs limit >= 0 and window > 0, got {limit} per {window}s")
+        self.limit = limit
+        self.window = window
+        self.max_keys = max(1, max_keys)
+        self._table: "OrderedDict[str, List[float]]" = OrderedDict()
+        self.allowed = 0
+        self.refused = 0
+        self.evicted_idle = 0
+        self.evicted_active = 0
+
+    def hit(self, key: str, now: Optional[float] = None) -> RateLimitDecision:
+        """Count one request for `key` and decide whether it may proceed
+
+        Args:
+            now: Monotonic time in seconds (defaults to time.monotonic())
+        """
+        if not self.limit:
+            self.allowed += 1
+            return UNLIMITED
+        now = time.monotonic() if now is None else now
+        table = self._table
+        state = table.get(key)
+        if state is None:
+            self._make_room(now)
+            state = table[key] = self._new_state(now)
+        else:
+            table.move_to_end(key)
+
+        decision = self._hit(state, now)
+        if decision.allowed:
+            self.allowed += 1
+        else:
+            self.refused += 1
+        return decision
+
+    def _make_room(self, now: float):
+        table = self._table
+        for _ in range(EVICT_BATCH):
+            if not table:
+                return
+            key, state = next(iter(table.items()))
+            if not self._idle(state, now):
+                break
+            del table[key]
+            self.evicted_idle += 1
+        if len(table) >= self.max_keys:
+            # Full of active keys: forget the least recently seen one
+            table.popitem(last=False)
+            self.evicted_active += 1
+
+    @abstractmethod
+    def _new_state(self, now: float) -> List[float]:
+        """Per-key state for a key first seen at `now`"""
+
+    @abstractmethod
+    def _hit(self, state: List[float], now: float) -> RateLimitDecision:
+        """Count one request against `state` (updating it) and decide"""
+
+    @abstractmethod
+    def _idle(self, state: List[float], now: float) -> bool:
+        """Whether `state` is equivalent to a fresh key's, so it can be dropped"""
+
+    def clear(self):
+        self._table.clear()
+
+    def __len__(self) -> int:
+        return len(self._table)
+
+    def status(self) -> Dict[str, object]:
+        return {
+            'algorithm': self.algorithm,
+            'limit': self.limit,
+            'window_seconds': self.window,
+            'keys': len(self._table),
+            'max_keys': self.max_keys,
+            'allowed': self.allowed,
+            'refused': self.refused,
+            'evicted_idle': self.evicted_idle,
+            'evicted_active': self.evicted_active,
+        }
+
+
+class SlidingWindowCounter(RateLimiter):
+    """Sliding-window estimate from two fixed-window counts: [window start, previous, current]"""
+
+    algorithm = "sliding_window"
+
+    def _new_state(self, now: float) -> List[float]:
+        return [now, 0, 0]
+
+    def _hit(self, state: List[float], now: float) -> RateLimitDecision:
+        window = self.window
+        elapsed = now - state[0]
+        if elapsed >= window:
+            # Roll forward; a count older than one full window no longer matters
+            state[1] = state[2] if elapsed < 2 * window else 0
+            state[2] = 0
+            state[0] = now - elapsed % window
+            elapsed %= window
+
+        previous, current = state[1], state[2]
+        weight = (window - elapsed) / window
+        estimate = previous * weight + current
+        reset_after = window - elapsed
+
+        if estimate + 1 <= self.limit:
+            state[2] = current + 1
+            remaining = int(self.limit - (estimate + 1))
+            return RateLimitDecision(True, self.limit, remaining, reset_after, 0.0)
+
+        if current + 1 <= self.limit:
+            # Wait for the previous window's share to decay enough
+            retry_after = window - (self.limit - 1 - current) * window / previous - elapsed
+        else:
+            # Only once this window is the previous one and has partly slid out
+            retry_after = reset_after + window * (1 - (self.limit - 1) / current)
+        return RateLimitDecision(False, self.limit, 0, reset_after, max(0.0, retry_after))
+
+    def _idle(self, state: List[float], now: float) -> bool:
+        return now - state[0] >= 2 * self.window
+
+
+class TokenBucket(RateLimiter):
+    """`limit` tokens refilled at limit/window per second: [tokens, last refill]"""
+
+    algorithm = "token_bucket"
+
+    def _new_state(self, now: float) -> List[float]:
+        return [float(self.limit), now]
+
+    def _hit(self, state: List[float], now: float) -> RateLimitDecision:
+        rate = self.limit / self.window
+        tokens = min(float(self.limit), state[0] + (now - state[1]) * rate)
+        state[1] = now
+
+        if tokens >= 1:
+            tokens -= 1
+            state[0] = tokens
+            return RateLimitDecision(True, self.limit, int(tokens), (self.limit - tokens) / rate, 0.0)
+
+        state[0] = tokens
+        return RateLimitDecision(False, self.limit, 0, (self.limit - tokens) / rate, (1 - tokens) / rate)
+
+    def _idle(self, state: List[float], now: float) -> bool:
+        return state[0] + (now - state[1]) * self.limit / self.window >= self.limit
+
+
+class SharedRateLimiter:
+    """A limiter whose counts are shared through KV with other processes
+
+    Requests are counted in fixed windows aligned to wall-clock time, so
+    every worker and replica agrees on the KV key for a window. For each
+    client the limiter keeps the totals its last sync saw for the previous
+    and current window, plus its own requests not yet sent, and estimates
+    the sliding-window count from them as SlidingWindowCounter does. The
+    local limiter runs as well and is all that decides while KV is off.
+
+    Counts written to KV lag by at most `interval` seconds, so a client
+    spreading requests over several workers can exceed the limit by about
+    what it sends in one interval before every worker sees the total.
+    """
+
+    def __init__(self, local: RateLimiter, name: str, interval: float = RATE_LIMIT_SYNC_INTERVAL,
+                 batch: int = RATE_LIMIT_SYNC_BATCH, retry: float = RATE_LIMIT_KV_RETRY):
+        self.local = local
+        self.limit = local.limit
+        self.window = local.window
+        self.name = name
+        self.interval = interval
+        self.batch = max(1, batch)
+        self.retry = retry
+        self._shared = SlidingWindowCounter(local.limit, local.window)
+        # key -> [window index, previous window total, current window total] as last synced
+        self._views: "OrderedDict[str, List[int]]" = OrderedDict()
+        # (key, window index) -> requests not yet written to KV
+        self._pending: Dict[Tuple[str, int], int] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._retry_at = 0.0
+        self.refused = 0
+        self.syncs = 0
+        self.writes = 0
+        self.failures = 0
+
+    @property
+    def shared(self) -> bool:
+        """Whether decisions currently use the KV totals"""
+        return kv.enabled and time.monotonic() >= self._retry_at
+
+    def hit(self, key: str, now: Optional[float] = None) -> RateLimitDecision:
+        """Count one request for `key` and decide whether it may proceed
+
+        Args:
+            now: Simulated time in seconds for both clocks. By default KV
+                windows follow time.time() and the local limiter keeps its
+                own time.monotonic(), so clock steps cannot skew it.
+        """
+        if not self.limit or not self.shared:
+            return self.local.hit(key, now)
+
+        wall = time.time() if now is None else now
+        index = int(wall // self.window)
+        view = self._view(key, index)
+        pending = self._pending
+        state = [index * self.window,
+                 view[1] + pending.get((key, index - 1), 0),
+                 view[2] + pending.get((key, index), 0)]
+        shared = self._shared._hit(state, wall)
+        if not shared.allowed:
+            self.refused += 1
+            return shared
+
+        decision = self.local.hit(key, now)
+        if not decision.allowed:
+            return decision
+        if (key, index) in pending or len(pending) < self.local.max_keys:
+            pending[(key, index)] = pending.get((key, index), 0) + 1
+            self._start_sync()
+        return shared if shared.remaining < decision.remaining else decision
+
+    def _view(self, key: str, index: int) -> List[int]:
+        views = self._views
+        view = views.get(key)
+        if view is None:
+            if len(views) >= self.local.max_keys:
+                views.popitem(last=False)
+            view = views[key] = [index, 0, 0]
+        else:
+            views.move_to_end(key)
+            if view[0] != index:
+                view[1] = view[2] if view[0] == index - 1 else 0
+                view[2] = 0
+                view[0] = index
+        return view
+
+    def _start_sync(self):
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return  # No loop (sync caller): written by the next sync
+        if self._task is None or self._task.done() or self._loop is not loop:
+            self._loop = loop
+            self._task = loop.create_task(self._run())
+
+    async def _run(self):
+        while self._pending:
+            await asyncio.sleep(self.interval)
+            await self.sync()
+
+    def _kv_key(self, key: str, index: int) -> str:
+        return f"ratelimit:{self.name}:{key}:{index}"
+
+    async def sync(self, now: Optional[float] = None):
+        """Write pending counts to KV and take the returned totals as the shared view
+
+        At most `batch` keys are written, those closest to the limit first
+        (last known total plus pending); the rest wait for the next sync.
+        Counts for windows that no longer affect a decision are dropped.
+        Nothing is written while waiting to retry a failed KV.
+        """
+        if not self._pending or not kv.enabled:
+            self._pending.clear()
+            return
+        now = time.time() if now is None else now
+        oldest = int(now // self.window) - 1
+        live = [(slot, count) for slot, count in self._pending.items() if slot[1] >= oldest]
+        if not self.shared:
+            self._pending = dict(live)
+            return
+        batch = heapq.nlargest(self.batch, live, key=self._priority) if len(live) > self.batch else live
+        sent = dict(batch)
+        self._pending = {slot: count for slot, count in live if slot not in sent}
+
+        expire = math.ceil(2 * self.window)
+        try:
+            totals = await asyncio.gather(*(kv.incr_ex(self._kv_key(key, index), count, expire)
+                                            for (key, index), count in batch))
+        except asyncio.CancelledError:
+            # Interrupted (shutdown): keep the counts for the final sync
+            self._requeue(batch)
+            raise
+
+        self.syncs += 1
+        failed = [(slot, count) for (slot, count), total in zip(batch, totals) if total is None]
+        for ((key, index), _), total in zip(batch, totals):
+            if total is not None:
+                self._update_view(key, index, total)
+        self.writes += len(batch) - len(failed)
+        if failed:
+            self._requeue(failed)
+            self.failures += 1
+            self._retry_at = time.monotonic() + self.retry
+            print(f"Rate limit '{self.name}': KV sync failed for {len(failed)} key(s), "
+                  f"deciding locally for {self.retry:g}s")
+
+    def _priority(self, item: Tuple[Tuple[str, int], int]) -> int:
+        (key, index), count = item
+        view = self._views.get(key)
+        return count + (view[2] if view is not None and view[0] == index else 0)
+
+    def _requeue(self, items: List[Tuple[Tuple[str, int], int]]):
+        for slot, count in items:
+            self._pending[slot] = self._pending.get(slot, 0) + count
+
+    def _update_view(self, key: str, index: int, total: int):
+        view = self._views.get(key)
+        if view is None:
+            return
+        if view[0] == index:
+            view[2] = max(view[2], total)
+        elif view[0] == index + 1:
+            view[1] = max(view[1], total)
+
+    async def close(self):
+        """Stop the background sync and write what is pending"""
+        task, self._task = self._task, None
+        if task is not None and not task.done() and self._loop is asyncio.get_running_loop():
+            task.cancel()
+            await asyncio.wait((task,))
+        await self.sync()
+
+    def clear(self):
+        self.local.clear()
+        self._views.clear()
+        self._pending.clear()
+        self._retry_at = 0.0
+
+    def __len__(self) -> int:
+        return len(self.local)
+
+    def status(self) -> Dict[str, object]:
+        status = self.local.status()
+        status['shared'] = {
+            'kv': self.shared,
+            'views': len(self._views),
+            'pending_keys': len(self._pending),
+            'refused': self.refused,
+            'syncs': self.syncs,
+            'writes': self.writes,
+            'failures': self.failures,
+        }
+        return status
+
+
+def create_limiter(algorithm: str, limit: int, window: float,
+                   max_keys: int = RATE_LIMIT_MAX_KEYS) -> RateLimiter:
+    """Limiter for an algorithm name from RATE_LIMIT_ALGORITHMS (unknown names fall back to sliding_window)"""
+    if algorithm == "token_bucket":
+        return TokenBucket(limit, window, max_keys)
+    if algorithm != "sliding_window":
+        print(f"Unknown rate limit algorithm '{algorithm}', using 'sliding_window'")
+    return SlidingWindowCounter(limit, window, max_keys)
+
+
+def client_ip(request: Request) -> str:
+    return request.client.host if request.client else "unknown"
+
+
+class RateLimit:
+    """Enforce a limiter on a route, keyed per client IP by default
+
+    Use as `dependencies=[Depends(RateLimit(limiter))]`, which also sets
+    the X-RateLimit-* headers on the route's response, or call `check`
+    inside a handler that builds its own Response.
+    """
+
+    def __init__(self, limiter: Union[RateLimiter, SharedRateLimiter], key: Callable[[Request], str] = client_ip,
+                 detail: str = "Rate limit exceeded. Try again in a few minutes."):
+        self.limiter = limiter
+        self.key = key
+        self.detail = detail
+
+    def check(self, request: Request) -> RateLimitDecision:
+        """Count the request; returns the decision to attach as headers
+
+        Raises:
+            HTTPException: 429 with Retry-After when the limit is exceeded
+        """
+        decision = self.limiter.hit(self.key(request))
+        if not decision.allowed:
+            raise HTTPException(status_code=429, detail=self.detail, headers=decision.headers())
+        return decision
+
+    async def __call__(self, request: Request, response: Response) -> RateLimitDecision:
+        decision = self.check(request)
+        response.headers.update(decision.headers())
+        return decision
+
+
+# Global rate limit for /ai/chat, shared by all workers when KV is configured
+chat_rate_limit = RateLimit(SharedRateLimiter(
+    create_limiter(CHAT_RATE_ALGORITHM, CHAT_RATE_LIMIT, CHAT_RATE_WINDOW), "chat"))
@@ -0,0 +1,216 @@
+"""Completion cache for repeated chat questions
+
+Many visitors open the chat and send the same starter question. The
+finished token stream of a completion is cached under a hash of the
+mode, the final messages (the system prompt text stands in for its
+version, and carries any RAG context) and the model parameters. A hit is
+replayed through the normal SSE framing, so clients cannot tell it apart
+from a live answer.
+
+Concurrent identical requests share one upstream generation: the first
+starts a flight and everyone, first requester included, follows its
+tokens as they arrive. The flight runs in its own task, so one visitor
+leaving does not cut off the others; it is cancelled only once nobody
+is listening.
+
+Entries are evicted least-recently-used past CHAT_CACHE_SIZE and expire
+after CHAT_CACHE_TTL seconds. With CHAT_CACHE_FILE set, the cache is
+loaded at startup and saved at shutdown.
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+from .index_file import atomic_write
+
+CHAT_CACHE_SIZE = int(os.getenv("CHAT_CACHE_SIZE", "256"))  # 0 disables the cache
+CHAT_CACHE_TTL = float(os.getenv("CHAT_CACHE_TTL", "3600"))
+CHAT_CACHE_FILE = os.getenv("CHAT_CACHE_FILE")
+CHAT_CACHE_MODES = tuple(m.strip() for m in os.getenv("CHAT_CACHE_MODES", "general,resume").split(",") if m.strip())
+
+
+def cache_key(mode: str, messages: List[Dict[str, str]], params: Dict[str, Any]) -> str:
+    """Hash of mode, whitespace-normalized messages and model parameters
+
+    Case is kept: it can change the answer (names, code, acronyms).
+    """
+    normalized = [[m['role'], " ".join(m['content'].split())] for m in messages]
+    blob = json.dumps([mode, normalized, sorted(params.items())], ensure_ascii=False)
+    return hashlib.sha256(blob.encode('utf-8')).hexdigest()
+
+
+class Flight:
+    """One upstream generation shared by every request with the same key"""
+
+    def __init__(self, source: AsyncIterator[str], on_complete: Callable[[List[str]], None],
+                 on_close: Callable[[], None]):
+        self.tokens: List[str] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.subscribers = 0
+        self._changed = asyncio.Event()
+        self._on_complete = on_complete
+        self._on_close = on_close
+        self.task = asyncio.create_task(self._run(source))
+
+    def _wake(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def _run(self, source: AsyncIterator[str]):
+        try:
+            async for token in source:
+                self.tokens.append(token)
+                self._wake()
+            self._on_complete(self.tokens)
+        except asyncio.CancelledError:
+            self.error = ConnectionAbortedError("Generation cancelled")
+            raise
+        except Exception as e:
+            self.error = e
+        finally:
+            self.done = True
+            self._on_close()
+            self._wake()
+
+    async def follow(self) -> AsyncIterator[str]:
+        """Yield every token of the flight, from the first, as it arrives"""
+        self.subscribers += 1
+        index = 0
+        try:
+            while True:
+                while index < len(self.tokens):
+                    yield self.tokens[index]
+                    index += 1
+                if self.done:
+                    if self.error is not None:
+                        raise self.error
+                    return
+                await self._changed.wait()
+        finally:
+            self.subscribers -= 1
+            if self.subscribers == 0 and not self.done:
+                self.task.cancel()
+
+
+class ResponseCache:
+    """LRU + TTL completion cache with single-flight upstream generation"""
+
+    def __init__(self, max_entries: int = CHAT_CACHE_SIZE, ttl: float = CHAT_CACHE_TTL,
+                 path: Optional[str] = CHAT_CACHE_FILE):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.path = Path(path) if path else None
+        self._entries: "OrderedDict[str, Tuple[float, List[str]]]" = OrderedDict()
+        self._flights: Dict[str, Flight] = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def get(self, key: str) -> Optional[List[str]]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        created, tokens = entry
+        if time.time() - created > self.ttl:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return tokens
+
+    def put(self, key: str, tokens: List[str], created: Optional[float] = None):
+        if not tokens or not self.enabled:
+            return
+        self._entries[key] = (created or time.time(), list(tokens))
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def has(self, key: str) -> bool:
+        """Whether `key` would be answered without a new upstream generation"""
+        return key in self._flights or self.get(key) is not None
+
+    def clear(self):
+        self._entries.clear()
+        self.hits = self.misses = self.coalesced = 0
+
+    def stream(self, key: str, generate: Callable[[], AsyncIterator[str]]) -> AsyncIterator[str]:
+        """Tokens for `key`: replayed from cache, joined to an in-flight generation or generated
+
+        Args:
+            key: cache_key() of the request
+            generate: Starts the upstream token stream on a miss
+        """
+        cached = self.get(key)
+        if cached is not None:
+            self.hits += 1
+            return self._replay(cached)
+
+        flight = self._flights.get(key)
+        if flight is not None:
+            self.coalesced += 1
+        else:
+            self.misses += 1
+            flight = Flight(generate(),
+                            on_complete=lambda tokens: self.put(key, tokens),
+                            on_close=lambda: self._flights.pop(key, None))
+            self._flights[key] = flight
+        return flight.follow()
+
+    @staticmethod
+    async def _replay(tokens: List[str]) -> AsyncIterator[str]:
+        for token in tokens:
+            yield token
+
+    def load(self):
+        """Read unexpired entries from CHAT_CACHE_FILE"""
+        if self.path is None or not self.path.exists():
+            return
+        try:
+            stored = json.loads(self.path.read_text(encoding='utf-8'))
+        except (OSError, ValueError) as e:
+            print(f"Could not load chat cache {self.path}: {e}")
+            return
+        now = time.time()
+        for key, entry in stored.get('entries', {}).items():
+            if now - entry['created'] <= self.ttl:
+                self.put(key, entry['tokens'], created=entry['created'])
+        print(f"Loaded {len(self._entries)} cached chat responses")
+
+    def save(self):
+        """Write the cache to CHAT_CACHE_FILE (temp file + rename)"""
+        if self.path is None:
+            return
+        entries = {key: {'created': created, 'tokens': tokens}
+                   for key, (created, tokens) in self._entries.items()}
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            atomic_write(self.path, lambda f: json.dump({'entries': entries}, f, ensure_ascii=False),
+                         mode='w', encoding='utf-8')
+        except OSError as e:
+            print(f"Could not save chat cache {self.path}: {e}")
+
+    def status(self) -> Dict[str, Any]:
+        """Size and hit counters for /health"""
+        return {
+            'enabled': self.enabled,
+            'entries': len(self._entries),
+            'in_flight': len(self._flights),
+            'hits': self.hits,
+            'misses': self.misses,
+            'coalesced': self.coalesced,
+        }
+
+
+# Global completion cache
+response_cache = ResponseCache()
@@ -0,0 +1,131 @@
+"""Read-only array bundles shared between worker processes through mmap
+
+Each uvicorn worker imports the app separately. Instead of every worker
+holding its own copy of the index arrays, the first process to load an
+index version writes them to one flat bundle file and every process maps
+that file read-only. The OS page cache then backs all workers with a
+single copy, so adding workers adds almost no index memory.
+
+Layout: MAGIC | u64 header length | JSON header | 64-byte aligned arrays.
+"""
+
+import json
+import mmap
+import os
+import struct
+from pathlib import Path
+from typing import Any, Callable, Dict, Tuple
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows dev machines: no cross-process lock, no sharing
+    fcntl = None
+
+MAGIC = b"RAGARR01"
+ALIGNMENT = 64
+
+Arrays = Dict[str, np.ndarray]
+
+
+def _align(offset: int) -> int:
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def write_bundle(path: Path, arrays: Arrays, meta: Dict[str, Any]):
+    """Write arrays to a bundle file atomically (temp file + rename)"""
+    entries = {}
+    offset = 0
+    for name, array in arrays.items():
+        array = np.ascontiguousarray(array)
+        offset = _align(offset)
+        entries[name] = {'dtype': array.dtype.str, 'shape': list(array.shape), 'offset': offset}
+        offset += array.nbytes
+
+    header = json.dumps({'arrays': entries, 'meta': meta}).encode('utf-8')
+    data_start = _align(len(MAGIC) + 8 + len(header))
+
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    with open(tmp_path, 'wb') as f:
+        f.write(MAGIC + struct.pack('<Q', len(header)) + header)
+        for name, array in arrays.items():
+            f.seek(data_start + entries[name]['offset'])
+            f.write(np.ascontiguousarray(array).tobytes())
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def open_bundle(path: Path) -> Tuple[Arrays, Dict[str, Any]]:
+    """Map a bundle file read-only and return zero-copy array views"""
+    with open(path, 'rb') as f:
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    if buffer[:len(MAGIC)] != MAGIC:
+        raise ValueError(f"{path} is not a RAG array bundle")
+    (header_len,) = struct.unpack('<Q', buffer[len(MAGIC):len(MAGIC) + 8])
+    header = json.loads(buffer[len(MAGIC) + 8:len(MAGIC) + 8 + header_len])
+    data_start = _align(len(MAGIC) + 8 + header_len)
+
+    arrays = {}
+    for name, entry in header['arrays'].items():
+        dtype = np.dtype(entry['dtype'])
+        count = int(np.prod(entry['shape'], dtype=np.int64))
+        if count == 0:
+            arrays[name] = np.empty(entry['shape'], dtype=dtype)
+            continue
+        arrays[name] = np.frombuffer(buffer, dtype=dtype, count=count,
+                                     offset=data_start + entry['offset']).reshape(entry['shape'])
+    return arrays, header['meta']
+
+
+def shared_dir(index_file: Path) -> Path:
+    """Directory holding bundles (RAG_SHARED_DIR, e.g. /dev/shm/portfolio-rag)"""
+    configured = os.getenv("RAG_SHARED_DIR")
+    return Path(configured) if configured else index_file.parent / ".rag_shared"
+
+
+def sharing_enabled() -> bool:
+    return fcntl is not None and os.getenv("RAG_SHARED_MEMORY", "true").lower() == "true"
+
+
+def attach_or_build(bundle_path: Path, build: Callable[[], Tuple[Arrays, Dict[str, Any]]]
+                    ) -> Tuple[Arrays, Dict[str, Any], bool]:
+    """Attach to an existing bundle, or build and publish it exactly once
+
+    Concurrent workers serialize on a lock file; the first one builds,
+    the rest find the finished bundle and map it.
+
+    Returns:
+        Tuple of (arrays, meta, attached) where attached is False if this
+        process built the bundle
+    """
+    bundle_path.parent.mkdir(parents=True, exist_ok=True)
+    lock_path = bundle_path.with_name(bundle_path.name + ".lock")
+
+    with open(lock_path, 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            if bundle_path.exists():
+                arrays, meta = open_bundle(bundle_path)
+                return arrays, meta, True
+
+            arrays, meta = build()
+            write_bundle(bundle_path, arrays, meta)
+            _prune_stale(bundle_path)
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+    # Serve from the mapping too, so the builder does not keep a private copy
+    arrays, meta = open_bundle(bundle_path)
+    return arrays, meta, False
+
+
+def _prune_stale(bundle_path: Path):
+    """Remove older bundles of the same index; mapped files stay valid until unmapped"""
+    prefix = bundle_path.name.rsplit('.', 2)[0]  # "<index stem>.<mode>"
+    for path in bundle_path.parent.glob(prefix + '.*.arrays'):
+        if path != bundle_path:
+            path.unlink(missing_ok=True)
+            path.with_name(path.name + '.lock').unlink(missing_ok=True)
@@ -0,0 +1,259 @@
+"""SSE framing for streamed chat responses
+
+Upstream models emit one delta per token, often only a few bytes. Sending
+each as its own SSE frame means one json.dumps, one ASGI send and one
+socket write per token. The coalescer sends the first token on its own so
+time-to-first-token is unchanged, then batches later tokens into one frame
+per flush interval or once the batch reaches a byte threshold, whichever
+comes first.
+
+In passthrough mode the upstream's OpenAI-format events are forwarded as
+raw bytes instead of being decoded and re-encoded per token; only event
+boundaries are scanned, and JSON is parsed only for error and usage events.
+"""
+
+import asyncio
+import json
+import os
+from typing import Any, AsyncIterator, Dict, List, Optional, Sequence
+
+try:
+    import orjson
+    json_loads = orjson.loads
+    json_dumps = orjson.dumps
+except ImportError:
+    json_loads = json.loads
+
+    def json_dumps(obj: Any) -> bytes:
+        return json.dumps(obj, separators=(",", ":"), ensure_ascii=False).encode()
+
+# Flush interval for batched tokens (0 sends every token as its own frame)
+CHAT_COALESCE_SECONDS = float(os.getenv("CHAT_COALESCE_MS", "30")) / 1000
+CHAT_COALESCE_BYTES = int(os.getenv("CHAT_COALESCE_BYTES", "2048"))
+
+# "tokens": {"token": ...} frames; "passthrough": upstream OpenAI events forwarded as-is
+STREAM_MODES = ("tokens", "passthrough")
+CHAT_STREAM_MODE = os.getenv("CHAT_STREAM_MODE", "tokens").lower()
+if CHAT_STREAM_MODE not in STREAM_MODES:
+    print(f"Unknown CHAT_STREAM_MODE '{CHAT_STREAM_MODE}', using 'tokens'")
+    CHAT_STREAM_MODE = "tokens"
+
+DONE_EVENT = b"data: [DONE]\n\n"
+ERROR_MARKER = b'"error"'
+# With include_usage every chunk carries "usage":null; only the final one has an object
+USAGE_MARKERS = (b'"usage":{', b'"usage": {')
+
+
+class SSEPassthrough:
+    """Split an upstream SSE byte stream into forwardable complete events
+
+    Bytes are only searched for event boundaries and a few markers; an
+    event is JSON-decoded only if it carries an error or a usage object,
+    unless `collect_text` asks for the answer text, which parses them all.
+    Events are expected to end with a blank line ("\\n\\n"), as OpenAI
+    and compatible servers send them.
+    """
+
+    def __init__(self, collect_text: bool = False):
+        self.collect_text = collect_text
+        self._text: List[str] = []
+        self._tail = b""
+        self.events = 0
+        self.done = False
+        self.error: Optional[str] = None
+        self.usage: Optional[Dict[str, Any]] = None
+
+    def feed(self, chunk: bytes) -> bytes:
+        """Take raw upstream bytes and return the complete events to forward
+
+        Anything after `data: [DONE]` is dropped; after it, feed returns b"".
+        """
+        if self.done:
+            return b""
+        data = self._tail + chunk if self._tail else chunk
+        end = data.rfind(b"\n\n")
+        if end < 0:
+            self._tail = data
+            return b""
+        complete, self._tail = data[:end + 2], data[end + 2:]
+
+        done_at = complete.find(DONE_EVENT)
+        if done_at >= 0:
+            complete = complete[:done_at + len(DONE_EVENT)]
+            self._tail = b""
+            self.done = True
+
+        self.events += complete.count(b"\n\n") - self.done
+        if self.collect_text or self._interesting(complete):
+            self._inspect(complete)
+        return complete
+
+    def flush(self) -> bytes:
+        """Bytes of a final event the upstream did not terminate"""
+        tail, self._tail = self._tail, b""
+        if tail.strip() and not self.done:
+            self.events += 1
+            self._inspect(tail)
+            return tail + b"\n\n"
+        return b""
+
+    @staticmethod
+    def _interesting(data: bytes) -> bool:
+        return ERROR_MARKER in data or USAGE_MARKERS[0] in data or USAGE_MARKERS[1] in data
+
+    def _inspect(self, events: bytes):
+        for event in events.split(b"\n\n"):
+            if not event.startswith(b"data: ") or not (self.collect_text or self._interesting(event)):
+                continue
+            try:
+                parsed = json_loads(event[6:])
+            except ValueError:
+                continue
+            if not isinstance(parsed, dict):
+                continue
+            if parsed.get("usage"):
+                self.usage = parsed["usage"]
+            error = parsed.get("error")
+            if error:
+                self.error = error.get("message", str(error)) if isinstance(error, dict) else str(error)
+            if self.collect_text:
+                content = (parsed.get("choices") or [{}])[0].get("delta", {}).get("content")
+                if content:
+                    self._text.append(content)
+
+    @property
+    def text(self) -> str:
+        """Answer text forwarded so far (collect_text only)"""
+        return "".join(self._text)
+
+    @property
+    def token_count(self) -> int:
+        """Completion tokens from upstream usage, else the number of content events"""
+        if self.usage and self.usage.get("completion_tokens") is not None:
+            return int(self.usage["completion_tokens"])
+        return self.events
+
+
+def join_batch(batch: Sequence) -> Any:
+    """Concatenate a coalesced batch of str tokens or raw byte chunks"""
+    return b"".join(batch) if isinstance(batch[0], bytes) else "".join(batch)
+
+
+async def _close(tokens: AsyncIterator):
+    aclose = getattr(tokens, "aclose", None)
+    if aclose is not None:
+        await aclose()
+
+
+async def coalesce_tokens(tokens: AsyncIterator, interval: Optional[float] = None,
+                          max_bytes: Optional[int] = None,
+                          stop: Optional[asyncio.Event] = None) -> AsyncIterator[List]:
+    """Group streamed tokens (or raw SSE chunks) into batches, one batch per write
+
+    The first token is yielded alone and immediately. After that, a batch
+    is flushed `interval` seconds after its first token arrived, or as soon
+    as it holds `max_bytes` characters. A batch is never held back waiting
+    for a slow upstream: the flush deadline fires even if no more tokens
+    come in.
+
+    Setting `stop` (e.g. when the client disconnects) cancels the read of
+    `tokens` at once, closing the upstream stream, and ends the iteration
+    without flushing what is buffered.
+
+    Args:
+        tokens: Upstream token stream
+        interval: Flush interval in seconds (defaults to CHAT_COALESCE_MS)
+        max_bytes: Flush threshold in characters (defaults to CHAT_COALESCE_BYTES)
+        stop: Event that abandons the stream (checked per token when interval is 0)
+
+    Returns:
+        Async iterator of non-empty token lists, in upstream order
+    """
+    interval = CHAT_COALESCE_SECONDS if interval is None else interval
+    max_bytes = CHAT_COALESCE_BYTES if max_bytes is None else max_bytes
+
+    if interval <= 0:
+        try:
+            async for token in tokens:
+                if stop is not None and stop.is_set():
+                    break
+                yield [token]
+        finally:
+            await _close(tokens)
+        return
+
+    loop = asyncio.get_running_loop()
+    buffer: List = []
+    state = {'size': 0, 'batch_started': 0.0, 'finished': False, 'error': None}
+    wake = asyncio.Event()
+    first_sent = asyncio.Event()
+    drained = asyncio.Event()
+
+    async def pump():
+        # One reader task per stream; per token this is only an append
+        try:
+            async for token in tokens:
+                buffer.append(token)
+                state['size'] += len(token)
+                if len(buffer) == 1:
+                    state['batch_started'] = loop.time()
+                    wake.set()
+                    if not first_sent.is_set():
+                        # Hold the read until the first frame is out, so draining an
+                        # already-buffered burst never delays the first token
+                        await first_sent.wait()
+                elif state['size'] >= max_bytes:
+                    # Full batch: wait until it is taken, which also bounds the buffer
+                    drained.clear()
+                    wake.set()
+                    await drained.wait()
+        except Exception as e:
+            state['error'] = e
+        finally:
+            state['finished'] = True
+            wake.set()
+            # Cancelled between reads, the stream is still open: close it now
+            # rather than when it is garbage collected
+            await _close(tokens)
+
+    reader = asyncio.create_task(pump())
+    stopper = None
+    if stop is not None:
+        stopper = asyncio.create_task(stop.wait())
+        stopper.add_done_callback(lambda _: reader.cancel())
+    first = True
+    try:
+        while True:
+            await wake.wait()
+            wake.clear()
+            if stop is not None and stop.is_set():
+                return
+
+            remaining = state['batch_started'] + interval - loop.time()
+            if buffer and not first and remaining > 0 and not state['finished'] \
+                    and state['size'] < max_bytes:
+                try:
+                    await asyncio.wait_for(wake.wait(), remaining)
+                except asyncio.TimeoutError:
+                    pass
+                wake.clear()
+
+            if buffer:
+                batch = buffer[:]
+                buffer.clear()
+                state['size'] = 0
+                drained.set()
+                first = False
+                yield batch
+                first_sent.set()
+
+            if state['finished'] and not buffer:
+                break
+
+        if state['error'] is not None:
+            raise state['error']
+    finally:
+        if stopper is not None:
+            stopper.cancel()
+        reader.cancel()
+        await asyncio.wait((reader,))
@@ -0,0 +1,507 @@
+"""Shared, pooled HTTP client for the OpenAI-compatible upstream
+
+A client per chat request pays DNS, TCP and TLS setup before the first
+token on every conversation turn. The app instead holds one
+lifespan-managed client whose pool keeps connections alive between
+requests (and multiplexes streams over HTTP/2 when `h2` is installed),
+and opens connections at startup so the first chat after a deploy does
+not pay the handshake either. When the pool has gone cold, a chat request
+opens a connection to the endpoint it will use while it retrieves context.
+
+Several OpenAI-compatible endpoints can be configured (OPENAI_BASE_URLS).
+`UpstreamRouter` tries them in order of their smoothed time-to-first-token,
+moves on to the next one when an endpoint cannot be reached, and can hedge:
+when the first token is late, a second endpoint is asked too and whichever
+answers first is kept.
+"""
+
+import asyncio
+import os
+import time
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, TypeVar
+
+import httpcore
+import httpx
+
+try:
+    import h2  # noqa: F401  (httpx[http2])
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+T = TypeVar("T")
+
+
+def api_base_url() -> str:
+    return os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1").rstrip('/')
+
+
+def auth_headers(api_key: Optional[str] = None) -> Dict[str, str]:
+    return {
+        "Authorization": f"Bearer {api_key if api_key is not None else os.getenv('OPENAI_API_KEY', '')}",
+        "Content-Type": "application/json"
+    }
+
+
+def _env_list(name: str) -> List[str]:
+    return [item.strip() for item in os.getenv(name, "").split(",") if item.strip()]
+
+
+def client_settings() -> Dict[str, Any]:
+    """httpx.AsyncClient keyword arguments from the UPSTREAM_* environment"""
+    # read is the gap allowed between streamed chunks, not the whole response
+    timeout = httpx.Timeout(
+        connect=float(os.getenv("UPSTREAM_CONNECT_TIMEOUT", "5")),
+        read=float(os.getenv("UPSTREAM_READ_TIMEOUT", "60")),
+        write=float(os.getenv("UPSTREAM_WRITE_TIMEOUT", "10")),
+        pool=float(os.getenv("UPSTREAM_POOL_TIMEOUT", "5")),
+    )
+    limits = httpx.Limits(
+        max_connections=int(os.getenv("UPSTREAM_MAX_CONNECTIONS", "100")),
+        max_keepalive_connections=int(os.getenv("UPSTREAM_MAX_KEEPALIVE", "20")),
+        keepalive_expiry=float(os.getenv("UPSTREAM_KEEPALIVE_EXPIRY", "90")),
+    )
+    http2 = HTTP2_AVAILABLE and os.getenv("UPSTREAM_HTTP2", "true").lower() == "true"
+    return {'timeout': timeout, 'limits': limits, 'http2': http2}
+
+
+def _pool(client: httpx.AsyncClient) -> Optional[httpcore.AsyncConnectionPool]:
+    """The connection pool behind the client's default transport (None for custom transports)"""
+    pool = getattr(getattr(client, '_transport', None), '_pool', None)
+    return pool if isinstance(pool, httpcore.AsyncConnectionPool) else None
+
+
+class _OpenedHTTP11Connection(httpcore.AsyncHTTP11Connection):
+    """An HTTP/1.1 connection opened before any request asked for it
+
+    httpcore creates a connection for the request that needs it, so a new
+    one starts out claimed by that request. This one starts idle and ages
+    like a kept-alive connection, so the pool hands it out and expires it.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._state = type(self._state).IDLE
+        if self._keepalive_expiry is not None:
+            self._expire_at = time.monotonic() + self._keepalive_expiry
+
+
+class UpstreamClient:
+    """Owns the pooled AsyncClient used for every upstream LLM call
+
+    The client is created by the app lifespan (`start`) and closed on
+    shutdown. Callers outside the lifespan (tests, scripts) get a client
+    created lazily on first use. Pooled connections belong to the event
+    loop that opened them, so a call from a different loop gets a fresh
+    client rather than a connection it cannot use, and the old client is
+    closed on its own loop.
+    """
+
+    def __init__(self):
+        self._client: Optional[httpx.AsyncClient] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._warm_task: Optional[asyncio.Task] = None
+        self._prepare_task: Optional[asyncio.Future] = None
+        self.warmed = 0
+        self.warm_seconds: Optional[float] = None
+        self.last_used = float("-inf")  # time.monotonic() of the last upstream response
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._client.is_closed or self._loop is not loop:
+            if self._client is not None and not self._client.is_closed:
+                self._retire(self._client, self._loop)
+            self._client = httpx.AsyncClient(**client_settings())
+            self._loop = loop
+        return self._client
+
+    @staticmethod
+    def _retire(client: httpx.AsyncClient, loop: Optional[asyncio.AbstractEventLoop]):
+        """Close a client superseded by one for another event loop
+
+        Its connections can only be closed on the loop that opened them: a
+        loop still running (another thread) is asked to close it, and a
+        closed loop has already dropped them.
+        """
+        if loop is not None and loop.is_running() and not loop.is_closed():
+            loop.call_soon_threadsafe(lambda: loop.create_task(client.aclose()))
+
+    async def start(self, warm: bool = True):
+        """Create the client and pre-warm connections in the background
+
+        Warming runs as a task so a slow or unreachable upstream never
+        delays startup; chat requests simply open their own connection
+        if they arrive first.
+        """
+        self.client  # Created in the lifespan's loop
+        settings = client_settings()
+        print(f"Upstream client ready for {', '.join(e.base_url for e in upstream_router.endpoints())} "
+              f"(http2={'on' if settings['http2'] else 'off'}, "
+              f"connect={settings['timeout'].connect}s, read={settings['timeout'].read}s)")
+
+        connections = int(os.getenv("UPSTREAM_PREWARM_CONNECTIONS", "2"))
+        if warm and connections > 0 and any(e.api_key for e in upstream_router.endpoints()):
+            self._warm_task = asyncio.create_task(self.warm(connections))
+
+    def mark_used(self):
+        self.last_used = time.monotonic()
+
+    def is_cold(self) -> bool:
+        """True when no upstream response came back within the keep-alive expiry,
+        so pooled connections have likely been closed"""
+        return time.monotonic() - self.last_used >= client_settings()['limits'].keepalive_expiry
+
+    def prepare(self) -> Optional[asyncio.Future]:
+        """Start connecting to the endpoint the router will pick if the pool has gone cold
+
+        Called when a chat request arrives, so connection setup overlaps
+        the request's own preparation (RAG retrieval) instead of following
+        it. Nothing waits for it: a request sent once the connection is
+        open reuses it, one sent earlier opens its own as it would have
+        anyway. Concurrent callers share one attempt.
+
+        Returns:
+            The connect task, or None when the pool is warm
+        """
+        endpoint = upstream_router.ranked()[0]
+        if not self.is_cold() or not endpoint.api_key:
+            return None
+        if self._prepare_task is None or self._prepare_task.done():
+            self._prepare_task = asyncio.ensure_future(self.connect(endpoint))
+        return self._prepare_task
+
+    async def connect(self, endpoint: "Endpoint") -> bool:
+        """Open one pooled connection to `endpoint` (TCP and TLS only, no request)
+
+        Does nothing when the pool already holds a connection to it or is
+        full; failures are logged and ignored.
+
+        Returns:
+            Whether a new connection was added to the pool
+        """
+        pool = _pool(self.client)
+        if pool is None:
+            return False
+        url = httpx.URL(endpoint.base_url)
+        port = url.port or (443 if url.scheme == "https" else 80)
+        origin = httpcore.Origin(url.raw_scheme, url.raw_host, port)
+        settings = client_settings()
+        connections = pool.connections
+        if (len(connections) >= settings['limits'].max_connections
+                or any(c.can_handle_request(origin) and not c.is_closed() for c in connections)):
+            return False
+
+        try:
+            stream = await httpcore.AnyIOBackend().connect_tcp(url.host, port, timeout=settings['timeout'].connect)
+            http2 = False
+            if url.scheme == "https":
+                ssl_context = getattr(pool, '_ssl_context', None) or httpx.create_ssl_context()
+                ssl_context.set_alpn_protocols(["http/1.1", "h2"] if settings['http2'] else ["http/1.1"])
+                stream = await stream.start_tls(ssl_context, server_hostname=url.host,
+                                                timeout=settings['timeout'].connect)
+                ssl_object = stream.get_extra_info("ssl_object")
+                http2 = ssl_object is not None and ssl_object.selected_alpn_protocol() == "h2"
+        except (httpcore.ConnectError, httpcore.ConnectTimeout, OSError) as e:
+            print(f"Upstream pre-connect to {endpoint.base_url} failed: {e}")
+            return False
+
+        connection_class = httpcore.AsyncHTTP2Connection if http2 else _OpenedHTTP11Connection
+        pool._connections.append(connection_class(origin=origin, stream=stream,
+                                                  keepalive_expiry=settings['limits'].keepalive_expiry))
+        self.mark_used()
+        return True
+
+    async def warm(self, connections: int = 1) -> int:
+        """Open up to `connections` pooled connections per endpoint with cheap GETs
+
+        Used at startup, where probing every endpoint costs no request
+        anything.
+
+        Any response, including 4xx, means the handshake is done and the
+        connection sits in the pool; failures are logged and ignored.
+
+        Returns:
+            Number of requests that got a response
+        """
+        client = self.client
+        started = time.perf_counter()
+
+        async def probe(endpoint: "Endpoint") -> bool:
+            try:
+                response = await client.get(f"{endpoint.base_url}/models", headers=auth_headers(endpoint.api_key))
+                await response.aclose()
+                return True
+            except (httpx.HTTPError, OSError) as e:
+                print(f"Upstream pre-warm failed: {e}")
+                return False
+
+        # With HTTP/2 one connection carries every stream, so one probe per endpoint is enough
+        count = 1 if client_settings()['http2'] else connections
+        results = await asyncio.gather(*[probe(endpoint) for endpoint in upstream_router.endpoints()
+                                         for _ in range(count)])
+        self.warmed = sum(results)
+        self.warm_seconds = time.perf_counter() - started
+        if self.warmed:
+            self.mark_used()
+            print(f"Upstream pre-warmed {self.warmed} connection(s) in {self.warm_seconds * 1000:.0f}ms")
+        return self.warmed
+
+    async def close(self):
+        """Cancel pending warm-up and close pooled connections"""
+        if self._prepare_task is not None:
+            self._prepare_task.cancel()
+            self._prepare_task = None
+        if self._warm_task is not None:
+            self._warm_task.cancel()
+            try:
+                await self._warm_task
+            except (asyncio.CancelledError, Exception):
+                pass
+            self._warm_task = None
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+            self._loop = None
+
+    def status(self) -> Dict[str, Any]:
+        """Pool settings and warm-up result for /health"""
+        settings = client_settings()
+        return {
+            'http2': settings['http2'],
+            'connect_timeout': settings['timeout'].connect,
+            'read_timeout': settings['timeout'].read,
+            'max_connections': settings['limits'].max_connections,
+            'started': self._client is not None and not self._client.is_closed,
+            'warmed_connections': self.warmed,
+            'endpoints': upstream_router.status(),
+            'hedges': upstream_router.hedges,
+            'failovers': upstream_router.failovers,
+        }
+
+
+class Endpoint:
+    """One OpenAI-compatible base URL and its observed latency and health"""
+
+    def __init__(self, base_url: str, api_key: str = ""):
+        self.base_url = base_url
+        self.api_key = api_key
+        self.ewma_ttft: Optional[float] = None
+        self.last_sample = 0.0
+        self.requests = 0
+        self.wins = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.down_until = 0.0
+
+    @property
+    def available(self) -> bool:
+        return time.monotonic() >= self.down_until
+
+    def score(self, stale_after: float) -> float:
+        """Expected TTFT in seconds; unmeasured or stale endpoints score 0 so they get (re)tried"""
+        if self.ewma_ttft is None or time.monotonic() - self.last_sample > stale_after:
+            return 0.0
+        return self.ewma_ttft
+
+    def record_ttft(self, seconds: float, alpha: float):
+        if self.ewma_ttft is None:
+            self.ewma_ttft = seconds
+        else:
+            self.ewma_ttft = alpha * seconds + (1 - alpha) * self.ewma_ttft
+        self.last_sample = time.monotonic()
+        self.consecutive_failures = 0
+
+    def record_censored(self, seconds: float):
+        """Record that the first token took longer than `seconds` (a cancelled attempt)
+
+        The elapsed time is only a lower bound, so it can raise the estimate
+        but never lower it.
+        """
+        self.ewma_ttft = max(self.ewma_ttft or 0.0, seconds)
+        self.last_sample = time.monotonic()
+
+    def record_failure(self, cooldown: float):
+        """Take the endpoint out of rotation, doubling the cool-down up to 8x on repeats"""
+        self.failures += 1
+        self.consecutive_failures += 1
+        backoff = cooldown * min(2 ** (self.consecutive_failures - 1), 8)
+        self.down_until = time.monotonic() + backoff
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            'base_url': self.base_url,
+            'available': self.available,
+            'ewma_ttft_ms': round(self.ewma_ttft * 1000, 1) if self.ewma_ttft is not None else None,
+            'requests': self.requests,
+            'wins': self.wins,
+            'failures': self.failures,
+        }
+
+
+class _Empty:
+    """Marks a stream that ended before its first item"""
+
+
+class UpstreamRouter:
+    """Latency-aware choice between upstream endpoints, with failover and hedging
+
+    Endpoints come from OPENAI_BASE_URLS (comma separated; OPENAI_BASE_URL
+    when unset) with keys from OPENAI_API_KEYS in the same order, falling
+    back to OPENAI_API_KEY. They are read at call time, while latency and
+    failure state is kept per base URL for the life of the process.
+    """
+
+    def __init__(self):
+        self._endpoints: Dict[str, Endpoint] = {}
+        self.hedges = 0
+        self.failovers = 0
+
+    @staticmethod
+    def settings() -> Dict[str, float]:
+        return {
+            'alpha': float(os.getenv("UPSTREAM_EWMA_ALPHA", "0.3")),
+            'stale_after': float(os.getenv("UPSTREAM_EWMA_STALE", "300")),
+            'hedge': float(os.getenv("UPSTREAM_HEDGE_MS", "0")) / 1000,
+            'cooldown': float(os.getenv("UPSTREAM_FAILURE_COOLDOWN", "30")),
+        }
+
+    def endpoints(self) -> List[Endpoint]:
+        """Configured endpoints in configuration order"""
+        urls = [url.rstrip('/') for url in _env_list("OPENAI_BASE_URLS")] or [api_base_url()]
+        keys = _env_list("OPENAI_API_KEYS")
+        default_key = os.getenv("OPENAI_API_KEY", "")
+        endpoints = []
+        for i, url in enumerate(urls):
+            key = keys[i] if i < len(keys) else default_key
+            endpoint = self._endpoints.get(url)
+            if endpoint is None:
+                endpoint = self._endpoints[url] = Endpoint(url, key)
+            endpoint.api_key = key
+            endpoints.append(endpoint)
+        return endpoints
+
+    def ranked(self) -> List[Endpoint]:
+        """Available endpoints by expected TTFT, then cooling-down ones as a last resort"""
+        settings = self.settings()
+        endpoints = self.endpoints()
+        order = {id(e): i for i, e in enumerate(endpoints)}
+        return sorted(endpoints, key=lambda e: (not e.available,
+                                                e.score(settings['stale_after']),
+                                                order[id(e)]))
+
+    async def stream(self, open_stream: Callable[[Endpoint], AsyncIterator[T]],
+                     retryable: Callable[[BaseException], bool]) -> AsyncIterator[T]:
+        """Yield the items of the first endpoint to produce one
+
+        Until the first item arrives the request can move: an endpoint
+        failing with a `retryable` error is put on cool-down and the next
+        one is tried, and with UPSTREAM_HEDGE_MS set a second endpoint is
+        started when the first is slow. The loser is cancelled. After the
+        first item the stream is committed to its endpoint.
+
+        Args:
+            open_stream: Starts the upstream stream for an endpoint
+            retryable: Whether an error before the first item may be retried elsewhere
+        """
+        settings = self.settings()
+        candidates = self.ranked()
+        attempts: Dict[asyncio.Future, Any] = {}
+        winner = None
+        last_error: Optional[BaseException] = None
+        hedged = False
+        hedge_at = None
+        winner_endpoint: Optional[Endpoint] = None
+
+        def launch():
+            nonlocal hedge_at
+            endpoint = candidates.pop(0)
+            endpoint.requests += 1
+            iterator = open_stream(endpoint)
+            attempts[asyncio.ensure_future(iterator.__anext__())] = (endpoint, iterator, time.perf_counter())
+            if settings['hedge'] > 0 and not hedged:
+                hedge_at = time.perf_counter() + settings['hedge']
+
+        try:
+            launch()
+            while winner is None:
+                if not attempts:
+                    if not candidates:
+                        raise last_error
+                    self.failovers += 1
+                    launch()
+                    continue
+
+                timeout = None
+                if hedge_at is not None and not hedged and candidates:
+                    timeout = max(0.0, hedge_at - time.perf_counter())
+                done, _ = await asyncio.wait(attempts, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    hedged = True
+                    self.hedges += 1
+                    launch()
+                    continue
+
+                for task in done:
+                    endpoint, iterator, started = attempts.pop(task)
+                    try:
+                        first = task.result()
+                    except StopAsyncIteration:
+                        first = _Empty
+                    except Exception as e:
+                        if not retryable(e):
+                            raise
+                        print(f"Upstream {endpoint.base_url} failed, trying the next endpoint: {e}")
+                        endpoint.record_failure(settings['cooldown'])
+                        last_error = e
+                        continue
+                    if winner is None:
+                        endpoint.record_ttft(time.perf_counter() - started, settings['alpha'])
+                        winner_endpoint = endpoint
+                        endpoint.wins += 1
+                        winner = (iterator, first)
+                    else:
+                        await iterator.aclose()
+        finally:
+            await self._cancel(attempts, winner_endpoint)
+
+        iterator, first = winner
+        if first is _Empty:
+            return
+        try:
+            yield first
+            async for item in iterator:
+                yield item
+        finally:
+            await iterator.aclose()
+
+    @staticmethod
+    async def _cancel(attempts: Dict[asyncio.Future, Any], winner: Optional[Endpoint]):
+        """Cancel losing attempts and record a lower bound on their TTFT
+
+        A loser's elapsed time says only that its first token is later than
+        that. It is also put no lower than the winner's estimate, since it
+        was not faster when given the chance, so losing a hedge never moves
+        an endpoint ahead of the one that beat it.
+        """
+        if not attempts:
+            return
+        for task in attempts:
+            task.cancel()
+        await asyncio.wait(attempts)
+        for task, (endpoint, iterator, started) in attempts.items():
+            if not task.cancelled():
+                task.exception()  # Retrieved so it is not reported as unhandled
+            if winner is not None:
+                endpoint.record_censored(max(time.perf_counter() - started, winner.ewma_ttft))
+            await iterator.aclose()
+
+    def status(self) -> List[Dict[str, Any]]:
+        return [endpoint.status() for endpoint in self.endpoints()]
+
+
+# Global upstream client; use `upstream.client` at call time
+upstream = UpstreamClient()
+
+# Global endpoint router; latency and failure state per base URL
+upstream_router = UpstreamRouter()
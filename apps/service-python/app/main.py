@@ -2,13 +2,20 @@ import os
 import sys
 import uuid
 import logging
+from contextlib import asynccontextmanager
 
 from dotenv import load_dotenv
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 
-from .routes import analytics, chat, health, resume
+from .core.analytics import counters
+from .core.conversations import conversations
+from .core.rag import rag_index
+from .core.rate_limit import chat_rate_limit
+from .core.response_cache import response_cache
+from .core.upstream import upstream
+from .routes import analytics, chat, health, rag, resume
 
 # Configure logging
 logging.basicConfig(
@@ -44,12 +51,30 @@ def validate_environment():
 # Validate on startup
 validate_environment()
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Start and stop background services"""
+    # Poll the RAG index for new builds (0 disables; POST /rag/reload always works)
+    rag_index.start_watching(float(os.getenv("RAG_INDEX_WATCH_INTERVAL", "0")))
+    # One pooled upstream client for all chat requests, connections opened ahead of traffic
+    await upstream.start()
+    # Cached answers survive restarts when CHAT_CACHE_FILE is set
+    response_cache.load()
+    yield
+    response_cache.save()
+    await counters.close()
+    await conversations.close()
+    await chat_rate_limit.limiter.close()
+    await upstream.close()
+    rag_index.stop_watching()
+
 app = FastAPI(
     title="Portfolio API",
     description="FastAPI backend for portfolio with AI chat, RAG, and analytics",
     version="1.0.0",
     docs_url="/docs" if os.getenv("NODE_ENV") != "production" else None,  # Hide docs in prod
-    redoc_url="/redoc" if os.getenv("NODE_ENV") != "production" else None
+    redoc_url="/redoc" if os.getenv("NODE_ENV") != "production" else None,
+    lifespan=lifespan
 )
 
 # CORS configuration
@@ -63,6 +88,9 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Prompt-Tokens", "X-Prompt-Tokens-Saved", "X-Queue-Wait-Ms",
+                    "X-Conversation-Id", "X-Conversation-Messages",
+                    "X-RateLimit-Limit", "X-RateLimit-Remaining", "X-RateLimit-Reset", "Retry-After"],
 )
 
 # Global exception handler for better error responses
@@ -104,6 +132,7 @@ app.include_router(health.router, prefix="", tags=["health"])
 app.include_router(chat.router, prefix="/ai", tags=["chat"])
 app.include_router(analytics.router, prefix="/analytics", tags=["analytics"])
 app.include_router(resume.router, prefix="", tags=["resume"])
+app.include_router(rag.router, prefix="/rag", tags=["rag"])
 
 @app.get("/")
 async def root():
@@ -1,16 +1,21 @@
+import asyncio
 import json
-import os
-import time
-from collections import defaultdict
-from typing import AsyncGenerator, List, Literal
+from contextlib import asynccontextmanager
+from typing import AsyncGenerator, Dict, List, Literal, Optional, Sequence, Union
 
 import httpx
 from fastapi import APIRouter, HTTPException, Request
 from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field
 
-# Rate limiting storage (in production, use Redis)
-rate_limit_storage = defaultdict(list)
+from ..core import streaming
+from ..core.admission import AdmissionRejected, Ticket, admission
+from ..core.conversations import CONVERSATION_ID_PATTERN, conversations
+from ..core.prompt_budget import fit_messages
+from ..core.rate_limit import chat_rate_limit
+from ..core.response_cache import CHAT_CACHE_MODES, cache_key, response_cache
+from ..core.streaming import SSEPassthrough, coalesce_tokens, join_batch, json_dumps, json_loads
+from ..core.upstream import Endpoint, auth_headers, upstream, upstream_router
 
 router = APIRouter()
 
@@ -18,15 +23,21 @@ class ChatMessage(BaseModel):
     role: Literal["system", "user", "assistant"]
     content: str
 
+# Messages sent upstream: request models, or {"role", "content"} dicts as fit_messages returns them
+Messages = Sequence[Union[ChatMessage, Dict[str, str]]]
+
 class ChatRequest(BaseModel):
     messages: List[ChatMessage]
     mode: Literal["general", "projects", "resume"] = "general"
     topk: int = Field(default=4, ge=1, le=10)
+    # Restrict projects-mode retrieval by frontmatter facets, e.g. {"tech": ["Stripe"]}
+    filters: Optional[Dict[Literal["tags", "tech"], List[str]]] = None
+    # Start a server-side history; its ID comes back in X-Conversation-Id
+    new_conversation: bool = False
+    # With a conversation ID the server issued, `messages` holds only the new turn
+    conversation_id: Optional[str] = Field(default=None, pattern=CONVERSATION_ID_PATTERN)
 
-class SystemPrompt:
-    @staticmethod
-    def get_base_prompt() -> str:
-        return """You are Surya's AI assistant for his portfolio website. You're friendly, professional, and concise.
+BASE_PROMPT = """You are Surya's AI assistant for his portfolio website. You're friendly, professional, and concise.
 
         About Surya:
         - Full-stack developer skilled in Next.js, React, TypeScript, FastAPI, Python, and Stripe integrations
@@ -42,129 +53,264 @@ class SystemPrompt:
         - Weave in personality (hobbies, interests) when relevant to the conversation
         """
 
+# System prompt per mode, built once; projects mode appends retrieved context per request
+MODE_PROMPTS = {
+    "general": BASE_PROMPT,
+    "projects": BASE_PROMPT,
+    "resume": f"""{BASE_PROMPT}
+
+The user is asking about Surya's resume/experience. Focus on his technical skills, work experience, and career highlights. Be professional but personable.""",
+}
+
+class SystemPrompt:
     @staticmethod
-    def get_with_context(mode: str, context: str = None) -> str:
-        base = SystemPrompt.get_base_prompt()
+    def get_base_prompt() -> str:
+        return BASE_PROMPT
 
+    @staticmethod
+    def get_with_context(mode: str, context: str = None) -> str:
         if mode == "projects" and context:
-            return f"""{base}
+            return f"""{BASE_PROMPT}
 
 {context}"""
 
-        elif mode == "resume":
-            return f"""{base}
-
-The user is asking about Surya's resume/experience. Focus on his technical skills, work experience, and career highlights. Be professional but personable."""
-
-        return base
-
-def check_rate_limit(ip: str, window_minutes: int = 10, max_requests: int = 20) -> bool:
-    """Simple in-memory rate limiting"""
-    now = time.time()
-    window_start = now - (window_minutes * 60)
-
-    # Clean old requests
-    rate_limit_storage[ip] = [req_time for req_time in rate_limit_storage[ip] if req_time > window_start]
-
-    # Check if under limit
-    if len(rate_limit_storage[ip]) >= max_requests:
-        return False
-
-    # Add current request
-    rate_limit_storage[ip].append(now)
-    return True
+        return MODE_PROMPTS.get(mode, BASE_PROMPT)
 
-async def get_openai_stream(messages: List[ChatMessage]) -> AsyncGenerator[str, None]:
-    """Stream tokens from OpenAI-compatible API"""
-    api_key = os.getenv("OPENAI_API_KEY")
-    base_url = os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1")
+# Sampling settings sent upstream; also part of the response cache key
+MODEL_PARAMS = {
+    "model": "gpt-3.5-turbo",
+    "temperature": 0.7,
+    "max_tokens": 2048,
+}
 
-    if not api_key:
-        raise HTTPException(status_code=500, detail="OpenAI API key not configured")
-
-    headers = {
-        "Authorization": f"Bearer {api_key}",
-        "Content-Type": "application/json"
-    }
-
-    payload = {
-        "model": "gpt-3.5-turbo",
-        "messages": [msg.dict() for msg in messages],
+def build_payload(messages: Messages, **extra) -> Dict:
+    """Chat completion request body for the upstream; dict messages are sent as they are"""
+    return {
+        "model": MODEL_PARAMS["model"],
+        "messages": [msg if isinstance(msg, dict) else msg.model_dump() for msg in messages],
         "stream": True,
-        "temperature": 0.7,
-        "max_tokens": 2048
+        "temperature": MODEL_PARAMS["temperature"],
+        "max_tokens": MODEL_PARAMS["max_tokens"],
+        **extra
     }
 
-    async with httpx.AsyncClient(timeout=60.0) as client:
+@asynccontextmanager
+async def open_upstream_stream(payload: Dict, client: Optional[httpx.AsyncClient] = None,
+                               endpoint: Optional[Endpoint] = None):
+    """POST a streaming completion and yield the 200 response
+
+    Upstream failures, including ones raised while the body is read,
+    surface as HTTPException.
+
+    Args:
+        payload: Request body from build_payload
+        client: Client to send through; defaults to the shared pooled upstream client
+        endpoint: Endpoint to call; defaults to the first configured one
+    """
+    endpoint = endpoint or upstream_router.endpoints()[0]
+    if not endpoint.api_key:
+        raise HTTPException(status_code=500, detail="OpenAI API key not configured")
+
+    client = client or upstream.client
+    try:
+        async with client.stream(
+            "POST",
+            f"{endpoint.base_url}/chat/completions",
+            headers=auth_headers(endpoint.api_key),
+            content=json_dumps(payload)  # orjson when installed: the prompt is most of the body
+        ) as response:
+            upstream.mark_used()
+            if response.status_code != 200:
+                error_text = await response.aread()
+                raise HTTPException(
+                    status_code=response.status_code,
+                    detail=f"OpenAI API error: {error_text.decode()}"
+                )
+            yield response
+
+    except HTTPException:
+        raise
+    except httpx.TimeoutException as e:
+        raise HTTPException(status_code=504, detail=f"Upstream timed out: {type(e).__name__}")
+    except httpx.RequestError as e:
+        raise HTTPException(status_code=500, detail=f"Request failed: {str(e)}")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Streaming error: {str(e)}")
+
+def is_retryable(error: BaseException) -> bool:
+    """Errors worth retrying on another endpoint: unreachable, timed out, overloaded or 5xx"""
+    return isinstance(error, HTTPException) and (error.status_code >= 500 or error.status_code in (408, 429))
+
+async def endpoint_tokens(endpoint: Endpoint, payload: Dict,
+                          client: Optional[httpx.AsyncClient] = None) -> AsyncGenerator[str, None]:
+    """Content tokens of one endpoint's streamed completion"""
+    async with open_upstream_stream(payload, client, endpoint) as response:
+        async for chunk in response.aiter_lines():
+            if chunk.startswith("data: "):
+                data = chunk[6:]  # Remove "data: " prefix
+
+                if data == "[DONE]":
+                    # Read to the end of the body so the connection goes back to the pool
+                    continue
+
+                try:
+                    parsed = json_loads(data)
+                except ValueError:
+                    continue  # Skip malformed chunks
+                error = parsed.get("error")
+                if error:
+                    # Failing mid-answer keeps a truncated answer out of the cache and analytics
+                    message = error.get("message", str(error)) if isinstance(error, dict) else str(error)
+                    raise HTTPException(status_code=502, detail=f"OpenAI API error: {message}")
+                content = (parsed.get("choices") or [{}])[0].get("delta", {}).get("content")
+                if content:
+                    yield content
+
+async def endpoint_bytes(endpoint: Endpoint, payload: Dict,
+                         client: Optional[httpx.AsyncClient] = None) -> AsyncGenerator[bytes, None]:
+    """Raw body chunks of one endpoint's streamed completion"""
+    async with open_upstream_stream(payload, client, endpoint) as response:
+        async for chunk in response.aiter_bytes():
+            yield chunk
+
+async def get_openai_stream(messages: Messages,
+                            client: Optional[httpx.AsyncClient] = None) -> AsyncGenerator[str, None]:
+    """Stream tokens from OpenAI-compatible API
+
+    The fastest healthy endpoint is used; see UpstreamRouter for failover
+    and hedging before the first token.
+
+    Args:
+        messages: Conversation including the system prompt, as models or {"role", "content"} dicts
+        client: Client to send through; defaults to the shared pooled upstream client
+    """
+    payload = build_payload(messages)
+    async for token in upstream_router.stream(lambda e: endpoint_tokens(e, payload, client), is_retryable):
+        yield token
+
+async def get_openai_passthrough(messages: Messages, scanner: SSEPassthrough,
+                                 client: Optional[httpx.AsyncClient] = None) -> AsyncGenerator[bytes, None]:
+    """Forward the upstream's SSE events as raw bytes
+
+    Args:
+        messages: Conversation including the system prompt, as models or {"role", "content"} dicts
+        scanner: Collects [DONE], error and usage state while forwarding
+        client: Client to send through; defaults to the shared pooled upstream client
+    """
+    payload = build_payload(messages, stream_options={"include_usage": True})
+    async for chunk in upstream_router.stream(lambda e: endpoint_bytes(e, payload, client), is_retryable):
+        data = scanner.feed(chunk)  # Returns b"" after [DONE] while the body drains
+        if data:
+            yield data
+    tail = scanner.flush()
+    if tail:
+        yield tail
+
+async def admitted_tokens(client_ip: str, messages: Messages) -> AsyncGenerator[str, None]:
+    """Upstream tokens, requested once an admission slot is granted and holding it while they stream
+
+    Raises:
+        AdmissionRejected: No slot within the queue limits
+    """
+    ticket = await admission.acquire(client_ip)
+    try:
+        async for token in get_openai_stream(messages):
+            yield token
+    finally:
+        ticket.release()
+
+class AdmittedStreamingResponse(StreamingResponse):
+    """Streaming response that releases its admission ticket once sent or abandoned
+
+    The release runs even when the body never starts (the client left
+    first), which the body generator's own cleanup would not.
+    """
+
+    def __init__(self, *args, ticket: Optional[Ticket] = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.ticket = ticket
+
+    async def __call__(self, scope, receive, send):
         try:
-            async with client.stream(
-                "POST",
-                f"{base_url}/chat/completions",
-                headers=headers,
-                json=payload
-            ) as response:
-                if response.status_code != 200:
-                    error_text = await response.aread()
-                    raise HTTPException(
-                        status_code=response.status_code,
-                        detail=f"OpenAI API error: {error_text.decode()}"
-                    )
-
-                async for chunk in response.aiter_lines():
-                    if chunk.startswith("data: "):
-                        data = chunk[6:]  # Remove "data: " prefix
-
-                        if data == "[DONE]":
-                            break
-
-                        try:
-                            parsed = json.loads(data)
-                            content = parsed.get("choices", [{}])[0].get("delta", {}).get("content")
-                            if content:
-                                yield content
-                        except json.JSONDecodeError:
-                            continue  # Skip malformed chunks
-
-        except httpx.RequestError as e:
-            raise HTTPException(status_code=500, detail=f"Request failed: {str(e)}")
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=f"Streaming error: {str(e)}")
+            await super().__call__(scope, receive, send)
+        finally:
+            if self.ticket is not None:
+                self.ticket.release()
+
+@asynccontextmanager
+async def watch_disconnect(request: Request):
+    """Yield an event that is set as soon as the client disconnects
+
+    The server's http.disconnect message is awaited in a background task,
+    so a client leaving is noticed even while no frame is being written.
+    """
+    disconnected = asyncio.Event()
+
+    async def listen():
+        while True:
+            message = await request.receive()
+            if message["type"] == "http.disconnect":
+                disconnected.set()
+                return
+
+    watcher = asyncio.create_task(listen())
+    try:
+        yield disconnected
+    finally:
+        watcher.cancel()
 
 async def log_analytics(session_count: bool = False, token_count: int = 0):
-    """Log analytics using KV client"""
-    from ..core.analytics import log_chat_session, log_chat_tokens
+    """Record chat analytics; the KV writes happen in the background
+
+    Never suspends, so it can run on any path, including a cancelled stream.
+    """
+    from ..core.analytics import record_chat_session, record_chat_tokens
 
     if session_count:
-        await log_chat_session()
+        record_chat_session()
     if token_count > 0:
-        await log_chat_tokens(token_count)
+        record_chat_tokens(token_count)
 
 @router.post("/chat")
 async def chat_endpoint(request: Request, chat_request: ChatRequest):
     """Chat endpoint with SSE streaming"""
     client_ip = request.client.host
 
-    # Rate limiting
-    if not check_rate_limit(client_ip):
-        raise HTTPException(
-            status_code=429,
-            detail="Rate limit exceeded. Try again in a few minutes."
-        )
+    # Rate limiting (429 with Retry-After when exceeded)
+    rate = chat_rate_limit.check(request)
+
+    # A cold upstream pool starts connecting now, alongside retrieval
+    upstream.prepare()
+
+    # Stored history of the conversation loads alongside retrieval too
+    conversation_id = chat_request.conversation_id
+    new_messages = [msg.model_dump() for msg in chat_request.messages]
+    history_task = None
+    if conversation_id or chat_request.new_conversation:
+        if not conversations.enabled:
+            raise HTTPException(status_code=400, detail="Conversation store is disabled")
+        if conversation_id and chat_request.new_conversation:
+            raise HTTPException(status_code=400, detail="Send either conversation_id or new_conversation")
+    if conversation_id:
+        history_task = asyncio.ensure_future(conversations.load(conversation_id))
 
     # Handle RAG for projects mode
     system_prompt = SystemPrompt.get_base_prompt()
-    if chat_request.mode == "projects" and chat_request.messages:
+    if chat_request.mode == "projects" and (chat_request.messages or history_task):
         # Get the last user message for RAG search
-        user_messages = [msg for msg in chat_request.messages if msg.role == "user"]
+        user_messages = [msg["content"] for msg in new_messages if msg["role"] == "user"]
+        if not user_messages and history_task:
+            user_messages = [msg["content"] for msg in await history_task or [] if msg["role"] == "user"]
         if user_messages:
-            last_user_message = user_messages[-1].content
+            last_user_message = user_messages[-1]
 
             try:
-                from ..core.rag import augment_prompt_with_context
-                system_prompt = augment_prompt_with_context(
+                from ..core.rag import augment_prompt_with_context_async
+                system_prompt = await augment_prompt_with_context_async(
                     system_prompt,
                     last_user_message,
-                    chat_request.topk
+                    chat_request.topk,
+                    filters=chat_request.filters
                 )
             except Exception as e:
                 print(f"RAG search failed, using base prompt: {e}")
@@ -172,32 +318,123 @@ async def chat_endpoint(request: Request, chat_request: ChatRequest):
     else:
         system_prompt = SystemPrompt.get_with_context(chat_request.mode)
 
-    # Prepare messages with system prompt
-    messages = [ChatMessage(role="system", content=system_prompt)] + chat_request.messages
+    history = await history_task if history_task else []
+    if history is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired conversation. Start a new one.")
+    if chat_request.new_conversation:
+        conversation_id = conversations.create()
+
+    # Prepare messages with system prompt, fitted to the prompt token budget
+    fitted, budget_report = fit_messages(system_prompt, history + new_messages)
+    messages = fitted  # Already plain dicts: sent upstream without another model round trip
+    if budget_report['saved_tokens']:
+        print(f"Prompt trimmed {budget_report['original_tokens']} -> {budget_report['final_tokens']} tokens "
+              f"(saved {budget_report['saved_tokens']}, {budget_report['dropped_messages']} older messages)")
+
+    passthrough = streaming.CHAT_STREAM_MODE == "passthrough"
+
+    # Repeated questions are answered from the response cache, and identical
+    # requests in flight share one upstream generation
+    cached = (response_cache.enabled and not passthrough
+              and chat_request.mode in CHAT_CACHE_MODES)
+    if cached:
+        key = cache_key(chat_request.mode, fitted, MODEL_PARAMS)
+
+    # Requests that start an upstream generation wait for a slot, fairly per client.
+    # One expecting a cached answer takes its slot only if the generation it
+    # ends up starting reaches upstream (the entry may expire in between).
+    ticket = None
+    if not (cached and response_cache.has(key)):
+        try:
+            ticket = await admission.acquire(client_ip)
+        except AdmissionRejected as e:
+            raise HTTPException(
+                status_code=503,
+                detail=f"{e}. Try again shortly.",
+                headers={"Retry-After": str(e.retry_after)}
+            )
+    queue_wait_ms = round(ticket.wait * 1000) if ticket else 0
 
     # Log analytics
-    await log_analytics(session_count=True)
+    try:
+        await log_analytics(session_count=True)
+    except BaseException:
+        if ticket is not None:
+            ticket.release()  # No response will carry it
+        raise
+
+    def save_turn(answer: str):
+        # The new messages are stored with their answer, so a failed turn can simply be resent
+        if conversation_id and answer:
+            conversations.save(conversation_id, history + new_messages + [{"role": "assistant", "content": answer}])
 
     async def generate_stream():
         token_count = 0
+        answer = []
+        if cached:
+            if ticket is None:
+                # A cached answer was expected: a generation started anyway waits for its own slot
+                generate = lambda: admitted_tokens(client_ip, messages)  # noqa: E731
+            else:
+                generate = lambda: get_openai_stream(messages)  # noqa: E731
+            tokens = response_cache.stream(key, generate)
+        else:
+            tokens = get_openai_stream(messages)
         try:
-            async for token in get_openai_stream(messages):
-                token_count += 1
-                yield f"data: {json.dumps({'token': token})}\n\n"
-
-            # Log token count
+            async with watch_disconnect(request) as disconnected:
+                # One frame per batch; the first token is always sent on its own
+                async for batch in coalesce_tokens(tokens, stop=disconnected):
+                    text = ''.join(batch)
+                    yield f"data: {json.dumps({'token': text})}\n\n"
+                    token_count += len(batch)  # Counted once the frame is sent
+                    answer.append(text)
+
+                # Log token count
+                await log_analytics(token_count=token_count)
+                if disconnected.is_set():
+                    print(f"Client disconnected, upstream cancelled after {token_count} tokens")
+                    return
+                save_turn(''.join(answer))
+                yield f"data: {json.dumps({'done': True})}\n\n"
+
+        except asyncio.CancelledError:
+            # The server cancelled the response because the client left
             await log_analytics(token_count=token_count)
-            yield f"data: {json.dumps({'done': True})}\n\n"
+            raise
+        except Exception as e:
+            yield f"data: {json.dumps({'error': str(e)})}\n\n"
 
+    async def passthrough_stream():
+        scanner = SSEPassthrough(collect_text=bool(conversation_id))
+        try:
+            async with watch_disconnect(request) as disconnected:
+                async for batch in coalesce_tokens(get_openai_passthrough(messages, scanner), stop=disconnected):
+                    yield join_batch(batch)
+                if scanner.done and not scanner.error and not disconnected.is_set():
+                    save_turn(scanner.text)
+        except asyncio.CancelledError:
+            await log_analytics(token_count=scanner.token_count)
+            raise
         except Exception as e:
             yield f"data: {json.dumps({'error': str(e)})}\n\n"
+        if scanner.error:
+            print(f"Upstream stream error: {scanner.error}")
+        await log_analytics(token_count=scanner.token_count)
 
-    return StreamingResponse(
-        generate_stream(),
+    return AdmittedStreamingResponse(
+        passthrough_stream() if passthrough else generate_stream(),
+        ticket=ticket,
         media_type="text/event-stream",
         headers={
             "Cache-Control": "no-cache",
             "Connection": "keep-alive",
             "Access-Control-Allow-Origin": "*",
+            "X-Prompt-Tokens": str(budget_report['final_tokens']),
+            "X-Prompt-Tokens-Saved": str(budget_report['saved_tokens']),
+            "X-Queue-Wait-Ms": str(queue_wait_ms),
+            **rate.headers(),
+            # Stored messages used for this turn
+            **({"X-Conversation-Id": conversation_id, "X-Conversation-Messages": str(len(history))}
+               if conversation_id else {}),
         }
     )
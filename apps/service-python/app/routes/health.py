@@ -3,6 +3,13 @@ from typing import Dict, Any
 from fastapi import APIRouter
 from pydantic import BaseModel
 
+from ..core.admission import admission
+from ..core.conversations import conversations
+from ..core.rag import rag_index
+from ..core.rate_limit import chat_rate_limit
+from ..core.response_cache import response_cache
+from ..core.upstream import upstream
+
 router = APIRouter()
 
 class HealthResponse(BaseModel):
@@ -11,6 +18,12 @@ class HealthResponse(BaseModel):
     version: str
     environment: str
     config: Dict[str, Any]
+    rag: Dict[str, Any]
+    upstream: Dict[str, Any]
+    cache: Dict[str, Any]
+    admission: Dict[str, Any]
+    conversations: Dict[str, Any]
+    rate_limit: Dict[str, Any]
 
 @router.get("/health", response_model=HealthResponse)
 async def health_check():
@@ -33,5 +46,11 @@ async def health_check():
             "kv_storage_configured": has_kv,
             "resume_signing_configured": has_resume_secret,
             "cors_origins": len(os.getenv("ALLOWED_ORIGINS", "").split(","))
-        }
+        },
+        rag=rag_index.status(),
+        upstream=upstream.status(),
+        cache=response_cache.status(),
+        admission=admission.status(),
+        conversations=conversations.status(),
+        rate_limit=chat_rate_limit.limiter.status()
     )
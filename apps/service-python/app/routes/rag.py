@@ -0,0 +1,32 @@
+import hmac
+import os
+
+from fastapi import APIRouter, HTTPException, Request
+
+from ..core.rag import rag_index
+
+router = APIRouter()
+
+@router.post("/reload", status_code=202)
+async def reload_index(request: Request):
+    """Reload the RAG index in the background and swap it in once validated"""
+    reload_token = os.getenv("RAG_RELOAD_TOKEN")
+    if not reload_token:
+        raise HTTPException(status_code=404, detail="Index reload not enabled")
+
+    provided = request.headers.get("authorization", "").removeprefix("Bearer ").strip()
+    if not hmac.compare_digest(provided, reload_token):
+        raise HTTPException(status_code=403, detail="Invalid reload token")
+
+    started = rag_index.reload()
+    return {
+        "ok": True,
+        "started": started,
+        "message": "Reload started" if started else "Reload already in progress",
+        "active": rag_index.status()
+    }
+
+@router.get("/status")
+async def index_status():
+    """Active RAG index version and reload state"""
+    return rag_index.status()
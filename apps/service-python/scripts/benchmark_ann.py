@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""Benchmark LSA + IVF approximate search: recall@k and latency against exact search"""
+
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.core.ann import IVFIndex, recall_at_k  # noqa: E402
+
+
+def synthetic_embeddings(count: int, dims: int, topics: int, seed: int = 0) -> np.ndarray:
+    """Unit vectors clustered around random topic directions, like LSA passage embeddings"""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(topics, dims))
+    vectors = centers[rng.integers(topics, size=count)] + 0.6 * rng.normal(size=(count, dims))
+    return (vectors / np.linalg.norm(vectors, axis=1, keepdims=True)).astype(np.float32)
+
+def load_embeddings(lsa_file: str) -> np.ndarray:
+    """Dequantized passage embeddings from a built `_lsa.npz` file"""
+    with np.load(lsa_file) as npz:
+        vectors = npz['embeddings'].astype(np.float32)
+        if 'scales' in npz.files:
+            vectors *= npz['scales'][:, None]
+    return vectors
+
+def time_queries(index: IVFIndex, queries: np.ndarray, k: int, nprobe: int) -> float:
+    """Mean query latency in milliseconds"""
+    started = time.perf_counter()
+    for query in queries:
+        index.search(query, k, nprobe=nprobe)
+    return (time.perf_counter() - started) / len(queries) * 1000
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--lsa-file', help='Benchmark a built _lsa.npz instead of synthetic data')
+    parser.add_argument('--count', type=int, default=50000, help='Synthetic passages')
+    parser.add_argument('--dims', type=int, default=128)
+    parser.add_argument('--topics', type=int, default=200)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('-k', type=int, default=10)
+    parser.add_argument('--nprobe', type=int, nargs='+', default=[1, 2, 4, 8, 16, 32])
+    args = parser.parse_args()
+
+    if args.lsa_file:
+        embeddings = load_embeddings(args.lsa_file)
+    else:
+        embeddings = synthetic_embeddings(args.count, args.dims, args.topics)
+
+    rng = np.random.default_rng(1)
+    sample = embeddings[rng.choice(len(embeddings), size=min(args.queries, len(embeddings)), replace=False)]
+    queries = sample + 0.3 * rng.normal(size=sample.shape).astype(np.float32)
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+
+    results = []
+    for quantize in (False, True):
+        started = time.perf_counter()
+        index = IVFIndex.build(embeddings, quantize=quantize)
+        build_seconds = time.perf_counter() - started
+        exact_ms = time_queries(index, queries, args.k, index.nlist)
+
+        for nprobe in args.nprobe:
+            if nprobe > index.nlist:
+                continue
+            results.append({
+                'dtype': str(index.vectors.dtype),
+                'vectors': len(embeddings),
+                'nlist': index.nlist,
+                'nprobe': nprobe,
+                'recall_at_k': round(recall_at_k(index, queries, args.k, nprobe=nprobe), 4),
+                'query_ms': round(time_queries(index, queries, args.k, nprobe), 3),
+                'exact_query_ms': round(exact_ms, 3),
+                'build_seconds': round(build_seconds, 2),
+                'index_mb': round(index.vectors.nbytes / 1e6, 2),
+            })
+            print(json.dumps(results[-1]), file=sys.stderr)
+
+    print(json.dumps({'k': args.k, 'results': results}, indent=2))
+
+if __name__ == "__main__":
+    main()
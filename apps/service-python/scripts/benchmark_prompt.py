@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""Measure the CPU cost of building a chat prompt, stage by stage
+
+Runs the projects-mode prompt path on synthetic retrieval results (so
+search time is left out) and a synthetic conversation:
+
+    context   system prompt plus the rendered project context
+    fit       fitting system prompt and history to the token budget
+    payload   upstream request body, encoded
+
+Each stage is timed cold (context block and token count caches emptied
+before every call, as for documents and messages never seen before) and
+warm (the same documents and history again, as on the next turn).
+`payload_via_models` is the previous payload path for comparison: fitted
+dicts turned into ChatMessage models and back, encoded with json.dumps.
+Results are microseconds per call (median), printed as JSON.
+"""
+
+import argparse
+import contextlib
+import json
+import statistics
+import sys
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+from unittest.mock import patch
+
+SERVICE_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(SERVICE_ROOT))
+
+with contextlib.redirect_stdout(sys.stderr):
+    import app.core.rag as rag  # noqa: E402
+    from app.core import prompt_budget  # noqa: E402
+    from app.core.streaming import json_dumps  # noqa: E402
+    from app.routes.chat import ChatMessage, SystemPrompt, build_payload  # noqa: E402
+
+SNIPPET = ("...The storefront uses Stripe Checkout and signed webhooks; a FastAPI service keeps "
+           "order state, retries failed deliveries with idempotency keys and reports to a dashboard. ")
+ANSWER = ("I built that with Next.js on the front end and FastAPI behind it, and most of the work "
+          "went into making payment webhooks idempotent. ")
+
+
+def synthetic_results(k: int) -> List[Dict[str, Any]]:
+    return [{'title': f"Project {i}", 'slug': f"project-{i}", 'tech': ["Next.js", "Stripe", "FastAPI"],
+             'snippet': SNIPPET * 4, 'similarity_score': 1.0 / (i + 1)} for i in range(k)]
+
+
+def synthetic_history(turns: int) -> List[Dict[str, str]]:
+    history = []
+    for i in range(turns):
+        history.append({'role': 'user', 'content': f"What did you learn building project {i}?"})
+        history.append({'role': 'assistant', 'content': ANSWER * 6})
+    history.append({'role': 'user', 'content': "Which of them used Stripe?"})
+    return history
+
+
+def clear_caches():
+    with rag._context_lock:
+        rag._context_blocks.clear()
+    prompt_budget._content_tokens.cache_clear()
+
+
+def median_us(func: Callable[[], Any], iterations: int, cold: bool) -> float:
+    samples = []
+    for _ in range(iterations):
+        if cold:
+            clear_caches()
+        started = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - started)
+    return round(statistics.median(samples) * 1e6, 1)
+
+
+def run(k: int, turns: int, iterations: int) -> Dict[str, Any]:
+    history = synthetic_history(turns)
+    base = SystemPrompt.get_base_prompt()
+
+    with patch.object(rag, 'search', return_value=synthetic_results(k)):
+        system_prompt = rag.augment_prompt_with_context(base, "stripe", k)
+        fitted, report = prompt_budget.fit_messages(system_prompt, history)
+
+        def context():
+            return rag.augment_prompt_with_context(base, "stripe", k)
+
+        def fit():
+            return prompt_budget.fit_messages(context(), history)
+
+        def payload():
+            return json_dumps(build_payload(fitted))
+
+        def payload_via_models():
+            return json.dumps(build_payload([ChatMessage(**msg) for msg in fitted])).encode()
+
+        def end_to_end():
+            messages, _ = prompt_budget.fit_messages(context(), history)
+            return json_dumps(build_payload(messages))
+
+        stages = {'context': context, 'fit': fit, 'payload': payload, 'end_to_end': end_to_end}
+        results = {name: {'cold_us': median_us(func, iterations, cold=True),
+                          'warm_us': median_us(func, iterations, cold=False)}
+                   for name, func in stages.items()}
+        results['payload_via_models'] = {'us': median_us(payload_via_models, iterations, cold=False)}
+
+    return {
+        'documents': k,
+        'history_messages': len(history),
+        'system_prompt_tokens': prompt_budget.count_tokens(system_prompt),
+        'prompt_tokens': report['final_tokens'],
+        'iterations': iterations,
+        'stages': results,
+    }
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--k', type=int, default=4, help='Retrieved documents in the context')
+    parser.add_argument('--turns', type=int, default=5, help='Earlier question/answer pairs in the history')
+    parser.add_argument('--iterations', type=int, default=500)
+    args = parser.parse_args(argv)
+
+    print(json.dumps(run(args.k, args.turns, args.iterations), indent=2))
+
+
+if __name__ == "__main__":
+    main()
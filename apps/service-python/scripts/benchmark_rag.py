@@ -0,0 +1,301 @@
+#!/usr/bin/env python3
+"""Benchmark RAG indexing and retrieval on synthetic MDX corpora
+
+For each corpus size this generates MDX projects, runs them through the
+real build pipeline (process_mdx_files -> build_tfidf_index -> save_rag_index)
+and then, per search mode, loads the index in a fresh process to measure
+load time, RSS, query latency and recall@k against labelled queries.
+
+Every document carries a unique codename, and each labelled query is that
+codename plus two words from the document's topic, so its one relevant
+document is known.
+
+Results are printed as JSON. Pass --baseline with an earlier result file
+to report regressions (exit code 1 when any are found).
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+SERVICE_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(SERVICE_ROOT))
+
+# Importing app.core.rag loads the default index and logs; keep stdout for the JSON report
+with contextlib.redirect_stdout(sys.stderr):
+    from app.core.rag import SEARCH_MODES, RAGSearcher, lsa_path, vectorizer_path  # noqa: E402
+    from scripts.build_rag_index import (  # noqa: E402
+        LSA_DIMS,
+        build_lsa_index,
+        build_tfidf_index,
+        process_mdx_files,
+        save_rag_index,
+    )
+
+DEFAULT_SIZES = [100, 1000, 10000]
+
+SYLLABLES = [c + v for c in "bdfgklmnprstvz" for v in "aeiou"]
+TOPICS = 40
+TOPIC_WORDS = 25
+COMMON_WORDS = 2000
+
+# Relative slowdown (p99 latency, load time) or absolute recall drop that counts as a regression
+LATENCY_TOLERANCE = 0.25
+RECALL_TOLERANCE = 0.02
+
+
+def make_word(n: int, prefix: str = "") -> str:
+    """Deterministic pronounceable word for an integer (distinct n give distinct words)"""
+    word = ""
+    while True:
+        n, digit = divmod(n, len(SYLLABLES))
+        word += SYLLABLES[digit]
+        if n == 0:
+            break
+    return prefix + word + "x"
+
+def codename(doc_id: int) -> str:
+    return make_word(doc_id, prefix="qu")
+
+def topic_words(topic: int) -> List[str]:
+    return [make_word(topic * TOPIC_WORDS + i, prefix="to") for i in range(TOPIC_WORDS)]
+
+def generate_corpus(content_dir: Path, num_docs: int, seed: int = 0) -> List[Dict[str, Any]]:
+    """Write `num_docs` synthetic MDX projects under content_dir/projects
+
+    Returns:
+        Labelled queries: {'query': str, 'relevant': [slug]}
+    """
+    rng = np.random.default_rng(seed)
+    projects = content_dir / "projects"
+    projects.mkdir(parents=True, exist_ok=True)
+
+    common = [make_word(i, prefix="co") for i in range(COMMON_WORDS)]
+    zipf = 1.0 / np.arange(1, COMMON_WORDS + 1)
+    zipf /= zipf.sum()
+
+    queries = []
+    for doc_id in range(num_docs):
+        topic = int(rng.integers(TOPICS))
+        words = topic_words(topic)
+        name = codename(doc_id)
+        slug = f"project-{doc_id:06d}"
+
+        paragraphs = []
+        for _ in range(int(rng.integers(2, 6))):
+            body = list(rng.choice(common, size=int(rng.integers(30, 70)), p=zipf))
+            body += list(rng.choice(words, size=8))
+            rng.shuffle(body)
+            paragraphs.append(" ".join(body).capitalize() + ".")
+        paragraphs.insert(1, f"The **{name}** service is built with `{words[0]}` and {words[1]}.")
+
+        tags = list(rng.choice(words[:5], size=2, replace=False))
+        mdx = (
+            "---\n"
+            f"title: {name.capitalize()} {words[2]}\n"
+            f"description: A {words[3]} project about {words[4]}\n"
+            f"tags: [{', '.join(tags)}]\n"
+            f"tech: [{words[5]}]\n"
+            "---\n\n"
+            f"# {name.capitalize()}\n\n" + "\n\n".join(paragraphs) + "\n\n"
+            f"- Uses [{words[6]}](https://example.com/{slug})\n"
+        )
+        (projects / f"{slug}.mdx").write_text(mdx, encoding="utf-8")
+
+        query_words = rng.choice(words, size=2, replace=False)
+        queries.append({'query': f"{name} {query_words[0]} {query_words[1]}", 'relevant': [slug]})
+
+    return queries
+
+def rss_mb() -> float:
+    """Current resident set size in MB (peak RSS where /proc is unavailable)"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1e6
+    except (OSError, ValueError):
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return maxrss / 1e6 if sys.platform == "darwin" else maxrss / 1e3
+
+def percentile_ms(samples: List[float], q: float) -> float:
+    return round(float(np.percentile(samples, q)) * 1000, 3)
+
+def build_index(content_dir: Path, index_file: Path, lsa: bool) -> Dict[str, Any]:
+    """Run the build pipeline and time each stage"""
+    timings = {}
+    with contextlib.redirect_stdout(io.StringIO()):
+        started = time.perf_counter()
+        documents = process_mdx_files(str(content_dir))
+        timings['extract_seconds'] = time.perf_counter() - started
+
+        started = time.perf_counter()
+        index_data = build_tfidf_index(documents)
+        timings['index_seconds'] = time.perf_counter() - started
+
+        if lsa:
+            started = time.perf_counter()
+            index_data['lsa'] = build_lsa_index(index_data['vectors'], LSA_DIMS)
+            timings['lsa_seconds'] = time.perf_counter() - started
+
+        started = time.perf_counter()
+        save_rag_index(index_data, str(index_file))
+        timings['save_seconds'] = time.perf_counter() - started
+
+    files = [index_file, vectorizer_path(index_file), lsa_path(index_file)]
+    corpus_mb = sum(f.stat().st_size for f in (content_dir / "projects").glob("*.mdx")) / 1e6
+    return {
+        'documents': len(documents),
+        'corpus_mb': round(corpus_mb, 3),
+        'extract_mb_per_s': round(corpus_mb / max(timings['extract_seconds'], 1e-9), 1),
+        'passages': len(index_data['passages']['doc']) if index_data['passages'] else 0,
+        'build_seconds': round(sum(timings.values()), 3),
+        **{name: round(value, 3) for name, value in timings.items()},
+        'index_mb': round(sum(f.stat().st_size for f in files if f.exists()) / 1e6, 3),
+    }
+
+def measure_mode(index_file: Path, mode: str, queries: List[Dict[str, Any]], k: int) -> Dict[str, Any]:
+    """Load an index and run the labelled queries (call in a fresh process)"""
+    rss_before = rss_mb()
+    with contextlib.redirect_stdout(io.StringIO()):
+        searcher = RAGSearcher(str(index_file), mode=mode)
+        rss_loaded = rss_mb()
+        # A second load maps the bundle the first one published, like another worker
+        attached = RAGSearcher(str(index_file), mode=mode)
+
+    latencies = []
+    hits = 0
+    reciprocal_ranks = 0.0
+    for labelled in queries:
+        started = time.perf_counter()
+        results = searcher.search(labelled['query'], k=k)
+        latencies.append(time.perf_counter() - started)
+
+        slugs = [doc['slug'] for doc in results]
+        relevant = set(labelled['relevant'])
+        hits += len(relevant.intersection(slugs)) / len(relevant)
+        rank = next((i for i, slug in enumerate(slugs) if slug in relevant), None)
+        if rank is not None:
+            reciprocal_ranks += 1.0 / (rank + 1)
+
+    return {
+        'load_seconds': round(searcher.load_seconds, 4),
+        'attach_seconds': round(attached.load_seconds, 4),
+        'rss_mb': round(rss_loaded, 1),
+        'index_rss_mb': round(rss_loaded - rss_before, 1),
+        'p50_ms': percentile_ms(latencies, 50),
+        'p99_ms': percentile_ms(latencies, 99),
+        f'recall_at_{k}': round(hits / len(queries), 4),
+        'mrr': round(reciprocal_ranks / len(queries), 4),
+    }
+
+def run_measurement(index_file: Path, mode: str, queries_file: Path, k: int) -> Dict[str, Any]:
+    """Measure a mode in a subprocess so load time and RSS are not skewed by earlier runs"""
+    result = subprocess.run(
+        [sys.executable, __file__, "--measure", str(index_file), "--mode", mode,
+         "--queries-file", str(queries_file), "-k", str(k)],
+        cwd=SERVICE_ROOT, capture_output=True, text=True, check=True,
+    )
+    return json.loads(result.stdout)
+
+def run_benchmark(sizes: List[int], modes: List[str], num_queries: int, k: int,
+                  workdir: Path) -> Dict[str, Any]:
+    results = []
+    for size in sizes:
+        corpus_dir = workdir / f"corpus-{size}"
+        labelled = generate_corpus(corpus_dir / "content", size)
+        rng = np.random.default_rng(1)
+        picked = rng.choice(len(labelled), size=min(num_queries, len(labelled)), replace=False)
+        queries_file = corpus_dir / "queries.json"
+        queries_file.write_text(json.dumps([labelled[i] for i in picked]))
+
+        index_file = corpus_dir / "rag.idx"
+        build = build_index(corpus_dir / "content", index_file, lsa="lsa" in modes)
+        print(f"{size} docs: built in {build['build_seconds']}s, {build['index_mb']} MB", file=sys.stderr)
+
+        for mode in modes:
+            measured = run_measurement(index_file, mode, queries_file, k)
+            results.append({'docs': size, 'mode': mode, **build, **measured})
+            print(json.dumps(results[-1]), file=sys.stderr)
+
+    return {
+        'created_at': datetime.now(timezone.utc).isoformat(),
+        'environment': {
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+        },
+        'k': k,
+        'queries': num_queries,
+        'results': results,
+    }
+
+def compare(report: Dict[str, Any], baseline: Dict[str, Any]) -> List[str]:
+    """Regressions of report against a baseline run, matched on (docs, mode)"""
+    recall_key = f"recall_at_{report['k']}"
+    previous = {(r['docs'], r['mode']): r for r in baseline.get('results', [])}
+    regressions = []
+    for current in report['results']:
+        before = previous.get((current['docs'], current['mode']))
+        if before is None:
+            continue
+        label = f"{current['docs']} docs / {current['mode']}"
+        for metric in ('p99_ms', 'load_seconds', 'build_seconds'):
+            if before.get(metric) and current[metric] > before[metric] * (1 + LATENCY_TOLERANCE):
+                regressions.append(f"{label}: {metric} {before[metric]} -> {current[metric]}")
+        if recall_key in before and current[recall_key] < before[recall_key] - RECALL_TOLERANCE:
+            regressions.append(f"{label}: {recall_key} {before[recall_key]} -> {current[recall_key]}")
+    return regressions
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES,
+                        help='Corpus sizes in documents (up to 100000)')
+    parser.add_argument('--modes', nargs='+', choices=SEARCH_MODES, default=list(SEARCH_MODES))
+    parser.add_argument('--queries', type=int, default=200, help='Labelled queries per corpus')
+    parser.add_argument('-k', type=int, default=4)
+    parser.add_argument('--workdir', help='Keep generated corpora and indexes here')
+    parser.add_argument('--output', help='Also write the JSON report to this file')
+    parser.add_argument('--baseline', help='Earlier JSON report to compare against')
+    parser.add_argument('--measure', help=argparse.SUPPRESS)
+    parser.add_argument('--mode', help=argparse.SUPPRESS)
+    parser.add_argument('--queries-file', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.measure:
+        queries = json.loads(Path(args.queries_file).read_text())
+        print(json.dumps(measure_mode(Path(args.measure), args.mode, queries, args.k)))
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        workdir = Path(args.workdir) if args.workdir else Path(tmp)
+        # Keep shared array bundles with the benchmark indexes
+        os.environ.setdefault("RAG_SHARED_DIR", str(workdir / "rag_shared"))
+        report = run_benchmark(args.sizes, args.modes, args.queries, args.k, workdir)
+
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        Path(args.output).write_text(output + "\n")
+
+    if args.baseline:
+        regressions = compare(report, json.loads(Path(args.baseline).read_text()))
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+"""Measure rate limiter cost and memory with many distinct client IPs
+
+Replays a synthetic stream of requests on a simulated clock: --hot-share
+of them come from --hot clients hammering the service, the rest from
+--clients distinct IPs seen a few times each. Each algorithm runs in its
+own process so RSS growth is its own:
+
+    legacy          the previous /ai/chat limiter, one timestamp per request
+                    in a defaultdict(list) that is never pruned of clients
+    sliding_window  app.core.rate_limit.SlidingWindowCounter
+    token_bucket    app.core.rate_limit.TokenBucket
+
+Reports ns per check, refusals, keys held at the end, evictions and RSS
+growth in MB, printed as JSON.
+
+With --workers N the same traffic is spread round-robin over N limiters
+(as nginx spreads it over uvicorn workers), once deciding locally only
+and once as SharedRateLimiters syncing every --sync-interval simulated
+seconds through an in-memory KV. Reports the most requests any hot
+client got through in one window, KV writes per request and the cost of
+a check and of a sync.
+"""
+
+import argparse
+import asyncio
+import contextlib
+import json
+import random
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+from unittest.mock import patch
+
+SERVICE_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(SERVICE_ROOT))
+
+with contextlib.redirect_stdout(sys.stderr):
+    import app.core.rate_limit as rate_limit  # noqa: E402
+    from app.core.rate_limit import SharedRateLimiter, create_limiter  # noqa: E402
+
+ALGORITHMS = ("legacy", "sliding_window", "token_bucket")
+
+
+def rss_mb() -> float:
+    with open("/proc/self/statm") as f:
+        pages = int(f.read().split()[1])
+    return pages * 4096 / 1e6
+
+
+class LegacyLimiter:
+    """The previous check_rate_limit, with the clock passed in"""
+
+    def __init__(self, limit: int, window: float):
+        self.limit = limit
+        self.window = window
+        self.storage = defaultdict(list)
+
+    def hit(self, ip: str, now: float) -> bool:
+        window_start = now - self.window
+        self.storage[ip] = [t for t in self.storage[ip] if t > window_start]
+        if len(self.storage[ip]) >= self.limit:
+            return False
+        self.storage[ip].append(now)
+        return True
+
+    def __len__(self) -> int:
+        return len(self.storage)
+
+
+def synthetic_traffic(clients: int, requests: int, hot: int, hot_share: float, seed: int) -> List[str]:
+    """Client IP per request; cold clients are drawn from 10.0.0.0/8"""
+    rng = random.Random(seed)
+    hot_ips = [f"198.18.{i >> 8 & 255}.{i & 255}" for i in range(hot)]
+    ips = []
+    for _ in range(requests):
+        if rng.random() < hot_share:
+            ips.append(rng.choice(hot_ips))
+        else:
+            n = rng.randrange(clients)
+            ips.append(f"10.{n >> 16 & 255}.{n >> 8 & 255}.{n & 255}")
+    return ips
+
+
+def run_one(algorithm: str, args) -> Dict[str, Any]:
+    ips = synthetic_traffic(args.clients, args.requests, args.hot, args.hot_share, args.seed)
+    step = args.duration / len(ips)
+
+    if algorithm == "legacy":
+        limiter = LegacyLimiter(args.limit, args.window)
+
+        def check(ip, now):
+            return limiter.hit(ip, now)
+    else:
+        limiter = create_limiter(algorithm, args.limit, args.window, args.max_keys)
+
+        def check(ip, now):
+            return limiter.hit(ip, now).allowed
+
+    before = rss_mb()
+    refused = 0
+    started = time.perf_counter()
+    for i, ip in enumerate(ips):
+        if not check(ip, i * step):
+            refused += 1
+    elapsed = time.perf_counter() - started
+
+    result = {
+        'ns_per_check': round(elapsed / len(ips) * 1e9),
+        'refused': refused,
+        'keys': len(limiter),
+        'rss_growth_mb': round(rss_mb() - before, 1),
+    }
+    if algorithm != "legacy":
+        status = limiter.status()
+        result['evicted_idle'] = status['evicted_idle']
+        result['evicted_active'] = status['evicted_active']
+    return result
+
+
+class MemoryKV:
+    """In-memory stand-in for the KV counters"""
+
+    def __init__(self, enabled: bool):
+        self.enabled = enabled
+        self.data: Dict[str, int] = {}
+        self.calls = 0
+
+    async def incr_ex(self, key: str, by: int, ex: int) -> int:
+        self.calls += 1
+        self.data[key] = self.data.get(key, 0) + by
+        return self.data[key]
+
+
+async def run_workers(shared: bool, ips: List[str], args) -> Dict[str, Any]:
+    fake = MemoryKV(enabled=shared)
+    with patch.object(rate_limit, 'kv', fake):
+        workers = [SharedRateLimiter(create_limiter("sliding_window", args.limit, args.window, args.max_keys),
+                                     "bench", interval=args.sync_interval, batch=args.sync_batch)
+                   for _ in range(args.workers)]
+        step = args.duration / len(ips)
+        hot_allowed: Dict[tuple, int] = defaultdict(int)
+        next_sync = args.sync_interval
+        check_seconds = sync_seconds = 0.0
+        syncs = 0
+        for i, ip in enumerate(ips):
+            now = i * step
+            if now >= next_sync:
+                started = time.perf_counter()
+                for worker in workers:
+                    await worker.sync(now=now)
+                sync_seconds += time.perf_counter() - started
+                syncs += 1
+                next_sync += args.sync_interval
+            started = time.perf_counter()
+            allowed = workers[i % len(workers)].hit(ip, now=now).allowed
+            check_seconds += time.perf_counter() - started
+            if allowed and ip.startswith("198.18."):
+                hot_allowed[(ip, int(now // args.window))] += 1
+
+    return {
+        'max_hot_allowed_per_window': max(hot_allowed.values(), default=0),
+        'kv_writes': fake.calls,
+        'kv_writes_per_request': round(fake.calls / len(ips), 4),
+        'ns_per_check': round(check_seconds / len(ips) * 1e9),
+        'ms_per_sync': round(sync_seconds / max(1, syncs) * 1e3, 2),
+    }
+
+
+def run_shared(args) -> Dict[str, Any]:
+    ips = synthetic_traffic(args.clients, args.requests, args.hot, args.hot_share, args.seed)
+    return {
+        'local_only': asyncio.run(run_workers(False, ips, args)),
+        'shared': asyncio.run(run_workers(True, ips, args)),
+    }
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--clients', type=int, default=1_000_000, help='Range of distinct cold client IPs')
+    parser.add_argument('--requests', type=int, default=3_000_000)
+    parser.add_argument('--hot', type=int, default=100, help='Clients sending --hot-share of the requests')
+    parser.add_argument('--hot-share', type=float, default=0.3)
+    parser.add_argument('--duration', type=float, default=3600, help='Simulated seconds the requests span')
+    parser.add_argument('--limit', type=int, default=20)
+    parser.add_argument('--window', type=float, default=600)
+    parser.add_argument('--max-keys', type=int, default=100_000)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--algorithm', choices=ALGORITHMS, help='Run one algorithm in this process')
+    parser.add_argument('--workers', type=int, default=1, help='Compare local and shared limits over N workers')
+    parser.add_argument('--sync-interval', type=float, default=1.0, help='Simulated seconds between KV syncs')
+    parser.add_argument('--sync-batch', type=int, default=rate_limit.RATE_LIMIT_SYNC_BATCH,
+                        help='Most keys each worker writes per sync')
+    args = parser.parse_args(argv)
+
+    if args.workers > 1:
+        print(json.dumps({
+            'requests': args.requests,
+            'workers': args.workers,
+            'hot_clients': args.hot,
+            'limit': args.limit,
+            'window_seconds': args.window,
+            'sync_interval': args.sync_interval,
+            'sync_batch': args.sync_batch,
+            'results': run_shared(args),
+        }, indent=2))
+        return
+
+    if args.algorithm:
+        print(json.dumps(run_one(args.algorithm, args)))
+        return
+
+    passthrough = list(argv if argv is not None else sys.argv[1:])
+    results = {}
+    for algorithm in ALGORITHMS:
+        out = subprocess.run([sys.executable, __file__, *passthrough, '--algorithm', algorithm],
+                             check=True, capture_output=True, text=True).stdout
+        results[algorithm] = json.loads(out)
+
+    print(json.dumps({
+        'requests': args.requests,
+        'clients': args.clients,
+        'hot_clients': args.hot,
+        'hot_share': args.hot_share,
+        'simulated_seconds': args.duration,
+        'limit': args.limit,
+        'window_seconds': args.window,
+        'max_keys': args.max_keys,
+        'results': results,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
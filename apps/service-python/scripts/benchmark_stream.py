@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+"""Measure the cost of streaming chat responses through /ai/chat
+
+Drives the ASGI app directly (no HTTP server) against the local mock
+upstream and, per configuration, reports:
+
+    frames_per_response   ASGI body sends, i.e. socket writes per answer
+    cpu_ms_per_response   process CPU time spent per answer
+    cpu_us_per_token      the same, divided by tokens per answer
+
+plus parse_us_per_token per stream mode: the CPU cost of turning upstream
+SSE bytes into client frames alone, fed from memory through an in-process
+httpx transport so network wakeups are excluded.
+    first_frame_ms        request start to first SSE frame (perceived TTFT)
+    max_gap_ms            longest pause between frames the client sees
+
+For each stream mode (--stream-modes: re-encoded {"token"} frames or raw
+passthrough), configurations compare one frame per token against
+coalesced frames at each --intervals value. The mock upstream runs in its own process so its
+CPU time is not counted. Results are printed as JSON.
+"""
+
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+SERVICE_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(SERVICE_ROOT))
+
+with contextlib.redirect_stdout(sys.stderr):
+    import httpx  # noqa: E402
+
+    import app.core.streaming as streaming  # noqa: E402
+    from app.core.response_cache import response_cache  # noqa: E402
+    from app.main import app  # noqa: E402
+    from app.routes.chat import ChatMessage, get_openai_passthrough, get_openai_stream  # noqa: E402
+    from scripts.mock_upstream import mock_upstream_process  # noqa: E402
+
+BODY = json.dumps({"messages": [{"role": "user", "content": "Tell me about your work"}],
+                   "mode": "general"}).encode()
+
+
+async def one_response(index: int) -> Dict[str, float]:
+    """Send one chat request through the ASGI app and time its frames"""
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1',
+        'method': 'POST', 'scheme': 'http', 'path': '/ai/chat', 'raw_path': b'/ai/chat',
+        'query_string': b'', 'root_path': '', 'server': ('bench', 80),
+        # A distinct client address per request keeps the rate limiter out of the way
+        'client': (f"10.{index // 65536 % 256}.{index // 256 % 256}.{index % 256}", 1234),
+        'headers': [(b'content-type', b'application/json'),
+                    (b'content-length', str(len(BODY)).encode())],
+    }
+    sent_body = False
+    frame_times: List[float] = []
+
+    async def receive():
+        nonlocal sent_body
+        if not sent_body:
+            sent_body = True
+            return {'type': 'http.request', 'body': BODY, 'more_body': False}
+        await asyncio.Event().wait()  # Client stays connected
+
+    async def send(message):
+        if message['type'] == 'http.response.body' and message.get('body'):
+            frame_times.append(time.perf_counter())
+
+    started = time.perf_counter()
+    await app(scope, receive, send)
+    gaps = [b - a for a, b in zip(frame_times, frame_times[1:])]
+    return {
+        'frames': len(frame_times),
+        'first_frame': frame_times[0] - started,
+        'max_gap': max(gaps, default=0.0),
+    }
+
+
+async def run_config(mode: str, interval: float, tokens: int, responses: int, concurrency: int,
+                     offset: int) -> Dict[str, Any]:
+    streaming.CHAT_STREAM_MODE = mode
+    streaming.CHAT_COALESCE_SECONDS = interval
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def bounded(i: int):
+        async with semaphore:
+            return await one_response(offset + i)
+
+    cpu_started = time.process_time()
+    results = await asyncio.gather(*[bounded(i) for i in range(responses)])
+    cpu = time.process_time() - cpu_started
+
+    return {
+        'stream_mode': mode,
+        'coalesce_ms': interval * 1000,
+        'frames_per_response': statistics.fmean(r['frames'] for r in results),
+        'cpu_ms_per_response': round(cpu * 1000 / responses, 3),
+        'cpu_us_per_token': round(cpu * 1e6 / (responses * tokens), 2),
+        'first_frame_p50_ms': round(statistics.median(r['first_frame'] for r in results) * 1000, 2),
+        'max_gap_ms': round(max(r['max_gap'] for r in results) * 1000, 2),
+    }
+
+
+async def parse_cost(mode: str, tokens: int, rounds: int) -> float:
+    """Microseconds of CPU per token to turn upstream SSE bytes into client frames"""
+    events = [f"data: {json.dumps({'choices': [{'delta': {'content': f' word{i}'}}]})}\n\n".encode()
+              for i in range(tokens)] + [b"data: [DONE]\n\n"]
+
+    async def body():
+        for event in events:  # One network read per event, as a paced upstream delivers them
+            yield event
+
+    os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+    transport = httpx.MockTransport(lambda request: httpx.Response(200, content=body()))
+    messages = [ChatMessage(role="user", content="hi")]
+    async with httpx.AsyncClient(transport=transport) as client:
+        started = time.process_time()
+        for _ in range(rounds):
+            if mode == "passthrough":
+                async for chunk in get_openai_passthrough(messages, streaming.SSEPassthrough(), client):
+                    pass
+            else:
+                async for token in get_openai_stream(messages, client):
+                    f"data: {json.dumps({'token': token})}\n\n"
+        return (time.process_time() - started) * 1e6 / (rounds * tokens)
+
+
+async def run(url: str, tokens: int, responses: int, concurrency: int, modes: List[str],
+              intervals: List[float]) -> List[Dict[str, Any]]:
+    os.environ["OPENAI_BASE_URL"] = url
+    os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+    response_cache.max_entries = 0  # Every answer streams from upstream; repeats would be replayed
+
+    await one_response(0)  # Warm the upstream pool and imports
+    results = []
+    configs = [(mode, interval_ms) for mode in modes for interval_ms in [0.0] + intervals]
+    for n, (mode, interval_ms) in enumerate(configs):
+        results.append(await run_config(mode, interval_ms / 1000, tokens, responses, concurrency,
+                                        (n + 1) * responses))
+    return results
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--tokens', type=int, default=400, help='Tokens per streamed answer')
+    parser.add_argument('--token-interval-ms', type=float, default=2.0, help='Upstream delay between tokens')
+    parser.add_argument('--responses', type=int, default=40)
+    parser.add_argument('--concurrency', type=int, default=20)
+    parser.add_argument('--intervals', type=float, nargs='+', default=[20.0, 50.0],
+                        help='Coalescing intervals (ms) to compare against one frame per token')
+    parser.add_argument('--stream-modes', nargs='+', choices=streaming.STREAM_MODES,
+                        default=list(streaming.STREAM_MODES))
+    args = parser.parse_args(argv)
+
+    with contextlib.redirect_stdout(sys.stderr), mock_upstream_process(
+            '--tokens', str(args.tokens), '--token-interval-ms', str(args.token_interval_ms)) as url:
+        results = asyncio.run(run(url, args.tokens, args.responses, args.concurrency,
+                                  args.stream_modes, args.intervals))
+
+    with contextlib.redirect_stdout(sys.stderr):
+        parse = {mode: round(asyncio.run(parse_cost(mode, args.tokens, 20)), 2) for mode in args.stream_modes}
+
+    report = {
+        'tokens_per_response': args.tokens,
+        'token_interval_ms': args.token_interval_ms,
+        'responses': args.responses,
+        'concurrency': args.concurrency,
+        'parse_us_per_token': parse,
+        'results': results,
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
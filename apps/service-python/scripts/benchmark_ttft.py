@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""Measure chat time-to-first-token against a local mock upstream
+
+Runs the same sequence of chat turns through `get_openai_stream` twice:
+
+    per-request  a new httpx.AsyncClient for every turn (the old behaviour),
+                 so every turn pays connection setup
+    pooled       the shared lifespan client, pre-warmed before the first turn
+
+The mock upstream (scripts/mock_upstream.py) charges `--handshake-ms` for
+each new connection, standing in for DNS + TCP + TLS to a remote API.
+Results are printed as JSON.
+"""
+
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+SERVICE_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(SERVICE_ROOT))
+
+with contextlib.redirect_stdout(sys.stderr):
+    from app.core.upstream import UpstreamClient  # noqa: E402
+    from app.routes.chat import ChatMessage, get_openai_stream  # noqa: E402
+    from scripts.mock_upstream import MockUpstream  # noqa: E402
+
+MESSAGES = [ChatMessage(role="user", content="What have you built with FastAPI?")]
+
+
+def percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * pct / 100), len(ordered) - 1)]
+
+
+async def first_token_seconds(client: httpx.AsyncClient) -> float:
+    """Seconds from sending the request to the first streamed token"""
+    started = time.perf_counter()
+    ttft = None
+    async for _ in get_openai_stream(MESSAGES, client=client):
+        if ttft is None:
+            ttft = time.perf_counter() - started
+    return ttft
+
+
+def summarize(samples: List[float], connections: int) -> Dict[str, Any]:
+    ms = [s * 1000 for s in samples]
+    return {
+        'turns': len(ms),
+        'ttft_p50_ms': round(percentile(ms, 50), 2),
+        'ttft_p99_ms': round(percentile(ms, 99), 2),
+        'ttft_mean_ms': round(statistics.fmean(ms), 2),
+        'connections_opened': connections,
+    }
+
+
+async def run(turns: int, handshake_ms: float, ttft_ms: float) -> Dict[str, Any]:
+    async with MockUpstream(handshake_ms=handshake_ms, ttft_ms=ttft_ms) as mock:
+        os.environ["OPENAI_BASE_URL"] = mock.url
+        os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+
+        samples = []
+        for _ in range(turns):
+            async with httpx.AsyncClient(timeout=60.0) as client:
+                samples.append(await first_token_seconds(client))
+        per_request = summarize(samples, mock.connections)
+
+        mock.connections = 0
+        pooled_client = UpstreamClient()
+        await pooled_client.warm(1)
+        samples = [await first_token_seconds(pooled_client.client) for _ in range(turns)]
+        await pooled_client.close()
+        pooled = summarize(samples, mock.connections)
+
+    return {
+        'handshake_ms': handshake_ms,
+        'upstream_ttft_ms': ttft_ms,
+        'per_request': per_request,
+        'pooled': pooled,
+        'ttft_p50_saved_ms': round(per_request['ttft_p50_ms'] - pooled['ttft_p50_ms'], 2),
+    }
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--turns', type=int, default=50)
+    parser.add_argument('--handshake-ms', type=float, default=60.0,
+                        help='Simulated setup cost of a new upstream connection')
+    parser.add_argument('--ttft-ms', type=float, default=0.0, help='Upstream model latency to first token')
+    args = parser.parse_args(argv)
+
+    report = asyncio.run(run(args.turns, args.handshake_ms, args.ttft_ms))
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,108 +1,272 @@
 #!/usr/bin/env python3
 """Build RAG index from MDX content files"""
 
+import argparse
+import hashlib
 import json
+import os
 import pickle
 import re
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
 from pathlib import Path
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Optional, Tuple
 
 import frontmatter
+import numpy as np
+import yaml
+from frontmatter.default_handlers import YAMLHandler
+from sklearn.decomposition import TruncatedSVD
 from sklearn.feature_extraction.text import TfidfVectorizer
-
+from sklearn.preprocessing import normalize
+
+# Make the service package importable when run as `python scripts/build_rag_index.py`
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.core.ann import IVFIndex  # noqa: E402
+from app.core.bm25 import build_bm25_index  # noqa: E402
+from app.core.facets import build_facet_index  # noqa: E402
+from app.core.index_file import IndexWriter, atomic_write  # noqa: E402
+
+# Passage window and overlap, in words
+PASSAGE_WORDS = 60
+PASSAGE_OVERLAP = 15
+
+WORD_PATTERN = re.compile(r'\S+')
+
+# Dense LSA embedding size
+LSA_DIMS = 128
+
+# Extraction processes; pools only pay off for larger batches of changed files
+EXTRACT_WORKERS = os.cpu_count() or 1
+PARALLEL_MIN_FILES = 64
+
+# Bump when extraction output changes so cached documents in the manifest are re-parsed
+EXTRACTION_VERSION = 2
+
+
+# Inline markup: code spans first so their contents stay verbatim, links
+# before emphasis so URLs are never treated as emphasis. Emphasis cannot
+# open on "* " (list bullets) and may contain whole **strong** spans.
+INLINE_MARKUP = (
+    r'`(?P<code>[^`]+)`'
+    r'|\[(?P<link>[^\]]+)\]\([^\)]+\)'
+    r'|\*\*\*(?P<strong_em>.+?)\*\*\*'
+    r'|\*\*(?P<strong>.+?)\*\*'
+    r'|\*(?!\s)(?P<em>(?:\*\*[^*\n]+\*\*|[^*\n])+)\*'
+    r'|_(?P<underscore>.+?)_'
+)
+INLINE_PATTERN = re.compile(INLINE_MARKUP)
+
+# Fenced code blocks and heading markers, plus inline markup, in one scan
+MARKDOWN_PATTERN = re.compile(
+    r'(?P<fence>```[\s\S]*?```)'
+    r'|^(?P<heading>#{1,6}\s+)(?=.)'
+    r'|' + INLINE_MARKUP,
+    re.MULTILINE
+)
+
+# Bullet and numbered list markers (a bullet may be followed by a number)
+LIST_MARKER_PATTERN = re.compile(r'^[\s]*(?:[-\*\+]\s+(?:\d+\.\s+)?|\d+\.\s+)', re.MULTILINE)
+BLANK_LINES_PATTERN = re.compile(r'\n\s*\n')
+MARKUP_CHARS = frozenset('`[*_')
+
+
+def _replace_markup(match: re.Match) -> str:
+    kind = match.lastgroup
+    if kind in ('fence', 'heading'):
+        return ''
+    text = match.group(kind)
+    if kind == 'code' or MARKUP_CHARS.isdisjoint(text):
+        return text
+    # Nested emphasis or links inside emphasis/link text
+    return INLINE_PATTERN.sub(_replace_markup, text)
 
 def strip_markdown_to_text(content: str) -> str:
-    """Convert markdown to plain text"""
-    # Remove headers
-    content = re.sub(r'^#{1,6}\s+(.+)$', r'\1', content, flags=re.MULTILINE)
-
-    # Remove bold/italic
-    content = re.sub(r'\*\*(.+?)\*\*', r'\1', content)
-    content = re.sub(r'\*(.+?)\*', r'\1', content)
-    content = re.sub(r'_(.+?)_', r'\1', content)
-
-    # Remove links but keep text
-    content = re.sub(r'\[([^\]]+)\]\([^\)]+\)', r'\1', content)
-
-    # Remove code blocks
-    content = re.sub(r'```[\s\S]*?```', '', content)
-    content = re.sub(r'`([^`]+)`', r'\1', content)
-
-    # Remove list markers
-    content = re.sub(r'^[\s]*[-\*\+]\s+', '', content, flags=re.MULTILINE)
-    content = re.sub(r'^[\s]*\d+\.\s+', '', content, flags=re.MULTILINE)
-
-    # Clean up whitespace
-    content = re.sub(r'\n\s*\n', '\n\n', content)
-    content = content.strip()
+    """Convert markdown to plain text
+
+    One tokenizer pass removes fenced code, heading markers, links,
+    emphasis and inline code backticks; list markers and blank lines are
+    then cleaned up line by line. All patterns are precompiled and linear.
+    """
+    content = MARKDOWN_PATTERN.sub(_replace_markup, content)
+    content = LIST_MARKER_PATTERN.sub('', content)
+    content = BLANK_LINES_PATTERN.sub('\n\n', content)
+    return content.strip()
+
+class FastYAMLHandler(YAMLHandler):
+    """Frontmatter handler using libyaml's C loader when PyYAML was built with it"""
+
+    def load(self, fm: str, **kwargs: Any) -> Any:
+        kwargs.setdefault("Loader", getattr(yaml, "CSafeLoader", yaml.SafeLoader))
+        return super().load(fm, **kwargs)
+
+FRONTMATTER_HANDLER = FastYAMLHandler()
+
+def parse_mdx(source: str, stem: str) -> Dict[str, Any]:
+    """Parse one MDX source into an index document"""
+    post = frontmatter.loads(source, handler=FRONTMATTER_HANDLER)
+
+    # Extract metadata
+    title = post.metadata.get('title', stem)
+    description = post.metadata.get('description', '')
+    tags = post.metadata.get('tags', [])
+    tech = post.metadata.get('tech', [])
+
+    # Convert content to plain text
+    plain_text = strip_markdown_to_text(post.content)
+
+    # Combine all text for indexing
+    combined_text = f"{title}. {description}. {plain_text}"
+    if tags:
+        combined_text += f" Tags: {', '.join(tags)}."
+    if tech:
+        combined_text += f" Technologies: {', '.join(tech)}."
 
-    return content
+    return {
+        'id': stem,
+        'slug': stem,
+        'title': title,
+        'description': description,
+        'tags': tags,
+        'tech': tech,
+        'content': post.content,
+        'text': plain_text,
+        'combined_text': combined_text
+    }
 
-def process_mdx_files(content_dir: str) -> List[Dict[str, Any]]:
+def process_mdx_files(content_dir: str, workers: int = EXTRACT_WORKERS) -> List[Dict[str, Any]]:
     """Process all MDX files in the content directory"""
-    content_path = Path(content_dir)
-    projects_path = content_path / "projects"
+    documents, _, _ = collect_documents(content_dir, {}, workers)
+    return documents
+
+def _parse_source(source: Tuple[str, bytes, str]) -> Dict[str, Any]:
+    """Parse one file's bytes into a manifest entry (runs in pool workers)"""
+    stem, raw, digest = source
+    try:
+        # Universal newlines, as when the file is opened in text mode
+        text = raw.decode('utf-8').replace('\r\n', '\n').replace('\r', '\n')
+        return {'sha256': digest, 'document': parse_mdx(text, stem)}
+    except Exception as e:
+        # Remember the failure so an unchanged broken file is not re-parsed every build
+        return {'sha256': digest, 'document': None, 'error': str(e)}
+
+def parse_sources(sources: List[Tuple[str, bytes, str]], workers: int = EXTRACT_WORKERS) -> List[Dict[str, Any]]:
+    """Parse sources in order, fanning out over a process pool for large batches"""
+    if workers > 1 and len(sources) >= PARALLEL_MIN_FILES:
+        chunksize = max(1, len(sources) // (workers * 4))
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(_parse_source, sources, chunksize=chunksize))
+    return [_parse_source(source) for source in sources]
+
+def collect_documents(content_dir: str, cached: Dict[str, Dict[str, Any]], workers: int = EXTRACT_WORKERS
+                      ) -> Tuple[List[Dict[str, Any]], Dict[str, Dict[str, Any]], Dict[str, List[str]]]:
+    """Process MDX files, reusing cached extraction for files whose content hash is unchanged
+
+    Args:
+        content_dir: Web content directory containing projects/*.mdx
+        cached: Manifest file entries from the previous build, {name: {sha256, document}}
+        workers: Extraction processes for added/changed files
+
+    Returns:
+        Tuple of (documents, manifest file entries, changes as added/changed/removed names)
+    """
+    projects_path = Path(content_dir) / "projects"
+    changes: Dict[str, List[str]] = {'added': [], 'changed': [], 'removed': []}
 
     if not projects_path.exists():
         print(f"Warning: Projects directory not found at {projects_path}")
-        return []
-
-    documents = []
-
-    for mdx_file in projects_path.glob("*.mdx"):
-        print(f"Processing {mdx_file.name}...")
-
-        try:
-            # Parse frontmatter and content
-            with open(mdx_file, 'r', encoding='utf-8') as f:
-                post = frontmatter.load(f)
-
-            # Extract metadata
-            title = post.metadata.get('title', mdx_file.stem)
-            description = post.metadata.get('description', '')
-            tags = post.metadata.get('tags', [])
-            tech = post.metadata.get('tech', [])
-
-            # Convert content to plain text
-            plain_text = strip_markdown_to_text(post.content)
-
-            # Combine all text for indexing
-            combined_text = f"{title}. {description}. {plain_text}"
-            if tags:
-                combined_text += f" Tags: {', '.join(tags)}."
-            if tech:
-                combined_text += f" Technologies: {', '.join(tech)}."
-
-            doc = {
-                'id': mdx_file.stem,
-                'slug': mdx_file.stem,
-                'title': title,
-                'description': description,
-                'tags': tags,
-                'tech': tech,
-                'content': post.content,
-                'text': plain_text,
-                'combined_text': combined_text
-            }
-
-            documents.append(doc)
-
-        except Exception as e:
-            print(f"Error processing {mdx_file}: {e}")
-
-    return documents
+        changes['removed'] = sorted(cached)
+        return [], {}, changes
+
+    entries: Dict[str, Optional[Dict[str, Any]]] = {}
+    sources = []
+
+    for mdx_file in sorted(projects_path.glob("*.mdx")):
+        raw = mdx_file.read_bytes()
+        digest = hashlib.sha256(raw).hexdigest()
+        previous = cached.get(mdx_file.name)
+
+        if previous and previous['sha256'] == digest:
+            entries[mdx_file.name] = previous
+        else:
+            changes['changed' if previous else 'added'].append(mdx_file.name)
+            print(f"Processing {mdx_file.name}...")
+            entries[mdx_file.name] = None  # keeps sorted order until parsed
+            sources.append((mdx_file.stem, raw, digest))
+
+    for (stem, _, _), entry in zip(sources, parse_sources(sources, workers)):
+        if entry['document'] is None:
+            print(f"Error processing {projects_path / (stem + '.mdx')}: {entry['error']}")
+        entries[stem + '.mdx'] = entry
+
+    documents = [entry['document'] for entry in entries.values() if entry['document'] is not None]
+    changes['removed'] = sorted(set(cached) - set(entries))
+    return documents, entries, changes
+
+def split_into_passages(text: str, size: int = PASSAGE_WORDS, overlap: int = PASSAGE_OVERLAP) -> List[Tuple[int, int]]:
+    """Split text into overlapping word windows
+
+    Returns:
+        List of (start, end) character offsets into text; always at least one
+    """
+    words = [(m.start(), m.end()) for m in WORD_PATTERN.finditer(text)]
+    if not words:
+        return [(0, len(text))]
+
+    step = max(size - overlap, 1)
+    passages = []
+    for first in range(0, len(words), step):
+        last = min(first + size, len(words)) - 1
+        passages.append((words[first][0], words[last][1]))
+        if last == len(words) - 1:
+            break
+    return passages
+
+def build_passages(documents: List[Dict[str, Any]]) -> Tuple[Dict[str, List[int]], List[str]]:
+    """Chunk every document into passages for passage-level scoring
+
+    Each passage is indexed together with its document title (and the
+    description on the first passage) so that document-level terms still
+    match, while the offsets point into the document's plain text.
+
+    Returns:
+        Tuple of (passage offsets as parallel lists, passage texts to index)
+    """
+    passages: Dict[str, List[int]] = {'doc': [], 'start': [], 'end': []}
+    texts = []
+
+    for doc_idx, doc in enumerate(documents):
+        text = doc.get('text', '')
+        suffix = ''
+        if doc.get('tags'):
+            suffix += f" Tags: {', '.join(doc['tags'])}."
+        if doc.get('tech'):
+            suffix += f" Technologies: {', '.join(doc['tech'])}."
+
+        for i, (start, end) in enumerate(split_into_passages(text)):
+            header = f"{doc['title']}. {doc.get('description', '')}." if i == 0 else f"{doc['title']}."
+            passages['doc'].append(doc_idx)
+            passages['start'].append(start)
+            passages['end'].append(end)
+            texts.append(f"{header} {text[start:end]}{suffix}")
+
+    return passages, texts
 
 def build_tfidf_index(documents: List[Dict[str, Any]]) -> Dict[str, Any]:
-    """Build TF-IDF index from documents"""
+    """Build passage-level TF-IDF index from documents"""
     if not documents:
         return {
             'documents': [],
+            'passages': None,
             'vectorizer': None,
-            'vectors': None
+            'vectors': None,
+            'bm25': None
         }
 
-    # Extract text for vectorization
-    texts = [doc['combined_text'] for doc in documents]
+    # Extract passage text for vectorization
+    passages, texts = build_passages(documents)
 
     # Create TF-IDF vectorizer
     vectorizer = TfidfVectorizer(
@@ -116,72 +280,222 @@ def build_tfidf_index(documents: List[Dict[str, Any]]) -> Dict[str, Any]:
     # Fit and transform texts
     tfidf_matrix = vectorizer.fit_transform(texts)
 
+    # Inverted index with BM25 statistics for RAG_SEARCH_MODE=bm25
+    bm25 = build_bm25_index(texts)
+
     return {
         'documents': documents,
+        'passages': passages,
         'vectorizer': vectorizer,
-        'vectors': tfidf_matrix
+        'vectors': tfidf_matrix,
+        'bm25': bm25
     }
 
-def save_rag_index(index_data: Dict[str, Any], output_file: str):
-    """Save RAG index to file"""
-    # Prepare serializable data
-    serializable_data = {
-        'documents': index_data['documents'],
-        'feature_names': index_data['vectorizer'].get_feature_names_out().tolist() if index_data['vectorizer'] else [],
-        'vectors_array': index_data['vectors'].toarray().tolist() if index_data['vectors'] is not None else []
-    }
+def build_lsa_index(tfidf_matrix, dims: int = LSA_DIMS, quantize: bool = False) -> Dict[str, Any]:
+    """Project TF-IDF passages into a dense LSA space and cluster them for IVF search
+
+    Returns:
+        Arrays for the `_lsa.npz` file: the SVD components used to project
+        queries plus the IVF index over unit-length passage embeddings
+        (float32, or int8 codes with per-row scales when quantized).
+        Empty when the corpus is too small to factorize.
+    """
+    dims = min(dims, min(tfidf_matrix.shape) - 1)
+    if dims < 1:
+        return {}
 
-    # Save to JSON
-    with open(output_file, 'w', encoding='utf-8') as f:
-        json.dump(serializable_data, f, indent=2, ensure_ascii=False)
+    svd = TruncatedSVD(n_components=dims, random_state=42)
+    embeddings = normalize(svd.fit_transform(tfidf_matrix)).astype(np.float32)
+    ivf = IVFIndex.build(embeddings, quantize=quantize)
 
-    # Also save vectorizer separately for runtime use
-    vectorizer_file = output_file.replace('.json', '_vectorizer.pkl')
-    if index_data['vectorizer']:
-        with open(vectorizer_file, 'wb') as f:
-            pickle.dump(index_data['vectorizer'], f)
+    print(f"LSA: {dims} dims, explained variance {svd.explained_variance_ratio_.sum():.2f}, "
+          f"{ivf.nlist} IVF lists")
+    return {'components': svd.components_.astype(np.float32), **ivf.to_arrays()}
 
-    print(f"RAG index saved to {output_file}")
+def save_rag_index(index_data: Dict[str, Any], output_file: str):
+    """Stream the RAG index to disk section by section
+
+    Documents, vocabulary and BM25 terms are written in chunks and the
+    passage matrix as binary blocks, all compressed, so memory stays
+    bounded by one chunk. Every file is written to a temp name and renamed
+    into place; the index goes last so it never refers to missing
+    companions. See `app.core.index_file` for the format.
+    """
+    output_path = Path(output_file)
+    documents = index_data['documents']
+    passages = index_data.get('passages')
+    vectorizer = index_data['vectorizer']
+    feature_names = vectorizer.get_feature_names_out() if vectorizer else []
+
+    # Vectorizer for runtime query encoding
+    vectorizer_file = output_path.with_name(output_path.stem + '_vectorizer.pkl')
+    if vectorizer:
+        atomic_write(vectorizer_file, lambda f: pickle.dump(vectorizer, f))
+    elif vectorizer_file.exists():
+        vectorizer_file.unlink()
+
+    # Dense embeddings for RAG_SEARCH_MODE=lsa; an older file would not match the new passages
+    lsa_file = output_path.with_name(output_path.stem + '_lsa.npz')
+    if index_data.get('lsa'):
+        atomic_write(lsa_file, lambda f: np.savez(f, **index_data['lsa']))
+        print(f"LSA index saved to {lsa_file}")
+    elif lsa_file.exists():
+        lsa_file.unlink()
+        print(f"Removed stale LSA index {lsa_file}")
+
+    with IndexWriter(output_path) as writer:
+        writer.write_value('metadata', {
+            'num_documents': len(documents),
+            'num_passages': len(passages['doc']) if passages else 0,
+            'num_features': len(feature_names),
+            'created_at': datetime.now(timezone.utc).isoformat()
+        })
+        writer.write_list('documents', documents)
+        writer.write_list('feature_names', (str(name) for name in feature_names), chunk_size=4096)
+
+        # Slug -> id map and tag/tech bitsets for filtered retrieval
+        writer.write_dict('slug_index', ((doc['slug'], i) for i, doc in enumerate(documents)))
+        writer.write_value('facets', build_facet_index(documents))
+
+        if passages:
+            for key in ('doc', 'start', 'end'):
+                writer.write_array(f'passages.{key}', np.asarray(passages[key], dtype=np.int32))
+
+        # Passage matrix as CSR blocks; a dense copy grows with passages x features
+        if index_data['vectors'] is not None:
+            vectors = index_data['vectors'].tocsr()
+            writer.write_value('vectors_csr.shape', list(vectors.shape))
+            writer.write_array('vectors_csr.data', vectors.data)
+            writer.write_array('vectors_csr.indices', vectors.indices)
+            writer.write_array('vectors_csr.indptr', vectors.indptr)
+
+        bm25 = index_data.get('bm25')
+        if bm25:
+            writer.write_dict('bm25', ((key, bm25[key]) for key in ('k1', 'b', 'num_docs', 'avgdl')))
+            writer.write_array('bm25.doc_lengths', np.asarray(bm25['doc_lengths'], dtype=np.int32))
+            writer.write_dict('bm25.terms', bm25['terms'].items())
+
+    print(f"RAG index saved to {output_file} ({writer.sections} sections)")
     print(f"Vectorizer saved to {vectorizer_file}")
 
-def main():
-    """Main function to build RAG index"""
-    # Determine paths
-    script_dir = Path(__file__).parent
-    service_root = script_dir.parent
-    web_content_dir = service_root.parent.parent / "apps" / "web" / "content"
-    output_file = service_root / "data" / "rag.json"
+def manifest_path(output_file: Path) -> Path:
+    return output_file.with_name(output_file.stem + '_manifest.json')
+
+def load_manifest(path: Path) -> Dict[str, Any]:
+    """Previous build manifest, or an empty one if missing or unreadable"""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_manifest(path: Path, manifest: Dict[str, Any]):
+    """Write the manifest atomically so an interrupted build never leaves a partial one"""
+    atomic_write(path, lambda f: json.dump(manifest, f, ensure_ascii=False), mode='w', encoding='utf-8')
+
+def output_files(output_file: Path) -> List[Path]:
+    """The index and every companion file a build may write next to it"""
+    return [output_file,
+            output_file.with_name(output_file.stem + '_vectorizer.pkl'),
+            output_file.with_name(output_file.stem + '_lsa.npz')]
+
+def output_digests(output_file: Path) -> Dict[str, str]:
+    """Content hash of each build output present on disk, by file name"""
+    return {path.name: hashlib.sha256(path.read_bytes()).hexdigest()
+            for path in output_files(output_file) if path.exists()}
+
+def build_index(content_dir: Path, output_file: Path, lsa_dims: int = LSA_DIMS,
+                int8: bool = False, force: bool = False, workers: int = EXTRACT_WORKERS) -> bool:
+    """Build the RAG index incrementally
+
+    Extraction is cached per source file in `<output>_manifest.json`, keyed
+    by content hash. The vectorizer and index statistics are corpus-wide,
+    so any added, changed or removed file refits them from the cached
+    documents; when nothing changed no file is written at all. The
+    manifest also records a hash of every output it wrote, so a missing,
+    replaced or leftover index or companion file forces a rebuild.
+
+    Returns:
+        True if the index was written, False if it was already up to date
+    """
+    # Settings that change the output; any difference forces a full rebuild
+    settings = {
+        'extraction_version': EXTRACTION_VERSION,
+        'passage_words': PASSAGE_WORDS,
+        'passage_overlap': PASSAGE_OVERLAP,
+        'lsa_dims': lsa_dims,
+        'int8': int8,
+    }
+    manifest_file = manifest_path(output_file)
+    manifest = {} if force else load_manifest(manifest_file)
+    if manifest.get('settings') != settings:
+        manifest = {}
 
-    print(f"Looking for content in: {web_content_dir}")
-    print(f"Output file: {output_file}")
+    # Process MDX files, reusing cached extraction for unchanged ones
+    documents, entries, changes = collect_documents(str(content_dir), manifest.get('files', {}), workers)
+    print(f"Processed {len(documents)} documents "
+          f"({len(changes['added'])} added, {len(changes['changed'])} changed, {len(changes['removed'])} removed)")
 
-    # Ensure output directory exists
-    output_file.parent.mkdir(exist_ok=True)
+    outputs_intact = manifest.get('outputs') == output_digests(output_file)
+    if manifest and not any(changes.values()) and outputs_intact:
+        print("RAG index is up to date, nothing to write")
+        return False
 
-    # Process MDX files
-    documents = process_mdx_files(str(web_content_dir))
-    print(f"Processed {len(documents)} documents")
+    new_manifest = {'settings': settings, 'files': entries}
 
     if not documents:
         print("No documents found. Creating empty index.")
         empty_index = {
             'documents': [],
+            'passages': None,
             'vectorizer': None,
-            'vectors': None
+            'vectors': None,
+            'bm25': None
         }
         save_rag_index(empty_index, str(output_file))
-        return
+        save_manifest(manifest_file, {**new_manifest, 'outputs': output_digests(output_file)})
+        return True
 
-    # Build TF-IDF index
-    print("Building TF-IDF index...")
+    # Build TF-IDF and BM25 indexes
+    print("Building TF-IDF and BM25 indexes...")
     index_data = build_tfidf_index(documents)
 
-    # Save index
+    if lsa_dims > 0:
+        print("Building LSA embeddings and IVF index...")
+        index_data['lsa'] = build_lsa_index(index_data['vectors'], lsa_dims, quantize=int8)
+
+    # Save index, then the manifest that marks it as built from these sources
     save_rag_index(index_data, str(output_file))
+    save_manifest(manifest_file, {**new_manifest, 'outputs': output_digests(output_file)})
 
-    print("RAG index build complete!")
+    print(f"RAG index build complete! ({len(index_data['passages']['doc'])} passages)")
     for doc in documents:
         print(f"  - {doc['title']} ({doc['slug']})")
+    return True
+
+def main():
+    """Main function to build RAG index"""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--lsa-dims', type=int, default=LSA_DIMS,
+                        help='LSA embedding dimensions (0 disables the dense index)')
+    parser.add_argument('--int8', action='store_true', help='Store LSA embeddings int8-quantized')
+    parser.add_argument('--force', action='store_true', help='Ignore the build manifest and rebuild everything')
+    parser.add_argument('--workers', type=int, default=EXTRACT_WORKERS, help='Extraction processes')
+    args = parser.parse_args()
+
+    # Determine paths
+    script_dir = Path(__file__).parent
+    service_root = script_dir.parent
+    web_content_dir = service_root.parent.parent / "apps" / "web" / "content"
+    output_file = service_root / "data" / "rag.idx"
+
+    print(f"Looking for content in: {web_content_dir}")
+    print(f"Output file: {output_file}")
+
+    # Ensure output directory exists
+    output_file.parent.mkdir(exist_ok=True)
+
+    build_index(web_content_dir, output_file, args.lsa_dims, args.int8, args.force, args.workers)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,290 @@
+#!/usr/bin/env python3
+"""Load test /ai/chat with many concurrent SSE sessions
+
+By default the app runs in-process (ASGI, no HTTP server) against
+scripts/mock_upstream.py in a subprocess, so no API key or network access
+is needed and runs are repeatable. Each session gets its own client
+address and, unless --repeat-question is set, its own question, so the
+rate limiter and the response cache do not hide the upstream path.
+
+With --url a running server is driven over HTTP instead; start it with
+OPENAI_BASE_URL pointing at a mock upstream to stay offline. All
+sessions then share this machine's IP, and the chat rate limit (20 chats
+per IP per 10 minutes) answers the rest with 429, counted as http_429.
+
+Reported as JSON:
+    ttft_ms             request start to first token frame (p50/p90/p99)
+    itl_ms              per-session mean time between tokens (p50/p90/p99)
+    frame_gap_ms        gaps between consecutive token frames (p50/p90/p99)
+    throughput          completed sessions and tokens per second of wall time
+    errors              failed sessions by HTTP status or in-stream error
+    event_loop_lag_ms   how late a 10 ms timer fires under load (in-process only)
+    rss_mb              resident memory at the end and peak (this process, or --server-pid)
+"""
+
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import resource
+import sys
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence
+
+SERVICE_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(SERVICE_ROOT))
+
+with contextlib.redirect_stdout(sys.stderr):
+    import httpx  # noqa: E402
+
+    from scripts.mock_upstream import mock_upstream_process, split_tokens  # noqa: E402
+
+LAG_INTERVAL = 0.01
+
+
+def percentiles(values: Sequence[float], scale: float = 1000.0) -> Dict[str, Optional[float]]:
+    """p50/p90/p99 and max of `values` (seconds, reported in ms by default)"""
+    if not values:
+        return {'p50': None, 'p90': None, 'p99': None, 'max': None}
+    ordered = sorted(values)
+
+    def at(p: float) -> float:
+        return round(ordered[min(len(ordered) - 1, int(p * len(ordered)))] * scale, 2)
+
+    return {'p50': at(0.5), 'p90': at(0.9), 'p99': at(0.99), 'max': round(ordered[-1] * scale, 2)}
+
+
+def frame_text(data: str) -> Optional[str]:
+    """Token text of one SSE data payload ({"token"} or OpenAI chunk), '' for control frames
+
+    Raises:
+        RuntimeError: The frame reports an error
+    """
+    if data == "[DONE]":
+        return ""
+    event = json.loads(data)
+    if 'error' in event:
+        raise RuntimeError(str(event['error']))
+    if 'token' in event:
+        return event['token']
+    choices = event.get('choices') or [{}]
+    return choices[0].get('delta', {}).get('content') or ""
+
+
+class Session:
+    """Timings of one chat session, fed with SSE data payloads as they arrive"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.status = 0
+        self.token_times: List[float] = []
+        self.tokens = 0
+        self.error: Optional[str] = None
+
+    def feed_lines(self, text: str):
+        now = time.perf_counter()
+        for line in text.splitlines():
+            if not line.startswith("data: ") or self.error:
+                continue
+            try:
+                content = frame_text(line[6:])
+            except RuntimeError:
+                self.error = "stream_error"
+                continue
+            except ValueError:
+                continue
+            if content:
+                self.token_times.append(now)
+                self.tokens += len(split_tokens(content)) or 1
+
+    def result(self) -> Dict[str, Any]:
+        ok = self.status == 200 and self.error is None and bool(self.token_times)
+        times = self.token_times
+        return {
+            'ok': ok,
+            'error': None if ok else (self.error or (f"http_{self.status}" if self.status != 200 else "empty")),
+            'ttft': times[0] - self.started if times else None,
+            'itl': (times[-1] - times[0]) / (self.tokens - 1) if self.tokens > 1 else None,
+            'gaps': [b - a for a, b in zip(times, times[1:])],
+            'tokens': self.tokens,
+        }
+
+
+def chat_body(index: int, question: str, mode: str, repeat: bool) -> bytes:
+    content = question if repeat else f"{question} (session {index})"
+    return json.dumps({"messages": [{"role": "user", "content": content}], "mode": mode}).encode()
+
+
+async def asgi_session(app, index: int, body: bytes) -> Dict[str, Any]:
+    """One chat through the ASGI app, timing body frames as the app sends them"""
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1',
+        'method': 'POST', 'scheme': 'http', 'path': '/ai/chat', 'raw_path': b'/ai/chat',
+        'query_string': b'', 'root_path': '', 'server': ('load', 80),
+        # A distinct client address per session keeps the per-IP rate limit out of the way
+        'client': (f"10.{index // 65536 % 256}.{index // 256 % 256}.{index % 256}", 1234),
+        'headers': [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode())],
+    }
+    session = Session()
+    sent_body = False
+
+    async def receive():
+        nonlocal sent_body
+        if not sent_body:
+            sent_body = True
+            return {'type': 'http.request', 'body': body, 'more_body': False}
+        await asyncio.Event().wait()  # Client stays connected
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            session.status = message['status']
+        elif message['type'] == 'http.response.body' and message.get('body') and session.status == 200:
+            session.feed_lines(message['body'].decode('utf-8', 'replace'))
+
+    await app(scope, receive, send)
+    return session.result()
+
+
+async def http_session(client: httpx.AsyncClient, url: str, body: bytes) -> Dict[str, Any]:
+    """One chat against a running server"""
+    session = Session()
+    try:
+        async with client.stream("POST", f"{url.rstrip('/')}/ai/chat", content=body,
+                                 headers={'content-type': 'application/json'}) as response:
+            session.status = response.status_code
+            if response.status_code == 200:
+                async for line in response.aiter_lines():
+                    session.feed_lines(line)
+    except httpx.HTTPError as e:
+        session.error = type(e).__name__
+    return session.result()
+
+
+async def measure_lag(stop: asyncio.Event, samples: List[float]):
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(LAG_INTERVAL)
+        samples.append(max(0.0, time.perf_counter() - started - LAG_INTERVAL))
+
+
+def rss_mb(pid: Optional[int] = None) -> Dict[str, Optional[float]]:
+    """Current and peak resident memory of `pid` (default: this process)"""
+    try:
+        status = Path(f"/proc/{pid or 'self'}/status").read_text()
+        fields = {line.split(':')[0]: line.split()[1] for line in status.splitlines()
+                  if line.startswith(('VmRSS', 'VmHWM'))}
+        return {'current': round(int(fields['VmRSS']) / 1024, 1), 'peak': round(int(fields['VmHWM']) / 1024, 1)}
+    except (OSError, KeyError):
+        if pid:
+            return {'current': None, 'peak': None}
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return {'current': None, 'peak': round(peak / 1024, 1)}  # KB on Linux
+
+
+def summarize(results: List[Dict[str, Any]], wall: float, lag: Optional[List[float]],
+              rss: Dict[str, Optional[float]]) -> Dict[str, Any]:
+    completed = [r for r in results if r['ok']]
+    tokens = sum(r['tokens'] for r in completed)
+    return {
+        'sessions': len(results),
+        'completed': len(completed),
+        'errors': dict(Counter(r['error'] for r in results if not r['ok'])),
+        'wall_seconds': round(wall, 3),
+        'throughput': {'sessions_per_sec': round(len(completed) / wall, 2),
+                       'tokens_per_sec': round(tokens / wall, 1)},
+        'ttft_ms': percentiles([r['ttft'] for r in completed]),
+        'itl_ms': percentiles([r['itl'] for r in completed if r['itl'] is not None]),
+        'frame_gap_ms': percentiles([gap for r in completed for gap in r['gaps']]),
+        'event_loop_lag_ms': percentiles(lag) if lag is not None else None,
+        'rss_mb': rss,
+    }
+
+
+async def run_load(sessions: int, concurrency: int, question: str, mode: str, repeat: bool,
+                   url: Optional[str] = None, server_pid: Optional[int] = None) -> Dict[str, Any]:
+    """Run `sessions` chats, at most `concurrency` at a time, and summarize them
+
+    Args:
+        url: Running server to drive; None runs the app in-process
+        server_pid: Process whose memory to report in --url mode
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    lag: Optional[List[float]] = None
+    stop = asyncio.Event()
+
+    if url is None:
+        with contextlib.redirect_stdout(sys.stderr):
+            from app.main import app
+        lag = []
+        monitor = asyncio.create_task(measure_lag(stop, lag))
+
+        async def one(i: int):
+            async with semaphore:
+                return await asgi_session(app, i, chat_body(i, question, mode, repeat))
+
+        started = time.perf_counter()
+        with contextlib.redirect_stdout(sys.stderr):
+            results = await asyncio.gather(*[one(i) for i in range(sessions)])
+        wall = time.perf_counter() - started
+        stop.set()
+        await monitor
+        return summarize(results, wall, lag, rss_mb())
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(timeout=httpx.Timeout(60.0, connect=10.0), limits=limits) as client:
+        async def one_http(i: int):
+            async with semaphore:
+                return await http_session(client, url, chat_body(i, question, mode, repeat))
+
+        started = time.perf_counter()
+        results = await asyncio.gather(*[one_http(i) for i in range(sessions)])
+        wall = time.perf_counter() - started
+    return summarize(results, wall, None, rss_mb(server_pid) if server_pid else {'current': None, 'peak': None})
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sessions', type=int, default=200, help='Chats to run')
+    parser.add_argument('--concurrency', type=int, default=50, help='Chats in flight at once')
+    parser.add_argument('--mode', choices=['general', 'projects', 'resume'], default='general')
+    parser.add_argument('--question', default="What have you built recently?")
+    parser.add_argument('--repeat-question', action='store_true',
+                        help='Send the same question every time (exercises the response cache)')
+    parser.add_argument('--url', help='Drive a running server instead of the in-process app')
+    parser.add_argument('--server-pid', type=int, help='Report this process\'s RSS in --url mode')
+    mock = parser.add_argument_group('mock upstream (in-process mode)')
+    mock.add_argument('--ttft-ms', type=float, default=300.0)
+    mock.add_argument('--tokens-per-sec', type=float, default=50.0)
+    mock.add_argument('--tokens', type=int, default=100, help='Tokens per answer')
+    mock.add_argument('--error-rate', type=float, default=0.0)
+    mock.add_argument('--error-mode', choices=['status', 'stream'], default='status')
+    mock.add_argument('--payload-file', help='Answers for the mock to stream')
+    args = parser.parse_args(argv)
+
+    config = {key: getattr(args, key) for key in ('sessions', 'concurrency', 'mode', 'repeat_question')}
+    if args.url:
+        report = asyncio.run(run_load(args.sessions, args.concurrency, args.question, args.mode,
+                                      args.repeat_question, url=args.url, server_pid=args.server_pid))
+        config['url'] = args.url
+    else:
+        flags = ['--ttft-ms', str(args.ttft_ms), '--tokens-per-sec', str(args.tokens_per_sec),
+                 '--tokens', str(args.tokens), '--error-rate', str(args.error_rate),
+                 '--error-mode', args.error_mode, '--seed', '1']
+        if args.payload_file:
+            flags += ['--payload-file', args.payload_file]
+        with contextlib.redirect_stdout(sys.stderr), mock_upstream_process(*flags) as upstream_url:
+            os.environ["OPENAI_BASE_URL"] = upstream_url
+            os.environ.setdefault("OPENAI_API_KEY", "load-test")
+            report = asyncio.run(run_load(args.sessions, args.concurrency, args.question, args.mode,
+                                          args.repeat_question))
+        config.update(ttft_ms=args.ttft_ms, tokens_per_sec=args.tokens_per_sec, tokens=args.tokens,
+                      error_rate=args.error_rate)
+
+    print(json.dumps({'config': config, **report}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+"""
+Minimal OpenAI-compatible streaming upstream for local measurements
+
+Serves `POST /chat/completions` as an SSE stream (with a final usage
+event when `stream_options.include_usage` is set) and `GET /models` over
+HTTP/1.1 with keep-alive, on a raw asyncio server so its own overhead
+stays negligible. Every new connection sleeps `handshake_ms` before it is
+served, standing in for the TCP + TLS round trips a fresh connection to a
+remote API costs; reused connections skip it.
+
+Answers are paced by `ttft_ms` and `tokens_per_sec` (or
+`token_interval_ms`), and come from `payloads` (answer texts split into
+word tokens, used in turn) or a fixed token list. With `error_rate`, that
+fraction of completions fails: with an HTTP error status, or in the
+middle of the stream with an error event (`error_mode="stream"`).
+
+Usage:
+    python scripts/mock_upstream.py --port 8081 --handshake-ms 60
+    python scripts/mock_upstream.py --ttft-ms 400 --tokens-per-sec 50 --error-rate 0.02 \
+        --payload-file answers.json
+    OPENAI_BASE_URL=http://127.0.0.1:8081/v1 OPENAI_API_KEY=test uvicorn app.main:app
+"""
+
+import argparse
+import asyncio
+import contextlib
+import json
+import random
+import re
+import socket
+import subprocess
+import sys
+from pathlib import Path
+from typing import Iterator, List, Optional
+
+DEFAULT_TOKENS = ["Hello", " from", " the", " mock", " upstream", "."]
+ERROR_MODES = ("status", "stream")
+
+# Words with their leading whitespace, roughly how a tokenizer streams text
+WORD_PATTERN = re.compile(r"\s*\S+")
+
+
+def split_tokens(text: str) -> List[str]:
+    return WORD_PATTERN.findall(text)
+
+
+class MockUpstream:
+    """Asyncio HTTP/1.1 server streaming canned chat completions"""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, handshake_ms: float = 0.0,
+                 ttft_ms: float = 0.0, token_interval_ms: float = 0.0,
+                 tokens: Optional[List[str]] = None, tokens_per_sec: float = 0.0,
+                 payloads: Optional[List[str]] = None, error_rate: float = 0.0,
+                 error_status: int = 500, error_mode: str = "status", seed: Optional[int] = None):
+        if error_mode not in ERROR_MODES:
+            raise ValueError(f"error_mode must be one of {ERROR_MODES}")
+        self.host = host
+        self.port = port
+        self.handshake_ms = handshake_ms
+        self.ttft_ms = ttft_ms
+        self.token_interval_ms = 1000 / tokens_per_sec if tokens_per_sec > 0 else token_interval_ms
+        self.tokens = tokens or DEFAULT_TOKENS
+        self.answers = [split_tokens(text) for text in payloads] if payloads else [self.tokens]
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.error_mode = error_mode
+        self._random = random.Random(seed)
+        self.connections = 0
+        self.requests = 0
+        self.completions = 0
+        self.errors = 0
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    @property
+    def url(self) -> str:
+        """Base URL to use as OPENAI_BASE_URL"""
+        return f"http://{self.host}:{self.port}/v1"
+
+    async def start(self) -> "MockUpstream":
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def __aenter__(self) -> "MockUpstream":
+        return await self.start()
+
+    async def __aexit__(self, *exc):
+        await self.stop()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.connections += 1
+        try:
+            if self.handshake_ms:
+                await asyncio.sleep(self.handshake_ms / 1000)
+
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, path, _ = request_line.decode('latin-1').split(' ', 2)
+
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+
+                length = int(headers.get('content-length', 0))
+                body = await reader.readexactly(length) if length else b''
+                self.requests += 1
+
+                if method == 'POST' and path.endswith('/chat/completions'):
+                    options = json.loads(body or b'{}').get('stream_options') or {}
+                    await self._stream_completion(writer, bool(options.get('include_usage')))
+                else:
+                    body = json.dumps({"object": "list", "data": [{"id": "mock-model"}]}).encode()
+                    writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                                 b"Content-Length: " + str(len(body)).encode() + b"\r\n\r\n" + body)
+                    await writer.drain()
+
+                if headers.get('connection', '').lower() == 'close':
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def _stream_completion(self, writer: asyncio.StreamWriter, include_usage: bool = False):
+        tokens = self.answers[self.completions % len(self.answers)]
+        self.completions += 1
+        fail = self.error_rate > 0 and self._random.random() < self.error_rate
+        if fail:
+            self.errors += 1
+        error = {"error": {"message": "Mock upstream error", "type": "server_error"}}
+
+        if fail and self.error_mode == "status":
+            body = json.dumps(error).encode()
+            writer.write(f"HTTP/1.1 {self.error_status} Mock Error\r\nContent-Type: application/json\r\n"
+                         f"Content-Length: {len(body)}\r\n\r\n".encode() + body)
+            await writer.drain()
+            return
+
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\n"
+                     b"Transfer-Encoding: chunked\r\n\r\n")
+        await writer.drain()
+        if self.ttft_ms:
+            await asyncio.sleep(self.ttft_ms / 1000)
+
+        for i, token in enumerate(tokens):
+            if fail and i == len(tokens) // 2:
+                self._write_chunk(writer, f"data: {json.dumps(error)}\n\n".encode())
+                break
+            if i and self.token_interval_ms:
+                await asyncio.sleep(self.token_interval_ms / 1000)
+            event = {"choices": [{"delta": {"content": token}}]}
+            self._write_chunk(writer, f"data: {json.dumps(event)}\n\n".encode())
+            await writer.drain()
+
+        if include_usage and not fail:
+            usage = {"prompt_tokens": 10, "completion_tokens": len(tokens),
+                     "total_tokens": 10 + len(tokens)}
+            self._write_chunk(writer, f"data: {json.dumps({'choices': [], 'usage': usage})}\n\n".encode())
+        self._write_chunk(writer, b"data: [DONE]\n\n")
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+
+    @staticmethod
+    def _write_chunk(writer: asyncio.StreamWriter, data: bytes):
+        writer.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+
+
+def load_payloads(path: str) -> List[str]:
+    """Answer texts from a JSON list of strings, or a text file with one answer per line"""
+    text = Path(path).read_text(encoding='utf-8')
+    if path.endswith('.json'):
+        return [str(answer) for answer in json.loads(text)]
+    return [line for line in text.splitlines() if line.strip()]
+
+
+@contextlib.contextmanager
+def mock_upstream_process(*args: str) -> Iterator[str]:
+    """Run this script in a subprocess (own CPU, own event loop) and yield its base URL
+
+    Args:
+        args: Extra command line flags, e.g. ("--tokens", "400")
+    """
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+
+    process = subprocess.Popen([sys.executable, str(Path(__file__).resolve()), '--port', str(port), *args],
+                               stdout=subprocess.PIPE, text=True)
+    try:
+        process.stdout.readline()  # "listening" line
+        yield f"http://127.0.0.1:{port}/v1"
+    finally:
+        process.terminate()
+        process.wait()
+
+
+async def serve(args):
+    tokens = [f" word{i}" for i in range(args.tokens)] if args.tokens else None
+    payloads = load_payloads(args.payload_file) if args.payload_file else None
+    mock = MockUpstream(args.host, args.port, args.handshake_ms, args.ttft_ms, args.token_interval_ms, tokens,
+                        tokens_per_sec=args.tokens_per_sec, payloads=payloads, error_rate=args.error_rate,
+                        error_status=args.error_status, error_mode=args.error_mode, seed=args.seed)
+    await mock.start()
+    print(f"Mock upstream listening on {mock.url}", flush=True)
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await mock.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mock OpenAI-compatible streaming upstream")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--handshake-ms', type=float, default=0.0,
+                        help='Delay before serving a new connection (simulated TCP + TLS setup)')
+    parser.add_argument('--ttft-ms', type=float, default=0.0, help='Delay before the first token')
+    parser.add_argument('--token-interval-ms', type=float, default=0.0, help='Delay between tokens')
+    parser.add_argument('--tokens-per-sec', type=float, default=0.0,
+                        help='Token rate (overrides --token-interval-ms)')
+    parser.add_argument('--tokens', type=int, default=0, help='Tokens per answer (default: a short canned answer)')
+    parser.add_argument('--payload-file', help='Answers to stream: JSON list of strings, or one answer per line')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of completions that fail')
+    parser.add_argument('--error-status', type=int, default=500, help='HTTP status of failed completions')
+    parser.add_argument('--error-mode', choices=ERROR_MODES, default='status',
+                        help='Fail with an HTTP status, or with an error event mid-stream')
+    parser.add_argument('--seed', type=int, help='Seed for reproducible errors')
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,26 @@
+import pytest
+
+from app.core.rate_limit import chat_rate_limit
+from app.core.response_cache import response_cache
+
+
+@pytest.fixture(autouse=True)
+def isolated_rag_shared_dir(tmp_path, monkeypatch):
+    """Keep shared RAG array bundles created by tests out of the index directories"""
+    monkeypatch.setenv("RAG_SHARED_DIR", str(tmp_path / "rag_shared"))
+
+
+@pytest.fixture(autouse=True)
+def empty_response_cache():
+    """Start every test without cached chat answers"""
+    response_cache.clear()
+    yield
+    response_cache.clear()
+
+
+@pytest.fixture(autouse=True)
+def reset_chat_rate_limit():
+    """Give every test a fresh per-IP chat allowance (test clients share one address)"""
+    chat_rate_limit.limiter.clear()
+    yield
+    chat_rate_limit.limiter.clear()
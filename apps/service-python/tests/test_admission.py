@@ -0,0 +1,161 @@
+import asyncio
+import time
+from unittest.mock import AsyncMock, patch
+
+import httpx
+import pytest
+
+from app.core.admission import AdmissionController, AdmissionRejected
+from app.main import app
+
+
+@pytest.mark.asyncio
+async def test_waiter_admitted_when_slot_frees():
+    """Test requests over the cap wait and get the slot released by a finished one"""
+    controller = AdmissionController(max_concurrent=2, queue_timeout=1, max_queue=10)
+    first = await controller.acquire("a")
+    second = await controller.acquire("b")
+
+    waiting = asyncio.ensure_future(controller.acquire("c"))
+    await asyncio.sleep(0.01)
+    assert not waiting.done() and controller.status()['queued'] == 1
+
+    first.release()
+    first.release()  # Releasing twice frees one slot only
+    ticket = await waiting
+    assert ticket.wait > 0
+    assert controller.status()['active'] == 2 and controller.status()['queued'] == 0
+    second.release()
+    ticket.release()
+    assert controller.status()['active'] == 0
+
+@pytest.mark.asyncio
+async def test_slots_go_round_robin_between_clients():
+    """Test a client with a burst queued does not starve a later client"""
+    controller = AdmissionController(max_concurrent=1, queue_timeout=1, max_queue=10)
+    holder = await controller.acquire("burst")
+    order = []
+
+    async def request(client: str, name: str):
+        ticket = await controller.acquire(client)
+        order.append(name)
+        await asyncio.sleep(0.01)
+        ticket.release()
+
+    tasks = [asyncio.ensure_future(request("burst", f"burst-{i}")) for i in range(3)]
+    await asyncio.sleep(0.01)
+    tasks.append(asyncio.ensure_future(request("other", "other")))
+    await asyncio.sleep(0.01)
+
+    holder.release()
+    await asyncio.gather(*tasks)
+
+    assert order == ["burst-0", "other", "burst-1", "burst-2"]
+
+@pytest.mark.asyncio
+async def test_rejects_when_queue_full_or_wait_too_long():
+    """Test overload is answered quickly instead of queuing without bound"""
+    controller = AdmissionController(max_concurrent=1, queue_timeout=0.05, max_queue=1)
+    holder = await controller.acquire("a")
+
+    started = time.perf_counter()
+    queued = asyncio.ensure_future(controller.acquire("b"))
+    await asyncio.sleep(0)
+    with pytest.raises(AdmissionRejected, match="full"):
+        await controller.acquire("c")
+    assert time.perf_counter() - started < 0.02
+
+    with pytest.raises(AdmissionRejected, match="Timed out"):
+        await queued
+    status = controller.status()
+    assert status['rejected'] == 2 and status['queued'] == 0 and status['active'] == 1
+    holder.release()
+
+@pytest.mark.asyncio
+async def test_chat_returns_503_when_no_slot():
+    """Test /ai/chat answers 503 with Retry-After while every slot is busy"""
+    controller = AdmissionController(max_concurrent=1, queue_timeout=0.05, max_queue=10)
+    busy = await controller.acquire("someone-else")
+
+    async def mock_stream(messages):
+        yield "ok"
+
+    transport = httpx.ASGITransport(app=app)
+    body = {"messages": [{"role": "user", "content": "Hi"}], "mode": "projects"}
+    with patch('app.routes.chat.admission', controller), \
+         patch('app.routes.chat.get_openai_stream', side_effect=mock_stream), \
+         patch('app.routes.chat.log_analytics', new=AsyncMock()):
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            rejected = await client.post("/ai/chat", json=body)
+            busy.release()
+            admitted = await client.post("/ai/chat", json=body)
+
+    assert rejected.status_code == 503
+    assert rejected.headers["Retry-After"] == "1"
+    assert admitted.status_code == 200 and "ok" in admitted.text
+    assert controller.status()['active'] == 0
+
+@pytest.mark.asyncio
+async def test_dropped_ticket_is_not_freed_by_garbage_collection():
+    """Test only an explicit release frees a slot, so a leak shows up in status()"""
+    import gc
+
+    controller = AdmissionController(max_concurrent=2, queue_timeout=1, max_queue=10)
+    ticket = await controller.acquire("a")
+    del ticket
+    gc.collect()
+
+    assert controller.status()['active'] == 1
+
+@pytest.mark.asyncio
+async def test_response_releases_slot_when_body_never_starts():
+    """Test a client gone before the body starts does not keep the slot"""
+    from starlette.requests import ClientDisconnect
+
+    from app.routes.chat import AdmittedStreamingResponse
+
+    controller = AdmissionController(max_concurrent=1, queue_timeout=1, max_queue=10)
+    started = False
+
+    async def body():
+        nonlocal started
+        started = True
+        yield "data: {}\n\n"
+
+    async def gone(message):
+        raise OSError("client disconnected")
+
+    async def receive():
+        return {"type": "http.disconnect"}
+
+    response = AdmittedStreamingResponse(body(), ticket=await controller.acquire("a"))
+    with pytest.raises(ClientDisconnect):
+        await response({"type": "http", "asgi": {"spec_version": "2.4"}}, receive, gone)
+
+    assert not started
+    assert controller.status()['active'] == 0
+
+@pytest.mark.asyncio
+async def test_expected_cache_hit_that_reaches_upstream_takes_a_slot():
+    """Test a request that saw a cached answer still queues for a slot if it ends up generating"""
+    from app.core.response_cache import response_cache
+
+    controller = AdmissionController(max_concurrent=2, queue_timeout=1, max_queue=10)
+    active = []
+
+    async def mock_stream(messages):
+        active.append(controller.status()['active'])
+        yield "ok"
+
+    transport = httpx.ASGITransport(app=app)
+    body = {"messages": [{"role": "user", "content": "Hi"}], "mode": "general"}
+    with patch('app.routes.chat.admission', controller), \
+         patch.object(response_cache, 'has', return_value=True), \
+         patch('app.routes.chat.get_openai_stream', side_effect=mock_stream), \
+         patch('app.routes.chat.log_analytics', new=AsyncMock()):
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            response = await client.post("/ai/chat", json=body)
+
+    assert response.status_code == 200 and "ok" in response.text
+    assert active == [1]
+    assert controller.status()['active'] == 0 and controller.status()['admitted'] == 1
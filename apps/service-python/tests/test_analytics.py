@@ -1,8 +1,12 @@
+import asyncio
+import time
 from unittest.mock import AsyncMock, patch
 
+import httpx
 import pytest
 
 from app.core.analytics import (
+    CounterPipeline,
     get_chat_stats,
     get_like_status,
     get_page_views,
@@ -11,8 +15,11 @@ from app.core.analytics import (
     log_chat_tokens,
     log_page_view,
     log_resume_download,
+    record_chat_session,
+    record_chat_tokens,
     toggle_like,
 )
+from app.main import app
 
 
 @pytest.fixture
@@ -152,3 +159,57 @@ async def test_get_chat_stats(mock_kv):
     # Check totals
     assert stats["total_sessions"] == 15  # 5 * 3 days
     assert stats["total_tokens"] == 300   # 100 * 3 days
+
+@pytest.mark.asyncio
+async def test_pipeline_batches_counters_per_key(mock_kv):
+    """Test many recorded events become one KV increment per key, in the background"""
+    pipeline = CounterPipeline(interval=0.02)
+    with patch('app.core.analytics.counters', pipeline), \
+         patch('app.core.analytics.datetime') as mock_dt:
+        mock_dt.now.return_value.strftime.return_value = "2024-01-15"
+        for _ in range(5):
+            record_chat_session()
+            record_chat_tokens(10)
+        record_chat_tokens(0)
+
+        mock_kv.incr.assert_not_called()
+        await asyncio.sleep(0.1)
+
+    assert sorted(c.args for c in mock_kv.incr.call_args_list) == [
+        ("analytics:chat:sessions:2024-01-15", 5),
+        ("analytics:chat:tokens:2024-01-15", 50),
+    ]
+    assert pipeline.status()['pending_keys'] == 0
+
+@pytest.mark.asyncio
+async def test_pipeline_close_flushes_pending(mock_kv):
+    """Test counters still pending at shutdown are written"""
+    pipeline = CounterPipeline(interval=60)
+    pipeline.add("analytics:chat:sessions:2024-01-15")
+
+    await pipeline.close()
+
+    mock_kv.incr.assert_called_once_with("analytics:chat:sessions:2024-01-15", 1)
+
+@pytest.mark.asyncio
+async def test_chat_does_not_wait_on_kv(mock_kv):
+    """Test a slow KV store does not delay the chat response"""
+    async def slow_incr(key, by=1):
+        await asyncio.sleep(0.5)
+        return by
+
+    async def mock_stream(messages):
+        yield "ok"
+
+    mock_kv.incr = AsyncMock(side_effect=slow_incr)
+    transport = httpx.ASGITransport(app=app)
+    with patch('app.core.analytics.counters', CounterPipeline(interval=0.01)), \
+         patch('app.routes.chat.get_openai_stream', side_effect=mock_stream):
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            started = time.perf_counter()
+            response = await client.post("/ai/chat", json={"messages": [{"role": "user", "content": "Hi"}],
+                                                            "mode": "projects"})
+            elapsed = time.perf_counter() - started
+
+    assert response.status_code == 200 and '"done": true' in response.text
+    assert elapsed < 0.25
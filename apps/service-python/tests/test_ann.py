@@ -0,0 +1,133 @@
+import numpy as np
+
+from app.core.ann import IVFIndex, quantize_int8, recall_at_k
+from app.core.rag import RAGSearcher
+
+
+def _clustered(count=2000, dims=32, topics=20, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(topics, dims))
+    vectors = centers[rng.integers(topics, size=count)] + 0.5 * rng.normal(size=(count, dims))
+    return (vectors / np.linalg.norm(vectors, axis=1, keepdims=True)).astype(np.float32)
+
+def test_ivf_full_probe_is_exact():
+    """Test probing every list matches brute-force inner product search"""
+    vectors = _clustered()
+    index = IVFIndex.build(vectors)
+    query = vectors[7]
+
+    results = index.search(query, k=5, nprobe=index.nlist)
+    expected = np.argsort(-(vectors @ query))[:5]
+
+    assert [i for i, _ in results] == expected.tolist()
+
+def test_ivf_recall_improves_with_nprobe():
+    """Test nprobe trades latency for recall"""
+    vectors = _clustered()
+    index = IVFIndex.build(vectors)
+    queries = vectors[:50]
+
+    low = recall_at_k(index, queries, k=10, nprobe=1)
+    high = recall_at_k(index, queries, k=10, nprobe=8)
+
+    assert high >= low
+    assert high > 0.9
+
+def test_int8_quantization_keeps_ranking():
+    """Test int8 codes with per-row scales approximate the float vectors"""
+    vectors = _clustered(count=500)
+    codes, scales = quantize_int8(vectors)
+
+    assert codes.dtype == np.int8
+    assert np.abs(codes * scales[:, None] - vectors).max() < 0.01
+
+    index = IVFIndex.build(vectors, quantize=True)
+    top = index.search(vectors[3], k=1, nprobe=index.nlist)
+    assert top[0][0] == 3
+
+def test_ivf_candidate_mask():
+    """Test masked vectors are excluded before scoring"""
+    vectors = _clustered(count=300)
+    index = IVFIndex.build(vectors)
+    candidates = np.zeros(len(vectors), dtype=bool)
+    candidates[::3] = True
+
+    results = index.search(vectors[1], k=5, nprobe=index.nlist, candidates=candidates)
+
+    assert results and all(candidates[i] for i, _ in results)
+
+def _far_matches(index, query, count):
+    """Mask of at least `count` vectors, all from the buckets furthest from `query`"""
+    candidates = np.zeros(len(index.list_ids), dtype=bool)
+    for far in np.argsort(index.centroids @ query):
+        ids = index.list_ids[index.list_offsets[far]:index.list_offsets[far + 1]]
+        candidates[ids[:count - int(candidates.sum())]] = True
+        if candidates.sum() >= count:
+            return candidates
+
+def test_filtered_search_finds_matches_outside_probed_lists():
+    """Test a filter whose matches sit outside the nearest bucket still returns k results"""
+    vectors = _clustered()
+    index = IVFIndex.build(vectors, nlist=40)  # About 50 vectors per bucket
+    query = vectors[7]
+
+    few = _far_matches(index, query, 5)  # Scored exactly
+    results = index.search(query, k=5, nprobe=1, candidates=few)
+    assert results == index.search(query, k=5, nprobe=index.nlist, candidates=few)
+
+    many = _far_matches(index, query, 200)  # Found by probing further buckets
+    results = index.search(query, k=5, nprobe=1, candidates=many)
+    assert len(results) == 5 and all(many[i] for i, _ in results)
+
+def test_rag_searcher_lsa_mode(tmp_path):
+    """Test LSA mode searches passages through the IVF index"""
+    from scripts.build_rag_index import build_lsa_index, build_tfidf_index, save_rag_index
+
+    documents = [
+        {"id": f"doc-{i}", "slug": f"doc-{i}", "title": title, "description": "", "tags": [], "tech": [],
+         "text": text}
+        for i, (title, text) in enumerate([
+            ("Payments", "Stripe checkout with payment intents, refunds and invoices."),
+            ("Booking", "Calendar booking with reservations, deposits and reminders."),
+            ("Analytics", "Dashboards with charts, metrics and revenue reports."),
+            ("Auth", "Login with sessions, tokens and password resets."),
+        ])
+    ]
+    index_data = build_tfidf_index(documents)
+    index_data['lsa'] = build_lsa_index(index_data['vectors'], dims=3)
+    index_file = tmp_path / "rag.json"
+    save_rag_index(index_data, str(index_file))
+
+    searcher = RAGSearcher(str(index_file), mode="lsa")
+
+    assert searcher.validate() == []
+    assert searcher.search("stripe refunds invoices", k=1)[0]['slug'] == "doc-0"
+
+def test_stale_lsa_file_is_removed_or_ignored(tmp_path):
+    """Test a build without LSA removes the old embeddings, and mismatched ones are not attached"""
+    import shutil
+
+    from scripts.build_rag_index import build_lsa_index, build_tfidf_index, save_rag_index
+
+    texts = ["Stripe checkout with payment intents and refunds.", "Calendar booking with deposits.",
+             "Dashboards with charts and revenue reports.", "Login with sessions and password resets.",
+             "Search with embeddings and inverted indexes.", "Email campaigns with templates and tracking."]
+
+    def documents(n):
+        return [{"id": f"doc-{i}", "slug": f"doc-{i}", "title": f"Doc {i}", "description": "", "tags": [],
+                 "tech": [], "text": texts[i]} for i in range(n)]
+
+    index_file = tmp_path / "rag.json"
+    lsa_file = tmp_path / "rag_lsa.npz"
+    old = build_tfidf_index(documents(6))
+    old['lsa'] = build_lsa_index(old['vectors'], dims=3)
+    save_rag_index(old, str(index_file))
+    shutil.copy(lsa_file, tmp_path / "old_lsa.npz")
+
+    save_rag_index(build_tfidf_index(documents(4)), str(index_file))
+    assert not lsa_file.exists()
+
+    shutil.copy(tmp_path / "old_lsa.npz", lsa_file)  # Left behind by some other build
+    searcher = RAGSearcher(str(index_file), mode="lsa")
+    assert searcher.ann is None
+    assert searcher.validate() == ["LSA index or vectorizer missing"]
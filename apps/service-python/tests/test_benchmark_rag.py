@@ -0,0 +1,32 @@
+from scripts.benchmark_rag import build_index, compare, generate_corpus, measure_mode
+
+
+def test_synthetic_corpus_round_trip(tmp_path):
+    """Test generated MDX goes through the build pipeline and labelled queries are found"""
+    queries = generate_corpus(tmp_path / "content", 30)
+    index_file = tmp_path / "rag.idx"
+
+    build = build_index(tmp_path / "content", index_file, lsa=False)
+    measured = measure_mode(index_file, "bm25", queries, k=4)
+
+    assert build['documents'] == 30
+    assert build['passages'] >= 30
+    assert build['index_mb'] > 0
+    assert measured['recall_at_4'] == 1.0
+    assert measured['p99_ms'] >= measured['p50_ms'] > 0
+
+def test_compare_flags_regressions():
+    """Test regressions are reported against matching baseline rows only"""
+    row = {'docs': 100, 'mode': 'bm25', 'p99_ms': 1.0, 'load_seconds': 0.1,
+           'build_seconds': 1.0, 'recall_at_4': 0.95}
+    baseline = {'k': 4, 'results': [row, {**row, 'mode': 'tfidf'}]}
+    report = {'k': 4, 'results': [
+        {**row, 'p99_ms': 2.0, 'recall_at_4': 0.8},
+        {**row, 'mode': 'lsa', 'p99_ms': 50.0},
+    ]}
+
+    regressions = compare(report, baseline)
+
+    assert len(regressions) == 2
+    assert all(r.startswith("100 docs / bm25") for r in regressions)
+    assert compare(baseline, baseline) == []
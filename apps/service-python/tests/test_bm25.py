@@ -0,0 +1,107 @@
+import json
+import tempfile
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from app.core.bm25 import BM25Index, build_bm25_index, decode_postings, encode_postings, tokenize
+from app.core.rag import RAGSearcher
+
+TEXTS = [
+    "AI booking platform with Stripe payments and OpenAI recommendations",
+    "Real-time analytics dashboard for ecommerce sales metrics",
+    "Mechanic shop REST API built with Flask and PostgreSQL",
+    "Task management progressive web app with offline sync",
+    "Hibachi catering booking platform using Next.js, FastAPI and Stripe",
+]
+
+
+def test_postings_round_trip():
+    """Test varint postings encode/decode round trip"""
+    doc_ids = [0, 3, 130, 131, 70000]
+    tfs = [1, 200, 2, 1, 5]
+
+    decoded_ids, decoded_tfs = decode_postings(encode_postings(doc_ids, tfs))
+
+    assert decoded_ids.tolist() == doc_ids
+    assert decoded_tfs.tolist() == tfs
+
+def test_tokenize_drops_stop_words():
+    """Test tokenizer lowercases and removes stop words"""
+    assert tokenize("The Booking Platform and a Stripe API") == ["booking", "platform", "stripe", "api"]
+
+def test_build_bm25_index_statistics():
+    """Test BM25 index carries document lengths and term bounds"""
+    data = build_bm25_index(TEXTS)
+
+    assert data['num_docs'] == len(TEXTS)
+    assert len(data['doc_lengths']) == len(TEXTS)
+    assert data['terms']['booking']['df'] == 2
+    assert data['terms']['stripe']['max_score'] > 0
+
+def test_wand_matches_exhaustive_scoring():
+    """Test WAND top-k equals exhaustive BM25 scoring"""
+    rng = np.random.default_rng(7)
+    vocab = [f"term{i}" for i in range(60)]
+    texts = [" ".join(rng.choice(vocab, size=rng.integers(5, 40))) for _ in range(300)]
+    index = BM25Index(build_bm25_index(texts))
+
+    for query in ["term1 term2", "term5 term17 term33", "term59", "term3 term3 term40 term41"]:
+        expected = index.score_all(query)
+        results = index.search(query, k=10)
+
+        top_expected = np.sort(expected)[::-1][:10]
+        assert [round(score, 9) for _, score in results] == [round(s, 9) for s in top_expected if s > 0]
+        for doc_id, score in results:
+            assert score == pytest.approx(expected[doc_id])
+
+def test_search_unknown_terms():
+    """Test queries without indexed terms return nothing"""
+    index = BM25Index(build_bm25_index(TEXTS))
+    assert index.search("kubernetes", k=3) == []
+
+def test_rag_searcher_bm25_mode():
+    """Test RAGSearcher selects the BM25 engine through configuration"""
+    documents = [
+        {"id": f"doc-{i}", "slug": f"doc-{i}", "title": f"Doc {i}", "text": text, "combined_text": text}
+        for i, text in enumerate(TEXTS)
+    ]
+    with tempfile.NamedTemporaryFile(mode='w', suffix='.json', delete=False) as f:
+        json.dump({"documents": documents, "bm25": build_bm25_index(TEXTS)}, f)
+        index_path = f.name
+
+    try:
+        searcher = RAGSearcher(index_path, mode="bm25")
+        results = searcher.search("stripe booking", k=2)
+
+        assert {doc['slug'] for doc in results} == {"doc-0", "doc-4"}
+        assert all(doc['similarity_score'] > 0 for doc in results)
+    finally:
+        Path(index_path).unlink(missing_ok=True)
+
+def test_rag_searcher_bm25_without_saved_postings(tmp_path):
+    """Test BM25 mode builds the inverted index for older index files"""
+    index_file = tmp_path / "rag.json"
+    index_file.write_text(json.dumps({"documents": [
+        {"id": "a", "slug": "a", "title": "Flask API", "text": "Mechanic shop REST API"},
+        {"id": "b", "slug": "b", "title": "Dashboard", "text": "Analytics for ecommerce"},
+    ]}))
+
+    searcher = RAGSearcher(str(index_file), mode="bm25")
+
+    assert searcher.search("mechanic", k=1)[0]['slug'] == "a"
+
+def test_wand_respects_candidate_mask():
+    """Test masked documents are never returned and ranking matches exhaustive scoring"""
+    rng = np.random.default_rng(11)
+    vocab = [f"term{i}" for i in range(40)]
+    texts = [" ".join(rng.choice(vocab, size=rng.integers(5, 30))) for _ in range(200)]
+    index = BM25Index(build_bm25_index(texts))
+    candidates = rng.random(200) < 0.2
+
+    results = index.search("term1 term7 term22", k=5, candidates=candidates)
+
+    expected = np.where(candidates, index.score_all("term1 term7 term22"), 0)
+    assert all(candidates[doc_id] for doc_id, _ in results)
+    assert [round(s, 9) for _, s in results] == [round(s, 9) for s in np.sort(expected)[::-1][:5] if s > 0]
@@ -0,0 +1,101 @@
+import json
+
+import pytest
+
+from app.core.index_file import load_index_data
+from scripts.build_rag_index import build_index, manifest_path
+
+
+def _write_project(content_dir, slug, title, body):
+    projects = content_dir / "projects"
+    projects.mkdir(parents=True, exist_ok=True)
+    (projects / f"{slug}.mdx").write_text(
+        f"---\ntitle: {title}\ndescription: {title} project\ntags: [demo]\n---\n\n{body}\n",
+        encoding="utf-8",
+    )
+
+@pytest.fixture
+def content(tmp_path):
+    content_dir = tmp_path / "content"
+    _write_project(content_dir, "alpha", "Alpha", "Stripe checkout with **refunds**.")
+    _write_project(content_dir, "beta", "Beta", "Booking calendar with reminders.")
+    _write_project(content_dir, "gamma", "Gamma", "Analytics dashboard with charts.")
+    return content_dir
+
+def _documents(output_file):
+    return load_index_data(output_file.read_bytes())['documents']
+
+def test_unchanged_content_skips_writing(content, tmp_path, capsys):
+    """Test a second build with the same sources writes nothing"""
+    output_file = tmp_path / "rag.idx"
+    assert build_index(content, output_file, lsa_dims=0) is True
+    written = output_file.stat().st_mtime_ns
+    capsys.readouterr()
+
+    assert build_index(content, output_file, lsa_dims=0) is False
+    assert output_file.stat().st_mtime_ns == written
+    assert "Processing" not in capsys.readouterr().out
+
+def test_only_changed_files_are_reprocessed(content, tmp_path, capsys):
+    """Test a changed file is re-parsed while others come from the manifest"""
+    output_file = tmp_path / "rag.idx"
+    build_index(content, output_file, lsa_dims=0)
+    capsys.readouterr()
+
+    _write_project(content, "beta", "Beta", "Booking calendar with SMS reminders.")
+    assert build_index(content, output_file, lsa_dims=0) is True
+
+    out = capsys.readouterr().out
+    assert "Processing beta.mdx" in out
+    assert "Processing alpha.mdx" not in out
+    beta = next(doc for doc in _documents(output_file) if doc['slug'] == "beta")
+    assert "SMS" in beta['text']
+
+def test_added_and_removed_files_rebuild(content, tmp_path):
+    """Test added and removed sources are reflected in the index and manifest"""
+    output_file = tmp_path / "rag.idx"
+    build_index(content, output_file, lsa_dims=0)
+
+    (content / "projects" / "alpha.mdx").unlink()
+    _write_project(content, "delta", "Delta", "Task board with offline sync.")
+    assert build_index(content, output_file, lsa_dims=0) is True
+
+    assert [doc['slug'] for doc in _documents(output_file)] == ["beta", "delta", "gamma"]
+    with open(manifest_path(output_file), encoding="utf-8") as f:
+        assert sorted(json.load(f)['files']) == ["beta.mdx", "delta.mdx", "gamma.mdx"]
+
+def test_settings_change_or_missing_output_forces_rebuild(content, tmp_path):
+    """Test the manifest is ignored when settings change or outputs are gone"""
+    output_file = tmp_path / "rag.idx"
+    build_index(content, output_file, lsa_dims=0)
+
+    assert build_index(content, output_file, lsa_dims=2) is True
+    output_file.unlink()
+    assert build_index(content, output_file, lsa_dims=2) is True
+    assert build_index(content, output_file, lsa_dims=2, force=True) is True
+
+def test_missing_or_stale_companion_forces_rebuild(content, tmp_path):
+    """Test a build is only skipped when every output it wrote is still there, unchanged"""
+    output_file = tmp_path / "rag.idx"
+    lsa_file = tmp_path / "rag_lsa.npz"
+    assert build_index(content, output_file, lsa_dims=2) is True
+    assert lsa_file.exists()
+
+    lsa_file.unlink()
+    assert build_index(content, output_file, lsa_dims=2) is True
+    assert lsa_file.exists()
+
+    lsa_file.write_bytes(b"left over from another build")
+    assert build_index(content, output_file, lsa_dims=2) is True
+    assert build_index(content, output_file, lsa_dims=2) is False
+
+    (tmp_path / "rag_vectorizer.pkl").unlink()
+    assert build_index(content, output_file, lsa_dims=2) is True
+
+    # A companion this build does not produce is stale too, and is removed
+    stale = lsa_file.read_bytes()
+    build_index(content, output_file, lsa_dims=0)
+    assert not lsa_file.exists()
+    lsa_file.write_bytes(stale)
+    assert build_index(content, output_file, lsa_dims=0) is True
+    assert not lsa_file.exists()
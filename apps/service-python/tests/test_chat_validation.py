@@ -154,3 +154,26 @@ def test_system_prompt_generation():
     resume = SystemPrompt.get_with_context("resume")
     assert base in resume
     assert "resume/experience" in resume
+
+def test_health_reports_rag_index(client):
+    """Test /health includes the active RAG index version and load time"""
+    response = client.get("/health")
+
+    assert response.status_code == 200
+    rag = response.json()["rag"]
+    assert "version" in rag
+    assert "loaded_at" in rag
+    assert "load_ms" in rag
+
+def test_rag_reload_requires_token(client, monkeypatch):
+    """Test the reload endpoint is disabled without a token and checks it when set"""
+    monkeypatch.delenv("RAG_RELOAD_TOKEN", raising=False)
+    assert client.post("/rag/reload").status_code == 404
+
+    monkeypatch.setenv("RAG_RELOAD_TOKEN", "secret")
+    assert client.post("/rag/reload", headers={"Authorization": "Bearer wrong"}).status_code == 403
+
+    with patch('app.routes.rag.rag_index.reload', return_value=True) as mock_reload:
+        response = client.post("/rag/reload", headers={"Authorization": "Bearer secret"})
+    assert response.status_code == 202
+    mock_reload.assert_called_once()
@@ -0,0 +1,152 @@
+import json
+import re
+import warnings
+from unittest.mock import AsyncMock, patch
+
+import httpx
+import pytest
+from pydantic import PydanticDeprecatedSince20
+
+import app.core.conversations as conversations_module
+from app.core.conversations import CONVERSATION_ID_PATTERN, ConversationStore
+from app.main import app
+
+CONVERSATION = "conv-0123456789abcdefg"  # Shaped like an issued ID
+
+
+class FakeKV:
+    """Shared KV for stores standing in for separate workers"""
+
+    def __init__(self):
+        self.enabled = True
+        self.data = {}
+
+    async def get(self, key):
+        return self.data.get(key)
+
+    async def set(self, key, value, ex=None):
+        self.data[key] = value
+        return True
+
+
+def turn(question: str, answer: str):
+    return [{"role": "user", "content": question}, {"role": "assistant", "content": answer}]
+
+@pytest.mark.asyncio
+async def test_store_trims_evicts_and_expires(monkeypatch):
+    """Test histories are capped, least recently used ones evicted and idle ones expired"""
+    store = ConversationStore(max_conversations=2, ttl=60, max_messages=4)
+    store.save("a", turn("q1", "a1") + turn("q2", "a2") + turn("q3", "a3"))
+    assert await store.load("a") == turn("q2", "a2") + turn("q3", "a3")
+
+    store.save("b", turn("q", "a"))
+    await store.load("a")  # "b" is now least recently used
+    store.save("c", turn("q", "a"))
+    assert await store.load("b") is None
+    assert await store.load("a")
+
+    now = conversations_module.time.time()
+    monkeypatch.setattr(conversations_module.time, "time", lambda: now + 61)
+    assert await store.load("a") is None
+    assert store.status()['hits'] == 3 and store.status()['misses'] == 2
+
+@pytest.mark.asyncio
+async def test_only_issued_ids_have_a_history():
+    """Test IDs are minted by the store and an ID it never issued is unknown"""
+    store = ConversationStore()
+    conversation_id = store.create()
+    assert re.fullmatch(CONVERSATION_ID_PATTERN, conversation_id)
+    assert conversation_id != store.create()
+    assert await store.load(conversation_id) == []
+    assert await store.load(CONVERSATION) is None
+
+@pytest.mark.asyncio
+async def test_newest_copy_wins_across_workers():
+    """Test a worker picks up turns another worker saved to KV once its own copy is no longer trusted"""
+    fake = FakeKV()
+    fake.get = AsyncMock(side_effect=fake.get)
+    with patch('app.core.conversations.kv', fake):
+        first, second = ConversationStore(), ConversationStore(local_ttl=0)
+        first.save(CONVERSATION, turn("q1", "a1"))
+        await first.close()
+        assert json.loads(fake.data["chat:conversation:" + CONVERSATION])["m"] == [["u", "q1"], ["a", "a1"]]
+
+        history = await second.load(CONVERSATION)  # Not held locally: read from KV
+        second.save(CONVERSATION, history + turn("q2", "a2"))
+        await second.close()
+        assert await second.load(CONVERSATION) == turn("q1", "a1") + turn("q2", "a2")
+        assert fake.get.await_count == 2  # local_ttl=0 checks KV on every load
+
+        # The first worker trusts its own copy within the TTL and makes no KV call
+        assert await first.load(CONVERSATION) == turn("q1", "a1")
+        assert fake.get.await_count == 2
+        first.local_ttl = 0
+        assert await first.load(CONVERSATION) == turn("q1", "a1") + turn("q2", "a2")
+
+@pytest.mark.asyncio
+async def test_chat_turns_send_only_new_messages():
+    """Test the stored history is prepended and the answered turn is stored"""
+    prompts = []
+
+    async def mock_stream(messages):
+        prompts.append([(msg["role"], msg["content"]) for msg in messages])
+        yield f"answer {len(prompts)}"
+
+    transport = httpx.ASGITransport(app=app)
+    with patch('app.routes.chat.conversations', ConversationStore()), \
+         patch('app.routes.chat.get_openai_stream', side_effect=mock_stream), \
+         patch('app.routes.chat.log_analytics', new=AsyncMock()), \
+         warnings.catch_warnings():
+        warnings.simplefilter("error", PydanticDeprecatedSince20)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            first = await client.post("/ai/chat", json={"new_conversation": True, "mode": "projects",
+                                                        "messages": [{"role": "user", "content": "First?"}]})
+            conversation_id = first.headers["X-Conversation-Id"]
+            second = await client.post("/ai/chat", json={"conversation_id": conversation_id, "mode": "projects",
+                                                         "messages": [{"role": "user", "content": "Second?"}]})
+    responses = [first, second]
+
+    assert second.headers["X-Conversation-Id"] == conversation_id
+    assert [r.headers["X-Conversation-Messages"] for r in responses] == ["0", "2"]
+    assert '"done": true' in responses[1].text
+    assert prompts[1][1:] == [("user", "First?"), ("assistant", "answer 1"), ("user", "Second?")]
+
+@pytest.mark.asyncio
+async def test_passthrough_turn_is_stored(monkeypatch):
+    """Test passthrough mode collects the forwarded answer for the store"""
+    store = ConversationStore()
+    conversation_id = store.create()
+    events = [b'data: {"choices":[{"delta":{"content":"Hi"}}]}\n\n',
+              b'data: {"choices":[{"delta":{"content":" there"}}]}\n\n', b"data: [DONE]\n\n"]
+
+    async def mock_passthrough(messages, scanner):
+        for chunk in events:
+            yield scanner.feed(chunk)
+
+    monkeypatch.setattr('app.core.streaming.CHAT_STREAM_MODE', "passthrough")
+    transport = httpx.ASGITransport(app=app)
+    body = {"conversation_id": conversation_id, "messages": [{"role": "user", "content": "Hello"}]}
+    with patch('app.routes.chat.conversations', store), \
+         patch('app.routes.chat.get_openai_passthrough', side_effect=mock_passthrough), \
+         patch('app.routes.chat.log_analytics', new=AsyncMock()):
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            response = await client.post("/ai/chat", json=body)
+
+    assert response.status_code == 200
+    assert await store.load(conversation_id) == turn("Hello", "Hi there")
+
+def test_conversation_id_validation():
+    """Test malformed and unissued IDs are rejected and IDs need the store enabled"""
+    from fastapi.testclient import TestClient
+    client = TestClient(app)
+    message = [{"role": "user", "content": "Hi"}]
+
+    assert client.post("/ai/chat", json={}).status_code == 422
+    assert client.post("/ai/chat", json={"conversation_id": "bad id!", "messages": message}).status_code == 422
+    assert client.post("/ai/chat", json={"conversation_id": "guessable", "messages": message}).status_code == 422
+    with patch('app.routes.chat.conversations', ConversationStore()):
+        response = client.post("/ai/chat", json={"conversation_id": CONVERSATION, "messages": message})
+    assert response.status_code == 404
+    with patch('app.routes.chat.conversations', ConversationStore(max_conversations=0)):
+        response = client.post("/ai/chat", json={"new_conversation": True, "messages": message})
+    assert response.status_code == 400
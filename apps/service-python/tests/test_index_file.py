@@ -0,0 +1,96 @@
+import numpy as np
+import pytest
+
+import app.core.index_file as index_file
+from app.core.index_file import IndexWriter, load_index_data, read_index
+from app.core.rag import RAGIndexManager
+
+
+def _write(path):
+    with IndexWriter(path) as writer:
+        writer.write_value('metadata', {'num_documents': 3})
+        writer.write_list('documents', ({'slug': f"doc-{i}"} for i in range(5)), chunk_size=2)
+        writer.write_dict('bm25', [('k1', 1.2), ('b', 0.75)])
+        writer.write_dict('bm25.terms', ((f"t{i}", {'df': i}) for i in range(5)), chunk_size=2)
+        writer.write_array('vectors_csr.data', np.linspace(0, 1, 1000))
+        writer.write_array('embeddings', np.arange(60, dtype=np.float32).reshape(20, 3))
+        writer.write_list('empty', [])
+    return writer
+
+def test_chunked_sections_round_trip(tmp_path, monkeypatch):
+    """Test repeated list, dict and array chunks reassemble into the nested dict"""
+    monkeypatch.setattr(index_file, "ARRAY_CHUNK_BYTES", 64)
+    path = tmp_path / "rag.idx"
+    writer = _write(path)
+
+    data = read_index(path.read_bytes())
+
+    assert writer.sections > 10
+    assert data['metadata'] == {'num_documents': 3}
+    assert [doc['slug'] for doc in data['documents']] == [f"doc-{i}" for i in range(5)]
+    assert data['bm25']['k1'] == 1.2
+    assert list(data['bm25']['terms']) == [f"t{i}" for i in range(5)]
+    assert np.array_equal(data['vectors_csr']['data'], np.linspace(0, 1, 1000))
+    assert data['embeddings'].shape == (20, 3) and data['embeddings'].dtype == np.float32
+    assert data['empty'] == []
+
+def test_read_only_requested_sections(tmp_path):
+    """Test sections outside `sections` are skipped rather than decoded"""
+    path = tmp_path / "rag.idx"
+    _write(path)
+
+    data = read_index(path.read_bytes(), sections=("metadata", "documents"))
+
+    assert set(data) == {'metadata', 'documents'}
+    assert len(data['documents']) == 5
+
+def test_legacy_json_still_loads():
+    """Test plain JSON indexes are decoded as before"""
+    assert load_index_data(b'{"documents": []}') == {'documents': []}
+
+@pytest.mark.parametrize("damage", ["truncate", "flip"])
+def test_damaged_file_is_rejected(tmp_path, damage):
+    """Test truncation and corruption fail the footer check"""
+    path = tmp_path / "rag.idx"
+    _write(path)
+    raw = bytearray(path.read_bytes())
+    if damage == "truncate":
+        raw = raw[:len(raw) // 2]
+    else:
+        raw[len(raw) // 2] ^= 0xFF
+
+    with pytest.raises(ValueError):
+        read_index(bytes(raw))
+
+def test_failed_write_keeps_previous_index(tmp_path):
+    """Test a crash mid-write leaves the published index untouched and no temp file"""
+    path = tmp_path / "rag.idx"
+    _write(path)
+    published = path.read_bytes()
+
+    with pytest.raises(RuntimeError):
+        with IndexWriter(path) as writer:
+            writer.write_list('documents', [{'slug': 'partial'}])
+            raise RuntimeError("builder crashed")
+
+    assert path.read_bytes() == published
+    assert list(tmp_path.iterdir()) == [path]
+
+def test_reload_rejects_corrupt_index(tmp_path):
+    """Test the service keeps serving the old version when a corrupt index lands"""
+    from scripts.build_rag_index import build_tfidf_index, save_rag_index
+
+    path = tmp_path / "rag.idx"
+    documents = [{"id": s, "slug": s, "title": s, "description": "", "tags": [], "tech": [], "text": t}
+                 for s, t in [("a", "Stripe refunds"), ("b", "Booking calendar"), ("c", "Charts dashboard")]]
+    save_rag_index(build_tfidf_index(documents), str(path))
+    manager = RAGIndexManager(str(path), mode="tfidf")
+    version = manager.searcher.version
+
+    raw = bytearray(path.read_bytes())
+    raw[100] ^= 0xFF
+    path.write_bytes(bytes(raw))
+    manager.reload(wait=True)
+
+    assert manager.searcher.version == version
+    assert "integrity" in manager.last_error
@@ -0,0 +1,74 @@
+import time
+from unittest.mock import patch
+
+import httpx
+import pytest
+from fastapi import HTTPException
+
+from app.core.upstream import UpstreamRouter
+from app.routes.chat import ChatMessage, get_openai_stream
+from scripts.load_chat import percentiles, run_load
+from scripts.mock_upstream import MockUpstream
+
+MESSAGES = [ChatMessage(role="user", content="Hi")]
+
+
+@pytest.fixture
+def router(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "test-key")
+    monkeypatch.setenv("UPSTREAM_HEDGE_MS", "0")
+    router = UpstreamRouter()
+    with patch('app.routes.chat.upstream_router', router):
+        yield router
+
+@pytest.mark.asyncio
+async def test_mock_streams_payloads_at_token_rate(router, monkeypatch):
+    """Test payload answers are used in turn and paced by tokens_per_sec"""
+    payloads = ["one two three four five", "alpha beta"]
+    async with MockUpstream(tokens_per_sec=100, payloads=payloads) as mock, httpx.AsyncClient() as client:
+        monkeypatch.setenv("OPENAI_BASE_URL", mock.url)
+        started = time.perf_counter()
+        first = "".join([token async for token in get_openai_stream(MESSAGES, client)])
+        elapsed = time.perf_counter() - started
+        second = "".join([token async for token in get_openai_stream(MESSAGES, client)])
+
+    assert first == payloads[0] and second == payloads[1]
+    assert elapsed >= 0.04  # Four 10 ms gaps between five tokens
+
+@pytest.mark.asyncio
+async def test_mid_stream_upstream_error_fails_the_answer(router, monkeypatch):
+    """Test an error event in the upstream stream raises instead of ending the answer early"""
+    async with MockUpstream(tokens=[f" w{i}" for i in range(10)], error_rate=1.0,
+                            error_mode="stream") as mock, httpx.AsyncClient() as client:
+        monkeypatch.setenv("OPENAI_BASE_URL", mock.url)
+        received = []
+        with pytest.raises(HTTPException) as raised:
+            async for token in get_openai_stream(MESSAGES, client):
+                received.append(token)
+
+    assert raised.value.status_code == 502
+    assert "Mock upstream error" in raised.value.detail
+    assert len(received) == 5
+
+@pytest.mark.asyncio
+async def test_in_process_load_run_reports_latency_and_errors(monkeypatch):
+    """Test a small load run completes sessions and counts failed ones by kind"""
+    monkeypatch.setenv("OPENAI_API_KEY", "test-key")
+    async with MockUpstream(ttft_ms=20, tokens_per_sec=200, tokens=[f" w{i}" for i in range(10)],
+                            error_rate=0.25, error_mode="stream", seed=3) as mock:
+        monkeypatch.setenv("OPENAI_BASE_URL", mock.url)
+        with patch('app.routes.chat.upstream_router', UpstreamRouter()):
+            report = await run_load(sessions=12, concurrency=4, question="Hi", mode="general", repeat=False)
+        errors = mock.errors
+
+    assert report['sessions'] == 12
+    assert report['completed'] == 12 - errors
+    assert report['errors'] == ({'stream_error': errors} if errors else {})
+    assert report['ttft_ms']['p50'] >= 20
+    assert report['throughput']['tokens_per_sec'] > 0
+    assert report['event_loop_lag_ms']['max'] is not None
+
+def test_percentiles():
+    """Test percentiles pick nearest-rank values in milliseconds"""
+    assert percentiles([0.001 * i for i in range(1, 101)]) == {'p50': 51.0, 'p90': 91.0, 'p99': 100.0, 'max': 100.0}
+    assert percentiles([])['p50'] is None
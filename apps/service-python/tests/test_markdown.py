@@ -0,0 +1,67 @@
+import re
+from pathlib import Path
+
+import frontmatter
+import pytest
+
+import scripts.build_rag_index as builder
+from scripts.build_rag_index import FRONTMATTER_HANDLER, collect_documents, strip_markdown_to_text
+
+FIXTURES = Path(__file__).parent / "fixtures"
+WEB_CONTENT = Path(__file__).resolve().parents[2] / "web" / "content"
+
+GOLDEN_FILES = sorted((WEB_CONTENT / "projects").glob("*.mdx")) + [FIXTURES / "golden_markdown.mdx"]
+
+
+def legacy_strip_markdown_to_text(content: str) -> str:
+    """The original sequential-regex stripper, kept as the oracle for the golden corpus"""
+    content = re.sub(r'^#{1,6}\s+(.+)$', r'\1', content, flags=re.MULTILINE)
+    content = re.sub(r'\*\*(.+?)\*\*', r'\1', content)
+    content = re.sub(r'\*(.+?)\*', r'\1', content)
+    content = re.sub(r'_(.+?)_', r'\1', content)
+    content = re.sub(r'\[([^\]]+)\]\([^\)]+\)', r'\1', content)
+    content = re.sub(r'```[\s\S]*?```', '', content)
+    content = re.sub(r'`([^`]+)`', r'\1', content)
+    content = re.sub(r'^[\s]*[-\*\+]\s+', '', content, flags=re.MULTILINE)
+    content = re.sub(r'^[\s]*\d+\.\s+', '', content, flags=re.MULTILINE)
+    content = re.sub(r'\n\s*\n', '\n\n', content)
+    return content.strip()
+
+@pytest.mark.parametrize("path", GOLDEN_FILES, ids=lambda p: p.name)
+def test_golden_corpus_matches_legacy_stripper(path):
+    """Test the C frontmatter loader and the tokenizer stripper match the originals on real content"""
+    post = frontmatter.load(str(path))
+    fast = frontmatter.loads(path.read_text(encoding="utf-8"), handler=FRONTMATTER_HANDLER)
+
+    assert fast.metadata == post.metadata
+    assert fast.content == post.content
+    assert strip_markdown_to_text(post.content) == legacy_strip_markdown_to_text(post.content)
+
+def test_code_contents_are_verbatim():
+    """Test emphasis markers inside code spans are kept and fenced code is dropped"""
+    content = "Call `get_user_id(*args)` now.\n\n```python\nx = a_b_c * 2\n```\n\nDone."
+
+    assert strip_markdown_to_text(content) == "Call get_user_id(*args) now.\n\nDone."
+
+def test_nested_emphasis_and_star_bullets():
+    """Test nested emphasis flattens and * bullets do not pair with emphasis"""
+    content = "* item with *em*\n* **Bold** and ***both*** in [a *link*](https://x.dev/a_b_c)"
+
+    assert strip_markdown_to_text(content) == "item with em\nBold and both in a link"
+
+def test_process_pool_matches_serial(tmp_path, monkeypatch):
+    """Test parallel extraction returns the same documents in the same order"""
+    projects = tmp_path / "projects"
+    projects.mkdir()
+    source = (FIXTURES / "golden_markdown.mdx").read_text(encoding="utf-8")
+    for i in range(12):
+        (projects / f"project-{i:02d}.mdx").write_text(source.replace("Golden", f"Golden {i}"), encoding="utf-8")
+    (projects / "broken.mdx").write_bytes(b"---\ntitle: [unclosed\n---\nbody")
+
+    serial, _, _ = collect_documents(str(tmp_path), {}, workers=1)
+    monkeypatch.setattr(builder, "PARALLEL_MIN_FILES", 2)
+    parallel, entries, _ = collect_documents(str(tmp_path), {}, workers=2)
+
+    assert parallel == serial
+    assert [doc['slug'] for doc in parallel] == [f"project-{i:02d}" for i in range(12)]
+    assert entries['broken.mdx']['document'] is None
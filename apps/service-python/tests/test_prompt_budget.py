@@ -0,0 +1,95 @@
+from unittest.mock import AsyncMock, patch
+
+from fastapi.testclient import TestClient
+
+import app.core.prompt_budget as prompt_budget
+import app.core.rag as rag_module
+from app.core.prompt_budget import SUMMARY_HEADER, count_tokens, fit_messages, prompt_tokens
+from app.main import app
+
+
+def conversation(turns: int, words: int = 80):
+    return [{'role': 'user' if i % 2 == 0 else 'assistant',
+             'content': f"turn {i} " + "about payment systems and projects " * (words // 5)}
+            for i in range(turns)]
+
+def test_estimator_tracks_word_pieces():
+    """Test the local estimator counts roughly one token per common word"""
+    sentence = "I built a FastAPI backend with Stripe payments for a restaurant booking site."
+
+    assert count_tokens("") == 0
+    assert count_tokens("Hello world") == 2
+    assert 13 <= count_tokens(sentence) <= 20
+    assert count_tokens("internationalization") > 1
+
+def test_history_under_budget_is_unchanged():
+    """Test short conversations are sent as-is"""
+    history = conversation(3, words=10)
+
+    messages, report = fit_messages("You are helpful.", history, budget=3000)
+
+    assert messages[1:] == history
+    assert report['saved_tokens'] == 0 and report['dropped_messages'] == 0
+
+def test_long_history_keeps_latest_turns_and_summarizes_older_ones():
+    """Test older turns are condensed so the prompt fits the budget"""
+    history = conversation(30)
+
+    messages, report = fit_messages("You are helpful.", history, budget=1000, summary_tokens=150)
+
+    assert messages[0]['content'] == "You are helpful."
+    assert messages[1]['content'].startswith(SUMMARY_HEADER)
+    assert messages[-1] == history[-1] and messages[-2] == history[-2]
+    assert report['final_tokens'] == prompt_tokens(messages) <= 1000
+    assert report['saved_tokens'] == report['original_tokens'] - report['final_tokens'] > 0
+    assert report['dropped_messages'] == 30 - (len(messages) - 2)
+
+def test_oversized_latest_message_keeps_its_end():
+    """Test a single message over budget is cut from the front"""
+    history = [{'role': 'user', 'content': "filler " * 2000 + "so what is the actual question?"}]
+
+    messages, report = fit_messages("sys", history, budget=200)
+
+    assert messages[-1]['content'].endswith("so what is the actual question?")
+    assert report['final_tokens'] <= 200
+
+def test_rag_context_is_capped():
+    """Test lower-ranked documents are shortened or left out of the context block"""
+    docs = [{'title': f'Project {i}', 'slug': f'p{i}', 'tech': ['Python'],
+             'snippet': "details about the implementation " * 40} for i in range(4)]
+
+    with patch.object(rag_module, 'search', return_value=docs):
+        capped = rag_module.augment_prompt_with_context("Base", "query", 4, max_tokens=300)
+        uncapped = rag_module.augment_prompt_with_context("Base", "query", 4, max_tokens=0)
+
+    assert "Project 0" in capped and "Project 3" not in capped
+    assert count_tokens(capped) <= 300 + count_tokens("Base") + 2
+    assert "Project 3" in uncapped
+
+def test_chat_reports_tokens_saved():
+    """Test the chat response reports prompt tokens and tokens saved"""
+    async def mock_stream(messages):
+        yield "ok"
+
+    with patch('app.routes.chat.get_openai_stream', side_effect=mock_stream), \
+         patch('app.routes.chat.log_analytics', new=AsyncMock()), \
+         patch.object(prompt_budget, 'CHAT_PROMPT_TOKEN_BUDGET', 1200):
+        response = TestClient(app).post("/ai/chat", json={"messages": conversation(40)})
+
+    assert response.status_code == 200
+    assert int(response.headers["X-Prompt-Tokens"]) <= 1200
+    assert int(response.headers["X-Prompt-Tokens-Saved"]) > 0
+
+def test_payload_accepts_models_and_fitted_dicts():
+    """Test request models and fit_messages' plain dicts become the same upstream messages"""
+    import warnings
+
+    from pydantic import PydanticDeprecatedSince20
+
+    from app.routes.chat import ChatMessage, build_payload
+
+    with warnings.catch_warnings():
+        warnings.simplefilter("error", PydanticDeprecatedSince20)
+        payload = build_payload([ChatMessage(role="user", content="Hi"), {"role": "assistant", "content": "Hello"}])
+
+    assert payload['messages'] == [{"role": "user", "content": "Hi"}, {"role": "assistant", "content": "Hello"}]
@@ -96,7 +96,7 @@ def test_augment_prompt_with_context():
     import app.core.rag as rag_module
     original_search = rag_module.search
 
-    def mock_search(query, k):
+    def mock_search(query, k, filters=None):
         return [
             {
                 'title': 'Test Project',
@@ -120,6 +120,30 @@ def test_augment_prompt_with_context():
     finally:
         rag_module.search = original_search
 
+def test_context_blocks_cached_per_index_version(monkeypatch):
+    """Test repeated documents reuse their rendered block until the index version changes"""
+    import app.core.rag as rag_module
+
+    results = [{'title': f"Project {i}", 'slug': f"project-{i}", 'tech': ["Stripe"],
+                'snippet': "Stripe webhooks with idempotent retries. " * 20} for i in range(3)]
+    monkeypatch.setattr(rag_module, "search", lambda query, k, filters=None: results[:k])
+    monkeypatch.setattr(rag_module.rag_index.searcher, "version", "v1")
+    rag_module._context_blocks.clear()
+
+    counted = []
+    real_count = rag_module.count_tokens
+    monkeypatch.setattr(rag_module, "count_tokens", lambda text: counted.append(text) or real_count(text))
+
+    first = augment_prompt_with_context("Base", "stripe", 3, max_tokens=200)
+    calls = len(counted)
+    assert augment_prompt_with_context("Base", "stripe", 3, max_tokens=200) == first
+    assert len(counted) == calls  # Rendered and counted once
+
+    monkeypatch.setattr(rag_module.rag_index.searcher, "version", "v2")
+    assert augment_prompt_with_context("Base", "stripe", 3, max_tokens=200) == first
+    assert len(counted) > calls
+    assert "Project 0" in first and first.count("Stripe webhooks") < 60  # Capped at 200 tokens
+
 def test_get_document_by_slug(temp_rag_index):
     """Test getting document by slug"""
     searcher = RAGSearcher(temp_rag_index)
@@ -146,3 +170,200 @@ def test_list_all_documents(temp_rag_index):
         assert 'description' in doc
         assert 'tags' in doc
         assert 'tech' in doc
+
+def _passage_documents():
+    """Long documents whose relevant passage is far from the intro"""
+    filler = " ".join(f"intro{i}" for i in range(120))
+    return [
+        {
+            "id": "long-case-study", "slug": "long-case-study", "title": "Long Case Study",
+            "description": "A long write-up", "tags": ["case-study"], "tech": ["Python"],
+            "text": f"{filler} The payment flow uses Stripe webhooks for refunds. {filler}",
+        },
+        {
+            "id": "short-project", "slug": "short-project", "title": "Short Project",
+            "description": "Analytics dashboard", "tags": ["analytics"], "tech": ["React"],
+            "text": "Dashboard with charts and realtime metrics.",
+        },
+    ]
+
+def test_split_into_passages_overlap():
+    """Test passages overlap and cover the whole text"""
+    from scripts.build_rag_index import split_into_passages
+
+    text = " ".join(f"w{i}" for i in range(100))
+    passages = split_into_passages(text, size=40, overlap=10)
+
+    assert passages[0][0] == 0
+    assert passages[-1][1] == len(text)
+    for (_, prev_end), (start, _) in zip(passages, passages[1:]):
+        assert start < prev_end  # Overlapping windows
+    assert split_into_passages("") == [(0, 0)]
+
+@pytest.mark.parametrize("mode", ["tfidf", "bm25"])
+def test_search_uses_best_passage_snippet(tmp_path, mode):
+    """Test passage scores aggregate to documents with the best passage as snippet"""
+    from scripts.build_rag_index import build_tfidf_index, save_rag_index
+
+    index_file = tmp_path / "rag.json"
+    save_rag_index(build_tfidf_index(_passage_documents()), str(index_file))
+
+    searcher = RAGSearcher(str(index_file), mode=mode)
+    assert len(searcher.passage_doc) > len(searcher.documents)
+
+    results = searcher.search("stripe webhooks refunds", k=2)
+
+    assert [doc['slug'] for doc in results] == ["long-case-study"]
+    assert "Stripe webhooks" in results[0]['snippet']
+    assert results[0]['snippet'].startswith("...")
+
+def _write_index(path, documents):
+    from scripts.build_rag_index import build_tfidf_index, save_rag_index
+    save_rag_index(build_tfidf_index(documents), str(path))
+
+def test_index_manager_hot_reload_swaps_version(tmp_path):
+    """Test reload swaps in a new index while old references keep working"""
+    from app.core.rag import RAGIndexManager
+
+    index_file = tmp_path / "rag.json"
+    _write_index(index_file, _passage_documents()[:1])
+    manager = RAGIndexManager(str(index_file), mode="tfidf")
+    old_searcher = manager.searcher
+    old_version = manager.status()['version']
+
+    _write_index(index_file, _passage_documents())
+    assert manager.reload(wait=True)
+
+    status = manager.status()
+    assert status['version'] != old_version
+    assert status['documents'] == 2
+    assert status['loaded_at'] is not None
+    # An in-flight search holding the old searcher is unaffected by the swap
+    assert len(old_searcher.documents) == 1
+    assert old_searcher.search("stripe webhooks", k=1)[0]['slug'] == "long-case-study"
+
+def test_index_manager_rejects_invalid_index(tmp_path):
+    """Test a broken build is rejected and the previous version stays active"""
+    from app.core.rag import RAGIndexManager
+
+    index_file = tmp_path / "rag.json"
+    _write_index(index_file, _passage_documents())
+    manager = RAGIndexManager(str(index_file), mode="tfidf")
+    version = manager.status()['version']
+
+    index_file.write_text("{not json")
+    manager.reload(wait=True)
+
+    assert manager.status()['version'] == version
+    assert manager.status()['last_error']
+    assert manager.searcher.search("stripe", k=1)
+
+def test_index_manager_watcher_picks_up_new_build(tmp_path):
+    """Test the file watcher reloads when the index file changes"""
+    import time
+
+    from app.core.rag import RAGIndexManager
+
+    index_file = tmp_path / "rag.json"
+    _write_index(index_file, _passage_documents()[:1])
+    manager = RAGIndexManager(str(index_file), mode="bm25")
+    manager.start_watching(0.05)
+
+    try:
+        _write_index(index_file, _passage_documents())
+        deadline = time.time() + 5
+        while manager.status()['documents'] != 2 and time.time() < deadline:
+            time.sleep(0.05)
+        assert manager.status()['documents'] == 2
+    finally:
+        manager.stop_watching()
+
+def test_index_manager_watcher_tries_a_rejected_build_once(tmp_path):
+    """Test the watcher does not reload a rejected build every interval, but picks up the next one"""
+    import time
+    from unittest.mock import patch
+
+    import app.core.rag as rag_module
+    from app.core.rag import RAGIndexManager
+
+    index_file = tmp_path / "rag.json"
+    _write_index(index_file, _passage_documents()[:1])
+    manager = RAGIndexManager(str(index_file), mode="bm25")
+    loads = []
+
+    def counting_searcher(*args, **kwargs):
+        loads.append(args)
+        return RAGSearcher(*args, **kwargs)
+
+    with patch.object(rag_module, 'RAGSearcher', side_effect=counting_searcher):
+        manager.start_watching(0.02)
+        try:
+            broken = tmp_path / "broken.json"
+            broken.write_text("{not json")
+            broken.replace(index_file)  # Lands in one step, as the builder publishes
+            time.sleep(0.5)
+            assert len(loads) == 1 and manager.status()['last_error']
+
+            _write_index(index_file, _passage_documents())
+            deadline = time.time() + 5
+            while manager.status()['documents'] != 2 and time.time() < deadline:
+                time.sleep(0.02)
+            assert manager.status()['documents'] == 2
+        finally:
+            manager.stop_watching()
+
+def _facet_documents():
+    return [
+        {"id": "shop", "slug": "shop", "title": "Shop", "description": "Online store",
+         "tags": ["ecommerce"], "tech": ["Stripe", "React"], "text": "Checkout with payments and carts."},
+        {"id": "booking", "slug": "booking", "title": "Booking", "description": "Reservations",
+         "tags": ["booking"], "tech": ["Stripe", "FastAPI"], "text": "Deposits and payments for events."},
+        {"id": "dash", "slug": "dash", "title": "Dashboard", "description": "Metrics",
+         "tags": ["analytics"], "tech": ["Python"], "text": "Payments analytics and revenue charts."},
+    ]
+
+@pytest.mark.parametrize("mode", ["tfidf", "bm25"])
+def test_search_with_facet_filters(tmp_path, mode):
+    """Test filters restrict scoring to documents matching the facets"""
+    index_file = tmp_path / "rag.json"
+    _write_index(index_file, _facet_documents())
+    searcher = RAGSearcher(str(index_file), mode=mode)
+    query = "checkout deposits revenue"  # One distinctive term per document
+
+    unfiltered = {doc['slug'] for doc in searcher.search(query, k=5)}
+    assert unfiltered == {"shop", "booking", "dash"}
+
+    stripe = {doc['slug'] for doc in searcher.search(query, k=5, filters={"tech": ["stripe"]})}
+    assert stripe == {"shop", "booking"}
+
+    both = searcher.search(query, k=5, filters={"tech": ["Stripe"], "tags": ["booking"]})
+    assert [doc['slug'] for doc in both] == ["booking"]
+
+    assert searcher.search(query, k=5, filters={"tech": ["Rust"]}) == []
+
+    # A field with no values places no constraint
+    empty = {doc['slug'] for doc in searcher.search(query, k=5, filters={"tags": [], "tech": ["stripe"]})}
+    assert empty == stripe
+    assert {doc['slug'] for doc in searcher.search(query, k=5, filters={"tags": []})} == unfiltered
+
+def test_facet_bitsets_round_trip():
+    """Test facet bitsets decode to the same document masks"""
+    from app.core.facets import build_facet_index, build_facet_masks, load_facet_masks
+
+    documents = _facet_documents() * 5  # More than one byte of bits
+    decoded = load_facet_masks(build_facet_index(documents), documents)
+    expected = build_facet_masks(documents)
+
+    assert decoded.keys() == expected.keys()
+    for field in expected:
+        for value, mask in expected[field].items():
+            assert decoded[field][value].tolist() == mask.tolist()
+
+def test_slug_index_loaded(tmp_path):
+    """Test slug lookups use the index's slug map"""
+    index_file = tmp_path / "rag.json"
+    _write_index(index_file, _facet_documents())
+    searcher = RAGSearcher(str(index_file))
+
+    assert searcher.slug_to_id == {"shop": 0, "booking": 1, "dash": 2}
+    assert searcher.get_document_by_slug("dash")['title'] == "Dashboard"
@@ -0,0 +1,77 @@
+import asyncio
+import gc
+import time
+from unittest.mock import AsyncMock, patch
+
+import httpx
+import pytest
+
+import app.core.rag as rag_module
+from app.main import app
+
+SEARCH_SECONDS = 0.15
+
+
+def slow_search(query, k, filters=None):
+    """Blocking stand-in for vectorization + numpy scoring"""
+    time.sleep(SEARCH_SECONDS)
+    return [{'title': 'Slow Project', 'slug': 'slow', 'snippet': 'Found it', 'tech': []}]
+
+async def measure_lag(stop: asyncio.Event, interval: float = 0.01) -> float:
+    """Max amount a short sleep overshoots, i.e. how long the loop was blocked"""
+    worst = 0.0
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        worst = max(worst, time.perf_counter() - started - interval)
+    return worst
+
+@pytest.mark.asyncio
+async def test_augment_async_uses_context():
+    """Test async augmentation returns the RAG context from the pool"""
+    with patch.object(rag_module, 'search', slow_search):
+        prompt = await rag_module.augment_prompt_with_context_async("Base", "query", 1, timeout=2)
+
+    assert "Slow Project" in prompt
+
+@pytest.mark.asyncio
+async def test_augment_async_deadline_falls_back_to_base_prompt():
+    """Test retrieval past its deadline returns the base prompt promptly"""
+    with patch.object(rag_module, 'search', slow_search):
+        started = time.perf_counter()
+        prompt = await rag_module.augment_prompt_with_context_async("Base", "query", 1, timeout=0.02)
+        elapsed = time.perf_counter() - started
+
+    assert prompt == "Base"
+    assert elapsed < SEARCH_SECONDS
+
+@pytest.mark.asyncio
+async def test_event_loop_lag_flat_under_concurrent_project_chats():
+    """Test concurrent projects-mode chats do not block the event loop"""
+    async def mock_stream(messages):
+        yield "ok"
+
+    gc.collect()  # Garbage left by earlier tests would otherwise be collected mid-measurement
+    transport = httpx.ASGITransport(app=app)
+    with patch.object(rag_module, 'search', slow_search), \
+         patch.object(rag_module, 'RAG_TIMEOUT_SECONDS', 5.0), \
+         patch('app.routes.chat.get_openai_stream', side_effect=mock_stream), \
+         patch('app.routes.chat.log_analytics', new=AsyncMock()):
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            stop = asyncio.Event()
+            probe = asyncio.create_task(measure_lag(stop))
+
+            responses = await asyncio.gather(*[
+                client.post("/ai/chat", json={
+                    "messages": [{"role": "user", "content": f"project question {i}"}],
+                    "mode": "projects"
+                })
+                for i in range(8)
+            ])
+
+            stop.set()
+            lag = await probe
+
+    assert all(r.status_code == 200 for r in responses)
+    # Eight blocking searches inline would stall the loop for 8 * SEARCH_SECONDS
+    assert lag < SEARCH_SECONDS / 2
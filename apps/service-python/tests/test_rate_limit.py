@@ -0,0 +1,262 @@
+import copy
+import json
+import random
+import time
+from unittest.mock import AsyncMock, patch
+
+import httpx
+import pytest
+from fastapi import Depends, FastAPI
+from fastapi.testclient import TestClient
+
+import app.core.kv as kv_module
+from app.core.rate_limit import (
+    RateLimit,
+    RateLimiter,
+    SharedRateLimiter,
+    SlidingWindowCounter,
+    TokenBucket,
+    create_limiter,
+)
+from app.main import app
+
+
+class FakeKV:
+    """KV counters shared by limiters standing in for separate workers"""
+
+    def __init__(self):
+        self.enabled = True
+        self.available = True
+        self.data = {}
+        self.calls = 0
+
+    async def incr_ex(self, key, by, ex):
+        self.calls += 1
+        if not self.available:
+            return None
+        self.data[key] = self.data.get(key, 0) + by
+        return self.data[key]
+
+
+def test_sliding_window_allows_limit_then_slides():
+    """Test the limit holds within a window and the previous window's share decays"""
+    limiter = SlidingWindowCounter(limit=3, window=10)
+    assert [limiter.hit("ip", now=t).allowed for t in (0, 1, 2, 3)] == [True, True, True, False]
+    assert limiter.hit("ip", now=3).remaining == 0
+
+    # At 15 s half of the previous window still counts: 3 * 0.5 = 1.5, room for one more
+    assert limiter.hit("ip", now=15).allowed
+    assert not limiter.hit("ip", now=15.1).allowed
+    assert limiter.hit("ip", now=30).remaining == 2  # Two windows later the key is fresh
+
+def test_token_bucket_bursts_then_refills():
+    """Test a full bucket allows a burst, then one request per limit/window seconds"""
+    limiter = TokenBucket(limit=4, window=8)  # One token every 2 s
+    assert all(limiter.hit("ip", now=0).allowed for _ in range(4))
+    refused = limiter.hit("ip", now=0)
+    assert not refused.allowed and refused.retry_after == pytest.approx(2.0)
+    assert limiter.hit("ip", now=2.01).allowed
+    assert not limiter.hit("ip", now=2.02).allowed
+
+@pytest.mark.parametrize("algorithm", ["sliding_window", "token_bucket"])
+def test_retry_after_is_exact(algorithm):
+    """Test a refused request is refused just before Retry-After and allowed just after it"""
+    rng = random.Random(7)
+    limiter = create_limiter(algorithm, limit=5, window=10)
+    now = 0.0
+    refusals = 0
+    for _ in range(300):
+        now += rng.expovariate(1.0)
+        decision = limiter.hit("ip", now=now)
+        if decision.allowed:
+            continue
+        refusals += 1
+        early, late = copy.deepcopy(limiter), copy.deepcopy(limiter)
+        assert not early.hit("ip", now=now + decision.retry_after - 0.01).allowed
+        assert late.hit("ip", now=now + decision.retry_after + 0.01).allowed
+    assert refusals > 10
+
+@pytest.mark.parametrize("algorithm", ["sliding_window", "token_bucket"])
+def test_table_stays_bounded(algorithm):
+    """Test distinct keys never grow the table past max_keys, and idle keys go first"""
+    limiter = create_limiter(algorithm, limit=5, window=10, max_keys=100)
+    for i in range(1000):
+        limiter.hit(f"10.0.{i // 256}.{i % 256}", now=0)
+    assert len(limiter) == 100
+    assert limiter.evicted_active == 900
+
+    for i in range(50):
+        limiter.hit(f"192.168.0.{i}", now=100)  # Everything older is idle by now
+    assert len(limiter) == 50  # Each new key purged two idle ones
+    assert limiter.evicted_idle == 100 and limiter.evicted_active == 900
+
+def test_limiter_base_is_abstract():
+    """Test a limiter missing the per-key hooks cannot be created"""
+    with pytest.raises(TypeError):
+        RateLimiter(limit=5, window=10)
+
+@pytest.mark.parametrize("algorithm", ["sliding_window", "token_bucket"])
+def test_zero_limit_disables(algorithm):
+    """Test a limit of 0 allows everything without keys or headers, and negative limits are rejected"""
+    limiter = create_limiter(algorithm, limit=0, window=60)
+    decisions = [limiter.hit("ip", now=0) for _ in range(100)]
+    assert all(d.allowed and d.headers() == {} for d in decisions)
+    assert len(limiter) == 0
+
+    shared = SharedRateLimiter(create_limiter(algorithm, limit=0, window=60), "test")
+    with patch('app.core.rate_limit.kv', FakeKV()):
+        assert all(shared.hit("ip").allowed for _ in range(100))
+
+    with pytest.raises(ValueError):
+        create_limiter(algorithm, limit=-1, window=60)
+
+def test_local_limiter_ignores_wall_clock_steps():
+    """Test the default clock is monotonic, so a system clock step does not reset counts"""
+    limiter = SharedRateLimiter(SlidingWindowCounter(limit=2, window=60), "test")
+    kv = FakeKV()
+    kv.enabled = False
+    with patch('app.core.rate_limit.kv', kv), \
+         patch('app.core.rate_limit.time.time', side_effect=[1e9, 1e9 + 3600, 1e9 + 7200]):
+        assert [limiter.hit("ip").allowed for _ in range(3)] == [True, True, False]
+
+def test_chat_returns_429_with_rate_limit_headers():
+    """Test /ai/chat reports its allowance and refuses with Retry-After once it is used up"""
+    async def mock_stream(messages):
+        yield "ok"
+
+    body = {"messages": [{"role": "user", "content": "Hi"}], "mode": "projects"}
+    with patch('app.routes.chat.chat_rate_limit', RateLimit(SlidingWindowCounter(limit=2, window=60))), \
+         patch('app.routes.chat.get_openai_stream', side_effect=mock_stream), \
+         patch('app.routes.chat.log_analytics', new=AsyncMock()):
+        client = TestClient(app)
+        responses = [client.post("/ai/chat", json=body) for _ in range(3)]
+
+    assert [r.status_code for r in responses] == [200, 200, 429]
+    assert [r.headers["X-RateLimit-Remaining"] for r in responses] == ["1", "0", "0"]
+    assert responses[0].headers["X-RateLimit-Limit"] == "2"
+    # The previous window's count is assumed spread evenly, so a burst can take up to two windows to clear
+    assert 1 <= int(responses[2].headers["Retry-After"]) <= 120
+
+def test_rate_limit_dependency_on_any_route():
+    """Test the dependency form limits a plain route and sets its headers"""
+    demo = FastAPI()
+
+    @demo.get("/ping", dependencies=[Depends(RateLimit(TokenBucket(limit=1, window=60)))])
+    async def ping():
+        return {"ok": True}
+
+    client = TestClient(demo)
+    first, second = client.get("/ping"), client.get("/ping")
+    assert first.status_code == 200 and first.headers["X-RateLimit-Remaining"] == "0"
+    assert second.status_code == 429 and second.headers["Retry-After"] == "60"
+
+@pytest.mark.asyncio
+async def test_shared_limit_holds_across_workers():
+    """Test workers sharing KV enforce one limit between them, with one KV write per key per sync"""
+    fake = FakeKV()
+    now = time.time() // 600 * 600 + 1  # Start of a window, so the previous one does not count
+    with patch('app.core.rate_limit.kv', fake):
+        workers = [SharedRateLimiter(SlidingWindowCounter(limit=10, window=600), "chat", interval=60)
+                   for _ in range(3)]
+        allowed = 0
+        for round_ in range(10):
+            for worker in workers:
+                allowed += sum(worker.hit("ip", now=now + round_).allowed for _ in range(2))
+            for worker in workers:
+                await worker.sync(now=now + round_)
+        for worker in workers:
+            await worker.close()
+
+    # Every worker alone would allow 10 (30 in total); at most one sync interval of overshoot
+    assert 10 <= allowed <= 16
+    assert sum(fake.data.values()) == allowed
+    assert fake.calls == sum(worker.writes for worker in workers) <= 3 * 10
+
+@pytest.mark.asyncio
+async def test_shared_limit_falls_back_to_local_when_kv_fails(monkeypatch):
+    """Test a failed sync keeps the counts, decides locally and tries KV again later"""
+    fake = FakeKV()
+    fake.available = False
+    now = time.time()
+    with patch('app.core.rate_limit.kv', fake):
+        limiter = SharedRateLimiter(TokenBucket(limit=3, window=60), "chat", interval=60, retry=30)
+        assert all(limiter.hit("ip", now=now).allowed for _ in range(2))
+        await limiter.sync(now=now)
+        assert not limiter.status()['shared']['kv'] and limiter.status()['shared']['failures'] == 1
+
+        # The local limit still applies, and KV is left alone until the retry delay passes
+        assert limiter.hit("ip", now=now).allowed
+        assert not limiter.hit("ip", now=now).allowed
+        await limiter.sync(now=now)
+        assert fake.calls == 1
+
+        fake.available = True
+        monotonic = time.monotonic()
+        monkeypatch.setattr('app.core.rate_limit.time.monotonic', lambda: monotonic + 31)
+        assert limiter.status()['shared']['kv']
+        await limiter.sync(now=now)
+
+    assert sum(fake.data.values()) == 2  # Requests counted before the failure reached KV after all
+
+@pytest.mark.asyncio
+async def test_shared_sync_writes_busiest_keys_first():
+    """Test a sync writes at most `batch` keys, the busiest first, and keeps the rest pending"""
+    fake = FakeKV()
+    now = time.time()
+    with patch('app.core.rate_limit.kv', fake):
+        limiter = SharedRateLimiter(SlidingWindowCounter(limit=100, window=600), "chat", interval=60, batch=2)
+        for ip, count in (("a", 1), ("b", 5), ("c", 3)):
+            for _ in range(count):
+                limiter.hit(ip, now=now)
+        await limiter.sync(now=now)
+        assert sorted(key.split(":")[2] for key in fake.data) == ["b", "c"]
+        assert limiter.status()['shared']['pending_keys'] == 1
+        await limiter.close()
+
+    assert len(fake.data) == 3
+
+@pytest.mark.asyncio
+async def test_kv_incr_ex_sets_expiry_once(monkeypatch):
+    """Test the increment and its expiry go to KV as one transaction, and only a new key gets a TTL"""
+    values, ttls, bodies = {}, {}, []
+
+    def backend(request: httpx.Request) -> httpx.Response:
+        assert request.url.path == "/multi-exec"
+        commands = json.loads(request.content)
+        bodies.append(commands)
+        results = []
+        for command, key, *args in commands:
+            if command == "INCRBY":
+                values[key] = values.get(key, 0) + int(args[0])
+                results.append({"result": values[key]})
+            elif command == "EXPIRE":
+                fresh = args[1:] == ["NX"] and key not in ttls
+                if fresh:
+                    ttls[key] = int(args[0])
+                results.append({"result": int(fresh)})
+        return httpx.Response(200, json=results)
+
+    real_client = httpx.AsyncClient
+    monkeypatch.setattr(kv_module.httpx, "AsyncClient",
+                        lambda: real_client(transport=httpx.MockTransport(backend)))
+    monkeypatch.setenv("KV_REST_API_URL", "https://kv.test")
+    monkeypatch.setenv("KV_REST_API_TOKEN", "token")
+    client = kv_module.KVClient()
+
+    assert await client.incr_ex("ratelimit:chat:ip:1", 3, 1200) == 3
+    ttls["ratelimit:chat:ip:1"] -= 100  # Time passes; a later increment must not extend the expiry
+    assert await client.incr_ex("ratelimit:chat:ip:1", 2, 1200) == 5
+
+    assert ttls == {"ratelimit:chat:ip:1": 1100}
+    assert bodies[0] == [["INCRBY", "ratelimit:chat:ip:1", "3"], ["EXPIRE", "ratelimit:chat:ip:1", "1200", "NX"]]
+
+@pytest.mark.asyncio
+async def test_kv_incr_ex_reports_failure(monkeypatch):
+    """Test an unreachable or failing KV gives None rather than a made-up count"""
+    real_client = httpx.AsyncClient
+    monkeypatch.setattr(kv_module.httpx, "AsyncClient", lambda: real_client(
+        transport=httpx.MockTransport(lambda request: httpx.Response(200, json=[{"error": "WRONGTYPE"}, {"result": 0}]))))
+    monkeypatch.setenv("KV_REST_API_URL", "https://kv.test")
+    monkeypatch.setenv("KV_REST_API_TOKEN", "token")
+
+    assert await kv_module.KVClient().incr_ex("ratelimit:chat:ip:1", 1, 1200) is None
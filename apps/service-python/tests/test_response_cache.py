@@ -0,0 +1,121 @@
+import asyncio
+import json
+from unittest.mock import AsyncMock, patch
+
+import httpx
+import pytest
+
+import app.core.response_cache as cache_module
+from app.core.response_cache import Flight, ResponseCache, cache_key, response_cache
+from app.main import app
+
+PARAMS = {"model": "gpt-3.5-turbo", "temperature": 0.7, "max_tokens": 2048}
+
+
+def question(text: str):
+    return [{'role': 'system', 'content': "You are helpful."}, {'role': 'user', 'content': text}]
+
+async def collect(stream):
+    return [token async for token in stream]
+
+def test_key_normalizes_whitespace_only():
+    """Test whitespace-only differences share a key, while case, mode and params do not"""
+    key = cache_key("general", question("What projects  have you built?"), PARAMS)
+
+    assert key == cache_key("general", question(" What projects have you built? "), PARAMS)
+    assert key != cache_key("general", question("what projects have you built?"), PARAMS)
+    assert key != cache_key("resume", question("What projects have you built?"), PARAMS)
+    assert key != cache_key("general", question("What projects have you built?"), {**PARAMS, "temperature": 0})
+
+def test_lru_eviction_and_ttl_expiry():
+    """Test the least recently used entry is evicted and stale entries expire"""
+    cache = ResponseCache(max_entries=2, ttl=60, path=None)
+    cache.put("a", ["1"])
+    cache.put("b", ["2"])
+    cache.get("a")
+    cache.put("c", ["3"])
+
+    assert cache.get("b") is None and cache.get("a") == ["1"]
+    with patch.object(cache_module.time, 'time', return_value=cache_module.time.time() + 61):
+        assert cache.get("a") is None
+
+def test_cache_persists_across_instances(tmp_path):
+    """Test saved entries are loaded back by a new cache"""
+    path = tmp_path / "chat_cache.json"
+    first = ResponseCache(max_entries=8, ttl=3600, path=str(path))
+    first.put("k", ["Hello", " there"])
+    first.save()
+
+    second = ResponseCache(max_entries=8, ttl=3600, path=str(path))
+    second.load()
+
+    assert second.get("k") == ["Hello", " there"]
+
+@pytest.mark.asyncio
+async def test_flight_cancelled_when_every_listener_leaves():
+    """Test the shared generation stops once no request is following it"""
+    cache = ResponseCache(max_entries=8, ttl=60, path=None)
+    cancelled = asyncio.Event()
+
+    async def endless():
+        try:
+            while True:
+                yield "x"
+                await asyncio.sleep(0.01)
+        finally:
+            cancelled.set()
+
+    stream = cache.stream("k", endless)
+    assert await stream.__anext__() == "x"
+    await stream.aclose()
+
+    await asyncio.wait_for(cancelled.wait(), 1)
+    assert cache.status()['in_flight'] == 0 and cache.get("k") is None
+
+@pytest.mark.asyncio
+async def test_cancelled_flight_task_ends_cancelled():
+    """Test cancelling a flight still cleans up but leaves its task cancelled, not finished"""
+    closed = []
+
+    async def endless():
+        while True:
+            yield "x"
+            await asyncio.sleep(0.01)
+
+    flight = Flight(endless(), on_complete=lambda tokens: None, on_close=lambda: closed.append(True))
+    await asyncio.sleep(0.02)
+    flight.task.cancel()
+    await asyncio.wait((flight.task,))
+
+    assert flight.task.cancelled()
+    assert flight.done and closed == [True]
+    assert isinstance(flight.error, ConnectionAbortedError)
+
+@pytest.mark.asyncio
+async def test_identical_requests_share_one_generation_then_hit_cache():
+    """Test concurrent identical chats make one upstream call and a repeat is replayed"""
+    calls = 0
+
+    async def mock_stream(messages):
+        nonlocal calls
+        calls += 1
+        for token in ["Hello", " there", "!"]:
+            await asyncio.sleep(0.01)
+            yield token
+
+    body = {"messages": [{"role": "user", "content": "What projects have you built?"}]}
+    transport = httpx.ASGITransport(app=app)
+    with patch('app.routes.chat.get_openai_stream', side_effect=mock_stream), \
+         patch('app.routes.chat.log_analytics', new=AsyncMock()):
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            concurrent = await asyncio.gather(*[client.post("/ai/chat", json=body) for _ in range(3)])
+            repeat = await client.post("/ai/chat", json=body)
+            projects = await client.post("/ai/chat", json={**body, "mode": "projects"})
+
+    for response in concurrent + [repeat, projects]:
+        events = [json.loads(line[6:]) for line in response.text.splitlines() if line.startswith("data: ")]
+        assert "".join(e.get('token', '') for e in events) == "Hello there!"
+        assert events[-1] == {'done': True}
+    assert calls == 2  # One shared generation, plus the uncached projects-mode request
+    assert response_cache.status()['hits'] == 1
+    assert response_cache.status()['coalesced'] == 2
@@ -0,0 +1,125 @@
+import subprocess
+import sys
+from pathlib import Path
+from unittest.mock import patch
+
+import numpy as np
+
+import app.core.rag as rag_module
+from app.core.index_file import load_index_data
+from app.core.rag import BUNDLE_FORMAT, RAGSearcher
+from app.core.shared_index import open_bundle, write_bundle
+
+SERVICE_ROOT = Path(__file__).resolve().parent.parent
+
+
+def _build_index(index_file, first_title="Project 0"):
+    from scripts.build_rag_index import build_tfidf_index, save_rag_index
+
+    documents = [
+        {"id": f"doc-{i}", "slug": f"doc-{i}", "title": first_title if i == 0 else f"Project {i}", "description": "",
+         "tags": [], "tech": [], "text": text}
+        for i, text in enumerate([
+            "Stripe checkout with refunds and invoices.",
+            "Booking calendar with reminders.",
+            "Analytics dashboard with charts.",
+        ])
+    ]
+    save_rag_index(build_tfidf_index(documents), str(index_file))
+
+def test_bundle_round_trip_is_read_only(tmp_path):
+    """Test bundles map back to identical, read-only arrays"""
+    path = tmp_path / "test.arrays"
+    arrays = {
+        'ints': np.arange(10, dtype=np.int32),
+        'floats': np.linspace(0, 1, 7, dtype=np.float32).reshape(7, 1),
+        'empty': np.zeros(0, dtype=np.int64),
+    }
+    write_bundle(path, arrays, {'terms': ['a', 'b']})
+
+    mapped, meta = open_bundle(path)
+
+    assert meta == {'terms': ['a', 'b']}
+    for name, array in arrays.items():
+        assert np.array_equal(mapped[name], array)
+        assert mapped[name].dtype == array.dtype
+    assert not mapped['ints'].flags.writeable
+
+def test_second_searcher_attaches_to_shared_arrays(tmp_path):
+    """Test the first loader publishes the bundle and later loaders map it"""
+    index_file = tmp_path / "rag.idx"
+    _build_index(index_file)
+
+    first = RAGSearcher(str(index_file), mode="bm25")
+    second = RAGSearcher(str(index_file), mode="bm25")
+
+    assert first.shared_bundle['attached'] is False
+    assert second.shared_bundle['attached'] is True
+    assert second.shared_bundle['path'] == first.shared_bundle['path']
+    assert not second.bm25.impacts.flags.writeable
+    assert first.search("stripe refunds", k=1)[0]['slug'] == second.search("stripe refunds", k=1)[0]['slug']
+
+def test_tfidf_matrix_served_from_shared_mapping(tmp_path):
+    """Test the TF-IDF matrix wraps the mapped arrays without copying"""
+    index_file = tmp_path / "rag.idx"
+    _build_index(index_file)
+
+    searcher = RAGSearcher(str(index_file), mode="tfidf")
+
+    assert not searcher.doc_vectors.data.flags.writeable
+    assert searcher.search("analytics charts", k=1)[0]['slug'] == "doc-2"
+
+def test_worker_process_attaches(tmp_path):
+    """Test a separate worker process attaches instead of rebuilding"""
+    index_file = tmp_path / "rag.idx"
+    _build_index(index_file)
+    RAGSearcher(str(index_file), mode="tfidf")
+
+    script = (
+        "import sys; from app.core.rag import RAGSearcher; "
+        f"s = RAGSearcher({str(index_file)!r}, mode='tfidf'); "
+        "sys.stdout.write('ATTACHED=%s' % s.shared_bundle['attached'])"
+    )
+    result = subprocess.run([sys.executable, "-c", script], cwd=SERVICE_ROOT,
+                            capture_output=True, text=True, timeout=60)
+
+    assert "ATTACHED=True" in result.stdout, result.stderr
+
+def test_new_version_prunes_stale_bundle(tmp_path):
+    """Test publishing a new index version removes the previous bundle"""
+    index_file = tmp_path / "rag.idx"
+    _build_index(index_file)
+    old = Path(RAGSearcher(str(index_file), mode="tfidf").shared_bundle['path'])
+
+    _build_index(index_file, first_title="Project Zero")
+    new = Path(RAGSearcher(str(index_file), mode="tfidf").shared_bundle['path'])
+
+    assert new != old
+    assert new.exists()
+    assert not old.exists()
+
+def test_attaching_process_decodes_only_its_own_sections(tmp_path):
+    """Test a process that finds the bundle never decodes the array sections"""
+    index_file = tmp_path / "rag.idx"
+    _build_index(index_file)
+    first = RAGSearcher(str(index_file), mode="tfidf")
+    assert f".v{BUNDLE_FORMAT}-" in Path(first.shared_bundle['path']).name
+
+    with patch.object(rag_module, 'load_index_data', side_effect=load_index_data) as decode:
+        second = RAGSearcher(str(index_file), mode="tfidf")
+
+    assert second.shared_bundle['attached'] is True
+    assert [c.kwargs.get('sections') for c in decode.call_args_list] == [rag_module.PER_PROCESS_SECTIONS]
+    assert second.search("stripe refunds", k=1)[0]['slug'] == "doc-0"
+
+def test_bundle_from_older_format_is_not_reused(tmp_path, monkeypatch):
+    """Test a bundle written for the same index by another bundle format is rebuilt"""
+    index_file = tmp_path / "rag.idx"
+    _build_index(index_file)
+    old = Path(RAGSearcher(str(index_file), mode="tfidf").shared_bundle['path'])
+
+    monkeypatch.setattr(rag_module, 'BUNDLE_FORMAT', BUNDLE_FORMAT + 1)
+    searcher = RAGSearcher(str(index_file), mode="tfidf")
+
+    assert searcher.shared_bundle['attached'] is False
+    assert not old.exists()
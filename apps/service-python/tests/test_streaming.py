@@ -0,0 +1,179 @@
+import asyncio
+import json
+import time
+from unittest.mock import AsyncMock, patch
+
+import httpx
+import pytest
+
+import app.core.streaming as streaming
+from app.core.streaming import SSEPassthrough, coalesce_tokens
+from app.main import app
+from scripts.mock_upstream import MockUpstream
+
+
+async def paced(tokens, delay: float = 0.0, error: Exception = None):
+    for token in tokens:
+        if delay:
+            await asyncio.sleep(delay)
+        yield token
+    if error is not None:
+        raise error
+
+async def timed_batches(stream):
+    started = time.perf_counter()
+    return [(batch, time.perf_counter() - started) async for batch in stream]
+
+@pytest.mark.asyncio
+async def test_first_token_alone_then_batched():
+    """Test the first token is sent immediately and the rest share frames"""
+    batches = await timed_batches(coalesce_tokens(paced(list("abcdefghij"), delay=0.005), interval=0.05))
+
+    assert batches[0][0] == ["a"]
+    assert batches[0][1] < 0.03
+    assert "".join("".join(batch) for batch, _ in batches) == "abcdefghij"
+    assert len(batches) < 6
+
+@pytest.mark.asyncio
+async def test_batch_flushes_on_deadline_when_upstream_stalls():
+    """Test a partial batch is not held back waiting for the next token"""
+    async def stalling():
+        yield "a"
+        yield "b"
+        await asyncio.sleep(0.3)
+        yield "c"
+
+    batches = await timed_batches(coalesce_tokens(stalling(), interval=0.05))
+
+    assert [batch for batch, _ in batches] == [["a"], ["b"], ["c"]]
+    assert batches[1][1] < 0.2
+
+@pytest.mark.asyncio
+async def test_byte_threshold_flushes_early():
+    """Test a batch is flushed as soon as it reaches max_bytes"""
+    batches = [b async for b in coalesce_tokens(paced(["x"] + ["12345"] * 4), interval=10, max_bytes=10)]
+
+    assert batches == [["x"], ["12345", "12345"], ["12345", "12345"]]
+
+@pytest.mark.asyncio
+async def test_upstream_error_raised_after_buffered_tokens():
+    """Test tokens received before an upstream error are still delivered"""
+    received = []
+    with pytest.raises(RuntimeError):
+        async for batch in coalesce_tokens(paced(["a", "b", "c"], error=RuntimeError("boom")), interval=1):
+            received.extend(batch)
+
+    assert received == ["a", "b", "c"]
+
+@pytest.mark.asyncio
+async def test_chat_stream_frames_carry_joined_tokens():
+    """Test coalesced frames keep the {"token": ...} format and token counts"""
+    async def mock_stream(messages):
+        for token in ["Hello", " there", "!"]:
+            yield token
+
+    log = AsyncMock()
+    transport = httpx.ASGITransport(app=app)
+    with patch('app.routes.chat.get_openai_stream', side_effect=mock_stream), \
+         patch('app.routes.chat.log_analytics', new=log):
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            response = await client.post("/ai/chat", json={"messages": [{"role": "user", "content": "Hi"}]})
+
+    events = [json.loads(line[6:]) for line in response.text.splitlines() if line.startswith("data: ")]
+    assert "".join(e.get('token', '') for e in events) == "Hello there!"
+    assert events[0] == {'token': "Hello"}
+    assert events[-1] == {'done': True}
+    log.assert_any_await(token_count=3)
+
+def test_passthrough_scanner_forwards_complete_events_until_done():
+    """Test partial events are held back and nothing after [DONE] is forwarded"""
+    scanner = SSEPassthrough()
+
+    first = scanner.feed(b'data: {"choices":[{"delta":{"content":"Hi"}}],"usage":null}\n\ndata: {"cho')
+    rest = scanner.feed(b'ices":[],"usage":{"completion_tokens":5}}\n\ndata: [DONE]\n\ndata: late\n\n')
+
+    assert first == b'data: {"choices":[{"delta":{"content":"Hi"}}],"usage":null}\n\n'
+    assert rest.endswith(b'data: [DONE]\n\n') and b'late' not in rest
+    assert scanner.done and scanner.feed(b'data: more\n\n') == b''
+    assert scanner.token_count == 5
+
+def test_passthrough_scanner_reports_upstream_error_event():
+    """Test an in-stream error event is detected and still forwarded"""
+    scanner = SSEPassthrough()
+
+    forwarded = scanner.feed(b'data: {"error":{"message":"overloaded"}}\n\n')
+
+    assert b'overloaded' in forwarded
+    assert scanner.error == "overloaded"
+    assert scanner.token_count == 1
+
+@pytest.mark.asyncio
+async def test_chat_passthrough_forwards_upstream_events(monkeypatch):
+    """Test passthrough mode relays the upstream's OpenAI events and logs usage tokens"""
+    log = AsyncMock()
+    transport = httpx.ASGITransport(app=app)
+    async with MockUpstream() as mock:
+        monkeypatch.setenv("OPENAI_BASE_URL", mock.url)
+        monkeypatch.setenv("OPENAI_API_KEY", "test-key")
+        with patch.object(streaming, 'CHAT_STREAM_MODE', "passthrough"), \
+             patch('app.routes.chat.log_analytics', new=log):
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                response = await client.post("/ai/chat", json={"messages": [{"role": "user", "content": "Hi"}]})
+
+    events = [line[6:] for line in response.text.splitlines() if line.startswith("data: ")]
+    assert events[-1] == "[DONE]"
+    deltas = [json.loads(e)['choices'][0]['delta']['content'] for e in events[:-1] if json.loads(e)['choices']]
+    assert "".join(deltas) == "Hello from the mock upstream."
+    log.assert_any_await(token_count=len(mock.tokens))
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("spec_version", ["2.3", "2.4"])
+async def test_client_disconnect_cancels_upstream_within_one_frame(spec_version):
+    """Test the upstream stream is closed promptly when the client leaves mid-answer"""
+    gone = asyncio.Event()
+    timings = {}
+
+    async def endless_stream(messages):
+        try:
+            while True:
+                await asyncio.sleep(0.002)
+                yield " word"
+        finally:
+            timings['upstream_closed'] = time.perf_counter()
+
+    body = json.dumps({"messages": [{"role": "user", "content": "Hi"}], "mode": "projects"}).encode()
+    scope = {"type": "http", "asgi": {"version": "3.0", "spec_version": spec_version},
+             "http_version": "1.1", "method": "POST", "scheme": "http", "path": "/ai/chat",
+             "raw_path": b"/ai/chat", "query_string": b"", "root_path": "",
+             "headers": [(b"host", b"test"), (b"content-type", b"application/json")],
+             "client": ("127.0.0.1", 5000), "server": ("test", 80)}
+    delivered = []
+
+    async def receive():
+        if not delivered and 'sent_body' not in timings:
+            timings['sent_body'] = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        await gone.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.body" and message.get("body"):
+            if gone.is_set():
+                raise OSError("client gone")
+            delivered.append(message["body"])
+            if len(delivered) == 2:
+                timings['disconnected'] = time.perf_counter()
+                gone.set()
+
+    log = AsyncMock()
+    with patch('app.routes.chat.get_openai_stream', side_effect=endless_stream), \
+         patch('app.routes.chat.log_analytics', new=log):
+        try:
+            await asyncio.wait_for(app(scope, receive, send), 2)
+        except OSError:
+            pass  # The server would drop the connection
+        await asyncio.sleep(0.01)
+
+    assert timings['upstream_closed'] - timings['disconnected'] < streaming.CHAT_COALESCE_SECONDS
+    tokens = sum(len(json.loads(frame[6:])['token'].split()) for frame in delivered)
+    log.assert_any_await(token_count=tokens)
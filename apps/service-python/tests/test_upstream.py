@@ -0,0 +1,242 @@
+import asyncio
+import socket
+import time
+from unittest.mock import patch
+
+import httpx
+import pytest
+from fastapi import HTTPException
+
+from app.core.upstream import UpstreamClient, UpstreamRouter, client_settings
+from app.routes.chat import ChatMessage, get_openai_stream
+from scripts.mock_upstream import MockUpstream
+
+MESSAGES = [ChatMessage(role="user", content="Hi")]
+
+
+@pytest.fixture
+def upstream_env(monkeypatch):
+    def configure(mock: MockUpstream):
+        monkeypatch.setenv("OPENAI_BASE_URL", mock.url)
+        monkeypatch.setenv("OPENAI_API_KEY", "test-key")
+    return configure
+
+async def collect(client: httpx.AsyncClient) -> str:
+    return "".join([token async for token in get_openai_stream(MESSAGES, client=client)])
+
+@pytest.mark.asyncio
+async def test_pooled_client_reuses_one_connection(upstream_env):
+    """Test sequential chat turns share a single keep-alive connection"""
+    async with MockUpstream() as mock:
+        upstream_env(mock)
+        pooled = UpstreamClient()
+
+        answers = [await collect(pooled.client) for _ in range(5)]
+        await pooled.close()
+
+    assert answers == ["Hello from the mock upstream."] * 5
+    assert mock.requests == 5
+    assert mock.connections == 1
+
+@pytest.mark.asyncio
+async def test_warm_opens_connection_before_first_chat(upstream_env):
+    """Test pre-warming pays the connection setup so the first turn does not"""
+    async with MockUpstream(handshake_ms=100) as mock:
+        upstream_env(mock)
+        pooled = UpstreamClient()
+
+        assert await pooled.warm(1) == 1
+        assert pooled.warm_seconds >= 0.1
+        await collect(pooled.client)
+        await pooled.close()
+
+    assert mock.connections == 1
+    assert pooled.status()['started'] is False
+
+@pytest.mark.asyncio
+async def test_read_timeout_between_chunks_maps_to_504(upstream_env, monkeypatch):
+    """Test a stalled stream hits the read timeout, not a whole-request deadline"""
+    monkeypatch.setenv("UPSTREAM_READ_TIMEOUT", "0.05")
+    async with MockUpstream(ttft_ms=300) as mock:
+        upstream_env(mock)
+        pooled = UpstreamClient()
+
+        with pytest.raises(HTTPException) as exc_info:
+            await collect(pooled.client)
+        await pooled.close()
+
+    assert exc_info.value.status_code == 504
+
+def test_client_settings_from_environment(monkeypatch):
+    """Test connect/read timeouts and pool limits are configured separately"""
+    monkeypatch.setenv("UPSTREAM_CONNECT_TIMEOUT", "2")
+    monkeypatch.setenv("UPSTREAM_READ_TIMEOUT", "30")
+    monkeypatch.setenv("UPSTREAM_MAX_CONNECTIONS", "7")
+    monkeypatch.setenv("UPSTREAM_HTTP2", "false")
+
+    settings = client_settings()
+
+    assert settings['timeout'].connect == 2.0
+    assert settings['timeout'].read == 30.0
+    assert settings['limits'].max_connections == 7
+    assert settings['http2'] is False
+
+def closed_port_url() -> str:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    return f"http://127.0.0.1:{port}/v1"
+
+@pytest.fixture
+def router(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "test-key")
+    monkeypatch.setenv("UPSTREAM_HEDGE_MS", "0")
+    router = UpstreamRouter()
+    with patch('app.routes.chat.upstream_router', router):
+        yield router
+
+@pytest.mark.asyncio
+async def test_failover_when_endpoint_unreachable(router, monkeypatch):
+    """Test a connection error moves the request to the next endpoint and cools the first down"""
+    async with MockUpstream() as mock, httpx.AsyncClient() as client:
+        down = closed_port_url()
+        monkeypatch.setenv("OPENAI_BASE_URLS", f"{down},{mock.url}")
+
+        assert await collect(client) == "Hello from the mock upstream."
+        assert [e.base_url for e in router.ranked()] == [mock.url, down]
+
+    status = {e['base_url']: e for e in router.status()}
+    assert status[down]['failures'] == 1 and status[down]['available'] is False
+    assert router.failovers == 1
+
+@pytest.mark.asyncio
+async def test_client_errors_are_not_retried(router, monkeypatch):
+    """Test a request the upstream rejects as invalid is not sent to other endpoints"""
+    hosts = []
+
+    def reject(request: httpx.Request) -> httpx.Response:
+        hosts.append(request.url.host)
+        return httpx.Response(401, text="invalid api key")
+
+    monkeypatch.setenv("OPENAI_BASE_URLS", "http://first.test/v1,http://second.test/v1")
+    async with httpx.AsyncClient(transport=httpx.MockTransport(reject)) as client:
+        with pytest.raises(HTTPException) as exc_info:
+            await collect(client)
+
+    assert exc_info.value.status_code == 401
+    assert hosts == ["first.test"]
+
+@pytest.mark.asyncio
+async def test_hedge_takes_faster_endpoint_and_cancels_slow_one(router, monkeypatch):
+    """Test a late first token starts a second endpoint, and routing then prefers it"""
+    monkeypatch.setenv("UPSTREAM_HEDGE_MS", "50")
+    async with MockUpstream(ttft_ms=1000) as slow, MockUpstream(ttft_ms=10) as fast, \
+            httpx.AsyncClient() as client:
+        monkeypatch.setenv("OPENAI_BASE_URLS", f"{slow.url},{fast.url}")
+
+        started = time.perf_counter()
+        answer = await collect(client)
+        elapsed = time.perf_counter() - started
+        await asyncio.sleep(0.05)  # The cancelled stream's connection closes
+
+        assert answer == "Hello from the mock upstream."
+        assert elapsed < 0.5
+        assert router.hedges == 1
+        assert [e.base_url for e in router.ranked()] == [fast.url, slow.url]
+
+        await collect(client)  # Fast endpoint first now, no hedge needed
+        assert router.hedges == 1 and fast.requests == 2 and slow.requests == 1
+
+@pytest.mark.asyncio
+async def test_cold_pool_connects_while_rag_runs(upstream_env, monkeypatch):
+    """Test a chat on a cold pool pays max(retrieval, connect), not their sum"""
+    import app.core.rag as rag_module
+    from app.main import app
+
+    def slow_search(query, k, filters=None):
+        time.sleep(0.2)
+        return []
+
+    async with MockUpstream(handshake_ms=200) as mock:
+        upstream_env(mock)
+        monkeypatch.delenv("OPENAI_BASE_URLS", raising=False)
+        pooled = UpstreamClient()
+        transport = httpx.ASGITransport(app=app)
+        with patch('app.routes.chat.upstream', pooled), \
+             patch.object(rag_module, 'search', slow_search):
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                started = time.perf_counter()
+                response = await client.post("/ai/chat", json={"messages": [{"role": "user", "content": "Hi"}],
+                                                                "mode": "projects"})
+                elapsed = time.perf_counter() - started
+        await pooled.close()
+
+    assert "Hello" in response.text
+    assert mock.connections == 1 and mock.requests == 1  # Connected without a probe request
+    assert elapsed < 0.35  # Sequential setup takes over 0.4s
+    assert not pooled.is_cold()
+
+@pytest.mark.asyncio
+async def test_prepare_connects_only_to_the_chosen_endpoint(router, monkeypatch):
+    """Test a cold chat opens one connection to the endpoint it will use and sends nothing on it"""
+    async with MockUpstream() as chosen, MockUpstream() as other:
+        monkeypatch.setenv("OPENAI_BASE_URLS", f"{chosen.url},{other.url}")
+        pooled = UpstreamClient()
+        with patch('app.core.upstream.upstream_router', router):
+            assert await pooled.prepare() is True
+            assert pooled.prepare() is None  # Warm now
+        assert (chosen.connections, chosen.requests, other.connections) == (1, 0, 0)
+
+        await collect(pooled.client)
+        await pooled.close()
+
+    assert (chosen.connections, chosen.requests, other.connections) == (1, 1, 0)
+
+@pytest.mark.asyncio
+async def test_hedge_loser_stays_ranked_below_winner(router, monkeypatch):
+    """Test a cancelled slow endpoint's short elapsed time is not taken as its TTFT"""
+    monkeypatch.setenv("UPSTREAM_HEDGE_MS", "75")
+    monkeypatch.setenv("OPENAI_BASE_URLS", "http://fast.test/v1,http://slow.test/v1")
+    delays = {"http://fast.test/v1": 0.085, "http://slow.test/v1": 0.25}
+
+    async def open_stream(endpoint):
+        await asyncio.sleep(delays[endpoint.base_url])
+        yield endpoint.base_url
+
+    for _ in range(4):
+        items = [item async for item in router.stream(open_stream, retryable=lambda e: False)]
+        assert items == ["http://fast.test/v1"]
+        fast, slow = router.endpoints()
+        assert [e.base_url for e in router.ranked()] == [fast.base_url, slow.base_url]
+        assert slow.ewma_ttft >= fast.ewma_ttft
+
+    assert router.hedges == 4 and slow.wins == 0
+
+@pytest.mark.asyncio
+async def test_client_from_another_loop_is_closed_when_replaced():
+    """Test switching event loops closes the client left on the old, still running loop"""
+    import threading
+
+    other = asyncio.new_event_loop()
+    thread = threading.Thread(target=other.run_forever, daemon=True)
+    thread.start()
+    try:
+        upstream_client = UpstreamClient()
+
+        async def get_client():
+            return upstream_client.client
+
+        old = asyncio.run_coroutine_threadsafe(get_client(), other).result(timeout=5)
+        new = upstream_client.client  # This test's loop
+        assert new is not old and upstream_client.client is new
+
+        for _ in range(50):
+            if old.is_closed:
+                break
+            await asyncio.sleep(0.01)
+        assert old.is_closed and not new.is_closed
+        await upstream_client.close()
+    finally:
+        other.call_soon_threadsafe(other.stop)
+        thread.join(timeout=5)
+        other.close()